@@ -0,0 +1 @@
+"""Pruebas de rendimiento de Video Descarga contra un servidor local, sin acceso a la red"""
@@ -0,0 +1,8 @@
+# benchmarks/__main__.py
+"""Permite ejecutar las pruebas de rendimiento con 'python -m benchmarks'"""
+import sys
+
+from benchmarks.run import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+# benchmarks/run.py
+"""Escenarios de rendimiento sin red y comparación con una línea base guardada"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.server import MediaServer
+from descarga.commands import DownloadOptions, build_jobs
+from descarga.engines import ENGINES
+from descarga.limits import parse_rate
+from descarga.logbuffer import LogBuffer
+from descarga.scheduler import COMPLETADO, JobScheduler
+from descarga.tools import lookup_tool, probe_tool
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GUI_SCRIPT = os.path.join(ROOT_DIR, 'video_descarga.py')
+
+# Tolerancia por defecto antes de considerar un cambio como regresión
+DEFAULT_TOLERANCE = 0.10
+
+# Tamaños de cada escenario (normal, --rapido)
+SIZES = {
+    'lote': {'urls': (8, 4), 'bytes': (16_000_000, 4_000_000)},
+    'sobrecoste': {'urls': (24, 8), 'bytes': (32_000, 32_000)},
+    'hls': {'segments': (120, 30), 'bytes': (256_000, 128_000)},
+    'log': {'lines': (200_000, 50_000)},
+    'arranque': {'warm_runs': (5, 2)},
+}
+
+
+class Metric:
+    """Un resultado con su unidad y si es mejor cuanto más alto o cuanto más bajo"""
+
+    def __init__(self, value, unit, higher_is_better):
+        self.value = value
+        self.unit = unit
+        self.higher_is_better = higher_is_better
+
+    def as_dict(self):
+        return {'value': self.value, 'unit': self.unit, 'higher_is_better': self.higher_is_better}
+
+
+def _size(scenario, key, quick):
+    return SIZES[scenario][key][1 if quick else 0]
+
+
+def _run_batch(urls, engine_name, workers, output_dir):
+    """Descarga las URLs con el planificador; devuelve (segundos, bytes, trabajos fallidos)"""
+    options = DownloadOptions(ytdlp_path=lookup_tool('yt-dlp').path, output_dir=output_dir,
+                              format='best', quality='worst')
+    jobs = build_jobs(urls, options)
+    engine = ENGINES[engine_name]()
+    scheduler = JobScheduler(jobs, max_workers=workers, max_per_host=workers, engine=engine)
+    start = time.perf_counter()
+    try:
+        scheduler.run()
+    finally:
+        if hasattr(engine, 'close'):
+            engine.close()
+    seconds = time.perf_counter() - start
+    downloaded = sum(job.bytes.downloaded_bytes for job in jobs)
+    failed = [job for job in jobs if job.state != COMPLETADO]
+    return seconds, downloaded, failed
+
+
+def _check(failed):
+    if failed:
+        job = failed[0]
+        detail = job.log[-1] if job.log else job.error
+        raise RuntimeError(f"{len(failed)} descarga(s) fallaron; la primera: {detail}")
+
+
+def bench_batch(server, engine, quick, workers):
+    """Lote de MP4 progresivos: rendimiento de extremo a extremo"""
+    count, size = _size('lote', 'urls', quick), _size('lote', 'bytes', quick)
+    urls = [server.mp4_url(f"lote{i}", size) for i in range(count)]
+    with tempfile.TemporaryDirectory(prefix='vd-bench-') as directory:
+        seconds, downloaded, failed = _run_batch(urls, engine, workers, directory)
+    _check(failed)
+    return {
+        'segundos': Metric(round(seconds, 3), 's', False),
+        'mb_por_segundo': Metric(round(downloaded / seconds / 1e6, 2), 'MB/s', True),
+    }
+
+
+def bench_overhead(server, engine, quick, workers):
+    """Muchos archivos diminutos: el tiempo por URL es casi todo sobrecoste (arranque, extracción)"""
+    count, size = _size('sobrecoste', 'urls', quick), _size('sobrecoste', 'bytes', quick)
+    urls = [server.mp4_url(f"mini{i}", size) for i in range(count)]
+    with tempfile.TemporaryDirectory(prefix='vd-bench-') as directory:
+        seconds, _, failed = _run_batch(urls, engine, workers, directory)
+    _check(failed)
+    return {
+        'ms_por_url': Metric(round(seconds / count * 1000, 1), 'ms', False),
+        'ms_por_url_y_hueco': Metric(round(seconds / count * workers * 1000, 1), 'ms', False),
+    }
+
+
+def bench_hls(server, engine, quick, workers):
+    """Un video HLS por fragmentos (como un Vimeo embebido)"""
+    segments, size = _size('hls', 'segments', quick), _size('hls', 'bytes', quick)
+    urls = [server.hls_url('clase', segments, size)]
+    with tempfile.TemporaryDirectory(prefix='vd-bench-') as directory:
+        seconds, downloaded, failed = _run_batch(urls, engine, workers, directory)
+    _check(failed)
+    return {
+        'segundos': Metric(round(seconds, 3), 's', False),
+        'mb_por_segundo': Metric(round(downloaded / seconds / 1e6, 2), 'MB/s', True),
+    }
+
+
+def _qt_window():
+    """MainWindow sin pantalla (QT_QPA_PLATFORM=offscreen), o None sin PyQt5"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        return None
+    sys.path.insert(0, ROOT_DIR)
+    import video_descarga
+    app = QApplication.instance() or QApplication([])
+    return app, video_descarga.MainWindow()
+
+
+def bench_log_drain(quick, workers):
+    """Líneas por segundo que llegan a la terminal con varios trabajos escribiendo a la vez.
+
+    Con PyQt5 se vacía la terminal real de la ventana (drain_log); sin él,
+    solo el búfer de log, y el resultado lo indica.
+    """
+    lines = _size('log', 'lines', quick)
+    qt = _qt_window()
+    buffer = qt[1].log_buffer if qt else LogBuffer()
+    per_writer = lines // workers
+    done = threading.Event()
+
+    def writer(number):
+        for i in range(per_writer):
+            if i % 4:
+                buffer.write(f"[{number}] [download] {i * 100 / per_writer:5.1f}% de 100.0 MB", key=number)
+            else:
+                buffer.write(f"[{number}] [hlsnative] línea de log {i}")
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    drains = 0
+
+    def waiter():
+        for thread in threads:
+            thread.join()
+        done.set()
+
+    threading.Thread(target=waiter, daemon=True).start()
+    while True:
+        finished = done.is_set()
+        if qt:
+            qt[1].drain_log()
+            qt[0].processEvents()
+        else:
+            buffer.drain()
+        drains += 1
+        if finished:
+            break
+        time.sleep(0.005)
+    seconds = time.perf_counter() - start
+    return {
+        'lineas_por_segundo': Metric(round(per_writer * workers / seconds), 'líneas/s', True),
+        'vaciados': Metric(drains, 'vaciados', False),
+        'con_qt': Metric(bool(qt), '', True),
+    }
+
+
+def bench_startup(quick):
+    """Arranque de video_descarga.py hasta la ventana visible, en frío y con caché caliente"""
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+
+    def measure(*extra):
+        result = subprocess.run([sys.executable, GUI_SCRIPT, '--medir-arranque', *extra],
+                                capture_output=True, text=True, env=env, cwd=ROOT_DIR, timeout=120)
+        for line in result.stdout.splitlines():
+            if line.startswith('{'):
+                return json.loads(line)['ventana_ms']
+        raise RuntimeError((result.stderr.strip().splitlines() or ['sin salida'])[-1])
+
+    cold = measure('--sin-cache')
+    warm = sorted(measure() for _ in range(_size('arranque', 'warm_runs', quick)))
+    return {
+        'frio_ms': Metric(cold, 'ms', False),
+        'caliente_ms': Metric(warm[len(warm) // 2], 'ms', False),
+    }
+
+
+def _flatten(results):
+    return {f"{scenario}.{name}": metric.as_dict()
+            for scenario, metrics in results.items() for name, metric in metrics.items()}
+
+
+def compare(current, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Filas (métrica, base, actual, cambio, regresión) de las métricas presentes en ambos"""
+    rows = []
+    for name, entry in current.items():
+        base = baseline.get(name)
+        if base is None or not isinstance(entry['value'], (int, float)) or isinstance(entry['value'], bool):
+            continue
+        if not base['value']:
+            continue
+        change = (entry['value'] - base['value']) / base['value']
+        worse = -change if entry['higher_is_better'] else change
+        rows.append((name, base['value'], entry['value'], change, worse > tolerance))
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Mide el rendimiento contra un servidor local (sin red) y lo compara con una línea base.'
+    )
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='subproceso')
+    parser.add_argument('-j', '--workers', type=int, default=3, help='Descargas simultáneas')
+    parser.add_argument('--rate', default=None, metavar='VELOCIDAD',
+                        help='Ancho de banda por conexión del servidor local (p. ej. 20M); sin límite por defecto')
+    parser.add_argument('--latency', type=float, default=0.0, metavar='MS',
+                        help='Latencia añadida a cada respuesta del servidor local')
+    parser.add_argument('--rapido', action='store_true', help='Escenarios más pequeños')
+    parser.add_argument('--solo', action='append', metavar='ESCENARIO',
+                        choices=('lote', 'sobrecoste', 'hls', 'log', 'arranque'),
+                        help='Ejecutar solo estos escenarios (se puede repetir)')
+    parser.add_argument('--baseline', metavar='ARCHIVO', help='Comparar con una línea base guardada')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Empeoramiento relativo tolerado antes de marcar una regresión (0.10 = 10%%)')
+    parser.add_argument('--save-baseline', metavar='ARCHIVO', help='Guardar los resultados como línea base')
+    parser.add_argument('--output', metavar='ARCHIVO', help='Escribir los resultados en JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    selected = args.solo or ['lote', 'sobrecoste', 'hls', 'log', 'arranque']
+    if ENGINES[args.engine].requires_executable and not probe_tool('yt-dlp').available:
+        print("yt-dlp no está disponible. Instálalo primero con: pip install yt-dlp", file=sys.stderr)
+        return 2
+
+    results = {}
+    skipped = {}
+    with MediaServer(rate=parse_rate(args.rate), latency=args.latency / 1000) as server:
+        scenarios = {
+            'lote': lambda: bench_batch(server, args.engine, args.rapido, args.workers),
+            'sobrecoste': lambda: bench_overhead(server, args.engine, args.rapido, args.workers),
+            'hls': lambda: bench_hls(server, args.engine, args.rapido, args.workers),
+            'log': lambda: bench_log_drain(args.rapido, args.workers),
+            'arranque': lambda: bench_startup(args.rapido),
+        }
+        for name in selected:
+            print(f"▶ {name}...", file=sys.stderr, flush=True)
+            try:
+                results[name] = scenarios[name]()
+            except Exception as e:
+                skipped[name] = str(e)
+                print(f"   omitido: {e}", file=sys.stderr)
+                continue
+            for metric, value in results[name].items():
+                print(f"   {metric}: {value.value} {value.unit}".rstrip(), file=sys.stderr)
+
+    report = {
+        'engine': args.engine, 'workers': args.workers, 'rate': args.rate, 'latency_ms': args.latency,
+        'rapido': args.rapido, 'python': platform.python_version(), 'platform': platform.platform(),
+        'metrics': _flatten(results), 'skipped': skipped,
+    }
+    regressions = []
+    failures = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nComparación con {args.baseline}:", file=sys.stderr)
+        different = [key for key in ('engine', 'workers', 'rate', 'latency_ms', 'rapido')
+                     if baseline.get(key) != report[key]]
+        if different:
+            print(f"  ⚠️ La línea base se midió con otros parámetros: {', '.join(different)}", file=sys.stderr)
+        for name, base, value, change, regression in compare(report['metrics'], baseline['metrics'],
+                                                             args.tolerance):
+            mark = '❌' if regression else '✓'
+            print(f"  {mark} {name}: {base} → {value} ({change:+.1%})", file=sys.stderr)
+            if regression:
+                regressions.append(name)
+        # Un escenario de la línea base que ahora falla no puede compararse: cuenta como fallo, no se ignora
+        measured = {name.split('.', 1)[0] for name in baseline['metrics']}
+        for name, error in skipped.items():
+            if name in measured:
+                print(f"  ❌ {name}: falló ({error})", file=sys.stderr)
+                failures.append(name)
+        report['regressions'] = regressions
+        report['failures'] = failures
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return 1 if regressions or failures else 0
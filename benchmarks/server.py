@@ -0,0 +1,261 @@
+# benchmarks/server.py
+"""Servidor HTTP local que sustituye a los sitios de video: MP4 progresivos y HLS sintéticos"""
+import math
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Bloque que se repite para generar el contenido (sin guardar archivos en memoria)
+BLOCK_SIZE = 64 * 1024
+# Cabecera 'ftyp' mínima para que el contenido parezca un MP4
+MP4_HEADER = b'\x00\x00\x00\x18ftypisom\x00\x00\x02\x00isomiso2'
+
+# Fragmentos HLS: MPEG-TS de verdad (PAT, PMT y una pista de audio MP3 en silencio) para que
+# FFmpeg pueda abrirlos cuando yt-dlp corrige el contenedor (FixupM3u8) al terminar
+TS_PACKET_SIZE = 188
+TS_PAYLOAD_SIZE = TS_PACKET_SIZE - 4
+PMT_PID = 0x1000
+AUDIO_PID = 0x100
+NULL_PID = 0x1FFF
+# Trama MPEG-1 capa III a 320 kb/s y 48 kHz, mono, con la información lateral a cero (silencio)
+MP3_FRAME = b'\xff\xfb\xe4\xc0' + bytes(956)
+# Duración de una trama en el reloj de 90 kHz del PES (1152 muestras a 48 kHz = 24 ms)
+MP3_FRAME_TICKS = 2160
+# Paquetes TS de un PES con una trama (cabecera de 14 bytes con PTS)
+PACKETS_PER_FRAME = -(-(14 + len(MP3_FRAME)) // TS_PAYLOAD_SIZE)
+
+MP4_RE = re.compile(r'^/mp4/([\w-]+)-(\d+)\.mp4$')
+HLS_RE = re.compile(r'^/hls/([\w-]+)-(\d+)x(\d+)/(index\.m3u8|seg(\d+)\.ts)$')
+RANGE_RE = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+
+def _block(seed, header=b''):
+    pattern = (seed.encode('utf-8') + b'\x00') * (BLOCK_SIZE // (len(seed) + 1) + 1)
+    return (header + pattern)[:BLOCK_SIZE]
+
+
+def _crc32_mpeg(data):
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+
+def _psi_section(table_id, body):
+    """Sección PSI (PAT o PMT) con su longitud y su CRC"""
+    length = len(body) + 4
+    section = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF]) + body
+    return section + _crc32_mpeg(section).to_bytes(4, 'big')
+
+
+PAT = _psi_section(0x00, bytes([0x00, 0x01, 0xC1, 0x00, 0x00, 0x00, 0x01, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF]))
+# Programa 1 sin PCR (0x1FFF) con una pista MPEG-1 audio (tipo 0x03)
+PMT = _psi_section(0x02, bytes([0x00, 0x01, 0xC1, 0x00, 0x00, 0xFF, 0xFF, 0xF0, 0x00,
+                                0x03, 0xE0 | (AUDIO_PID >> 8), AUDIO_PID & 0xFF, 0xF0, 0x00]))
+
+
+def _ts_packets(pid, payload, counter, unit_start=True):
+    """Paquetes TS de pid con payload; el último se rellena con un campo de adaptación"""
+    packets = []
+    for offset in range(0, len(payload), TS_PAYLOAD_SIZE):
+        chunk = payload[offset:offset + TS_PAYLOAD_SIZE]
+        start = 0x40 if unit_start and offset == 0 else 0x00
+        header = bytes([0x47, start | (pid >> 8), pid & 0xFF])
+        if len(chunk) < TS_PAYLOAD_SIZE:
+            stuffing = TS_PAYLOAD_SIZE - len(chunk) - 1
+            adaptation = bytes([stuffing]) + (b'\x00' + b'\xff' * (stuffing - 1) if stuffing else b'')
+            packets.append(header + bytes([0x30 | counter]) + adaptation + chunk)
+        else:
+            packets.append(header + bytes([0x10 | counter]) + chunk)
+        counter = (counter + 1) % 16
+    return packets
+
+
+def _pes(pts, frame):
+    """PES de audio (stream 0xC0) con una trama y su PTS"""
+    stamp = bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1,
+                   (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1])
+    return b'\x00\x00\x01\xc0' + (8 + len(frame)).to_bytes(2, 'big') + b'\x80\x80\x05' + stamp + frame
+
+
+def ts_frames(segment_size):
+    """Tramas de audio que caben en un fragmento de segment_size bytes (al menos una)"""
+    return max(1, (segment_size // TS_PACKET_SIZE - 2) // PACKETS_PER_FRAME)
+
+
+def ts_segment(index, segment_size):
+    """Fragmento index de una lista HLS: PAT, PMT y audio que sigue al del fragmento anterior.
+
+    Los PTS y los contadores de continuidad continúan de un fragmento al
+    siguiente, así que al concatenarlos (como hace hlsnative) queda un único
+    MPEG-TS válido. Se completa hasta segment_size con paquetes nulos.
+    """
+    frames = ts_frames(segment_size)
+    counter = index * frames * PACKETS_PER_FRAME
+    packets = _ts_packets(0, b'\x00' + PAT, index % 16) + _ts_packets(PMT_PID, b'\x00' + PMT, index % 16)
+    for number in range(frames):
+        pts = (index * frames + number) * MP3_FRAME_TICKS
+        packets += _ts_packets(AUDIO_PID, _pes(pts, MP3_FRAME), (counter + number * PACKETS_PER_FRAME) % 16)
+    null = bytes([0x47, NULL_PID >> 8, NULL_PID & 0xFF, 0x10]) + b'\xff' * TS_PAYLOAD_SIZE
+    packets += [null] * (segment_size // TS_PACKET_SIZE - len(packets))
+    return b''.join(packets)
+
+
+class _Payload:
+    """Contenido de tamaño fijo generado a partir de un bloque repetido"""
+
+    def __init__(self, block, size):
+        self.block = block
+        self.size = size
+
+    def chunks(self, start, end):
+        """Trozos de bytes de [start, end)"""
+        position = start
+        while position < end:
+            offset = position % len(self.block)
+            chunk = self.block[offset:offset + min(end - position, len(self.block) - offset)]
+            yield chunk
+            position += len(chunk)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _resolve(self):
+        """(tipo MIME, contenido) de la ruta pedida, o None"""
+        path = self.path.split('?', 1)[0]
+        match = MP4_RE.match(path)
+        if match:
+            name, size = match.group(1), int(match.group(2))
+            return 'video/mp4', _Payload(_block(name, MP4_HEADER), size)
+        match = HLS_RE.match(path)
+        if match:
+            name, segments, segment_size = match.group(1), int(match.group(2)), int(match.group(3))
+            if match.group(4) == 'index.m3u8':
+                seconds = ts_frames(segment_size) * MP3_FRAME_TICKS / 90000
+                lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{math.ceil(seconds)}',
+                         '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:VOD']
+                for i in range(segments):
+                    lines += [f'#EXTINF:{seconds:.3f},', f'seg{i}.ts']
+                lines.append('#EXT-X-ENDLIST')
+                text = ('\n'.join(lines) + '\n').encode('utf-8')
+                return 'application/vnd.apple.mpegurl', _Payload(text, len(text))
+            if int(match.group(5)) < segments:
+                segment = ts_segment(int(match.group(5)), segment_size)
+                return 'video/mp2t', _Payload(segment, len(segment))
+        return None
+
+    def _respond(self, send_body):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+        resolved = self._resolve()
+        if resolved is None:
+            self.send_error(404)
+            return
+        content_type, payload = resolved
+        start, end = 0, payload.size
+        status = 200
+        match = RANGE_RE.match(self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) + 1, payload.size) if match.group(2) else payload.size
+            if start >= payload.size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{payload.size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{payload.size}')
+        self.end_headers()
+        if not send_body:
+            return
+        sent = 0
+        began = time.monotonic()
+        try:
+            for chunk in payload.chunks(start, end):
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if server.rate:
+                    # Limitar cada conexión a server.rate bytes/s
+                    ahead = sent / server.rate - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        server.count_bytes(sent)
+
+
+class MediaServer(ThreadingHTTPServer):
+    """Servidor en 127.0.0.1 con limitación de ancho de banda y latencia opcionales.
+
+    - /mp4/<nombre>-<bytes>.mp4: MP4 progresivo con soporte de Range
+    - /hls/<nombre>-<fragmentos>x<bytes>/index.m3u8: lista HLS VOD y sus fragmentos
+
+    rate limita cada conexión (bytes/s); latency retrasa cada respuesta (s).
+    Se usa como gestor de contexto: arranca en un hilo y se detiene al salir.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, rate=None, latency=0.0, port=0):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.rate = rate
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._thread = None
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_bytes(self, count):
+        with self._lock:
+            self.bytes_sent += count
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def mp4_url(self, name, size):
+        return f"{self.base_url}/mp4/{name}-{int(size)}.mp4"
+
+    def hls_url(self, name, segments, segment_size):
+        return f"{self.base_url}/hls/{name}-{int(segments)}x{int(segment_size)}/index.m3u8"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
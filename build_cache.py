@@ -0,0 +1,188 @@
+# build_cache.py
+"""Caché persistente de las descargas de la construcción (FFmpeg, yt-dlp), direccionada por contenido.
+
+python build_cache.py URL [--miembro ffmpeg.exe] [--sha256 SUMA]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import zipfile
+
+from descarga.paths import cache_dir
+
+INDEX_NAME = 'indice.json'
+OBJECTS_DIR = 'objetos'
+CHUNK_SIZE = 1024 * 1024
+REQUEST_TIMEOUT = 60
+# Segundos durante los que una URL sin suma fija se da por vigente sin preguntar
+REVALIDATE_AFTER = 24 * 3600
+
+
+class BuildCacheError(Exception):
+    """No se pudo obtener el archivo (red, suma que no coincide, miembro inexistente)"""
+
+
+class BuildCache:
+    """Archivos descargados guardados por su SHA-256 y un índice URL -> suma.
+
+    - Con una suma esperada (sha256), el archivo ya guardado se usa sin
+      conectarse y uno descargado que no coincida se rechaza.
+    - Sin ella (p. ej. una versión 'latest'), pasado REVALIDATE_AFTER se
+      pregunta al servidor con If-None-Match/If-Modified-Since; un 304 no
+      descarga nada y, sin red, se usa lo que hay.
+    - De un ZIP solo se extrae el miembro pedido, leyéndolo en flujo, y el
+      resultado también se guarda por contenido.
+    """
+
+    def __init__(self, root=None, max_age=REVALIDATE_AFTER):
+        self.root = root or os.environ.get('VIDEO_DESCARGA_BUILD_CACHE') or cache_dir('construccion')
+        self.max_age = max_age
+        os.makedirs(os.path.join(self.root, OBJECTS_DIR), exist_ok=True)
+        self.index_path = os.path.join(self.root, INDEX_NAME)
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {}
+        self.index.setdefault('urls', {})
+        self.index.setdefault('miembros', {})
+
+    def object_path(self, digest):
+        return os.path.join(self.root, OBJECTS_DIR, digest[:2], digest)
+
+    def _save_index(self):
+        temp = self.index_path + '.tmp'
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2)
+        os.replace(temp, self.index_path)
+
+    def _store(self, chunks):
+        """Guarda el contenido de chunks como objeto; devuelve (sha256, bytes)"""
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            path = self.object_path(digest.hexdigest())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp, path)
+        except BaseException:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+            raise
+        return digest.hexdigest(), size
+
+    def _cached(self, url, sha256=None):
+        """Entrada del índice de url con su objeto presente (y la suma pedida), o None"""
+        entry = self.index['urls'].get(url)
+        if not entry or not os.path.exists(self.object_path(entry['sha256'])):
+            return None
+        if sha256 and entry['sha256'] != sha256.lower():
+            return None
+        return entry
+
+    def fetch(self, url, sha256=None):
+        """Ruta local del contenido de url, descargándolo solo si hace falta"""
+        entry = self._cached(url, sha256)
+        if entry is not None and (sha256 or time.time() - entry['comprobado'] < self.max_age):
+            return self.object_path(entry['sha256'])
+        headers = {'User-Agent': 'VideoDescarga-build'}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('modificado'):
+                headers['If-Modified-Since'] = entry['modificado']
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=REQUEST_TIMEOUT)
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                print(f"✅ Sin cambios en {url} (caché)")
+                entry['comprobado'] = time.time()
+                self._save_index()
+                return self.object_path(entry['sha256'])
+            raise BuildCacheError(f"HTTP {e.code} al descargar {url}") from e
+        except OSError as e:
+            if entry is not None:
+                print(f"⚠️ No se pudo revalidar {url} ({e}); se usa la copia en caché")
+                return self.object_path(entry['sha256'])
+            raise BuildCacheError(f"No se pudo descargar {url}: {e}") from e
+        with response:
+            print(f"📥 Descargando {url}...")
+            digest, size = self._store(iter(lambda: response.read(CHUNK_SIZE), b''))
+            etag, modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if sha256 and digest != sha256.lower():
+            os.remove(self.object_path(digest))
+            raise BuildCacheError(f"La suma SHA-256 de {url} no coincide: {digest} (se esperaba {sha256})")
+        self.index['urls'][url] = {'sha256': digest, 'bytes': size, 'etag': etag, 'modificado': modified,
+                                   'comprobado': time.time()}
+        self._save_index()
+        print(f"✅ {size / 1024 / 1024:.1f} MB guardados en la caché ({digest[:12]})")
+        return self.object_path(digest)
+
+    def extract_member(self, url, name, sha256=None):
+        """Ruta local del miembro name (nombre de archivo, en cualquier carpeta) del ZIP de url"""
+        archive = self.fetch(url, sha256)
+        archive_sha = self.index['urls'][url]['sha256']
+        key = f"{archive_sha}/{name}"
+        member_sha = self.index['miembros'].get(key)
+        if member_sha and os.path.exists(self.object_path(member_sha)):
+            return self.object_path(member_sha)
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                member = next((info for info in zf.infolist()
+                               if not info.is_dir() and info.filename.rsplit('/', 1)[-1] == name), None)
+                if member is None:
+                    raise BuildCacheError(f"{name} no está en el archivo de {url}")
+                print(f"📦 Extrayendo {member.filename}...")
+                with zf.open(member) as source:
+                    member_sha, _ = self._store(iter(lambda: source.read(CHUNK_SIZE), b''))
+        except zipfile.BadZipFile as e:
+            raise BuildCacheError(f"El archivo de {url} no es un ZIP válido") from e
+        self.index['miembros'][key] = member_sha
+        self._save_index()
+        return self.object_path(member_sha)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python build_cache.py',
+        description='Descarga un archivo (o un miembro de un ZIP) a través de la caché de construcción.'
+    )
+    parser.add_argument('url')
+    parser.add_argument('--miembro', metavar='NOMBRE', help='Extraer solo este archivo del ZIP')
+    parser.add_argument('--sha256', metavar='SUMA', help='Suma esperada del archivo descargado')
+    parser.add_argument('--cache', metavar='CARPETA', help='Carpeta de la caché')
+    parser.add_argument('--max-age', type=float, default=REVALIDATE_AFTER, metavar='SEGUNDOS',
+                        help='Segundos antes de volver a preguntar al servidor (0 = siempre)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = BuildCache(args.cache, args.max_age)
+    try:
+        if args.miembro:
+            path = cache.extract_member(args.url, args.miembro, args.sha256)
+        else:
+            path = cache.fetch(args.url, args.sha256)
+    except BuildCacheError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
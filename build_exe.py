@@ -4,9 +4,31 @@ import os
 import sys
 import shutil
 import subprocess
-import urllib.request
-import zipfile
-import tempfile
+import time
+
+from build_cache import BuildCache, BuildCacheError
+
+APP_NAME = "VideoDescarga"
+EXE_SUFFIX = ".exe" if os.name == "nt" else ""
+
+# Modos de empaquetado: una carpeta que arranca sin extraer nada (por defecto)
+# o un único .exe que se descomprime en una carpeta temporal en cada arranque
+MODO_CARPETA = "carpeta"
+MODO_ARCHIVO = "archivo"
+MODOS = (MODO_CARPETA, MODO_ARCHIVO)
+
+# Descargas de la construcción; las variables de entorno permiten fijar otra
+# versión (con su suma SHA-256) o probar contra un servidor local
+FFMPEG_URL = os.environ.get("VIDEO_DESCARGA_FFMPEG_URL",
+                            "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip")
+FFMPEG_SHA256 = os.environ.get("VIDEO_DESCARGA_FFMPEG_SHA256")
+YTDLP_URL = os.environ.get("VIDEO_DESCARGA_YTDLP_URL",
+                           "https://github.com/yt-dlp/yt-dlp/releases/latest/download/yt-dlp.exe")
+YTDLP_SHA256 = os.environ.get("VIDEO_DESCARGA_YTDLP_SHA256")
+
+# Arranques que se miden por modo con --comparar-arranque (el primero, en frío)
+STARTUP_RUNS = 5
+STARTUP_TIMEOUT = 120
 
 def get_yt_dlp_location():
     """Encuentra la ubicación de yt-dlp"""
@@ -31,49 +53,26 @@ def get_yt_dlp_location():
     return None
 
 def download_ffmpeg():
-    """Descarga FFmpeg desde la fuente oficial"""
-    print("🔽 Descargando FFmpeg...")
-    
-    # URL de FFmpeg para Windows (versión estática)
-    ffmpeg_url = "https://github.com/BtbN/FFmpeg-Builds/releases/download/latest/ffmpeg-master-latest-win64-gpl.zip"
-    
-    # Crear directorio temporal
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, "ffmpeg.zip")
-    
+    """Obtiene ffmpeg.exe de la build oficial a través de la caché de construcción.
+
+    El ZIP se descarga una sola vez (después solo se revalida) y de él se
+    extrae únicamente ffmpeg.exe.
+    """
+    print("🔽 Obteniendo FFmpeg...")
     try:
-        # Descargar FFmpeg
-        print("📥 Descargando desde GitHub...")
-        urllib.request.urlretrieve(ffmpeg_url, zip_path)
-        
-        # Extraer el archivo ZIP
-        print("📦 Extrayendo FFmpeg...")
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-        
-        # Buscar el ejecutable ffmpeg.exe
-        ffmpeg_exe = None
-        for root, dirs, files in os.walk(temp_dir):
-            if 'ffmpeg.exe' in files:
-                ffmpeg_exe = os.path.join(root, 'ffmpeg.exe')
-                break
-        
-        if ffmpeg_exe and os.path.exists(ffmpeg_exe):
-            print(f"✅ FFmpeg encontrado: {ffmpeg_exe}")
-            return ffmpeg_exe
-        else:
-            print("❌ ERROR: No se encontró ffmpeg.exe en el archivo descargado")
-            return None
-            
-    except Exception as e:
+        return BuildCache().extract_member(FFMPEG_URL, "ffmpeg.exe", FFMPEG_SHA256)
+    except BuildCacheError as e:
         print(f"❌ ERROR descargando FFmpeg: {e}")
         return None
-    finally:
-        # Limpiar archivos temporales
-        try:
-            os.remove(zip_path)
-        except:
-            pass
+
+def download_yt_dlp():
+    """Obtiene el yt-dlp autónomo (no necesita Python) a través de la caché de construcción"""
+    print("🔽 Obteniendo yt-dlp...")
+    try:
+        return BuildCache().fetch(YTDLP_URL, YTDLP_SHA256)
+    except BuildCacheError as e:
+        print(f"❌ ERROR descargando yt-dlp: {e}")
+        return None
 
 def get_or_download_ffmpeg():
     """Obtiene FFmpeg, descargándolo si es necesario"""
@@ -91,19 +90,34 @@ def get_or_download_ffmpeg():
     print("⚠️ FFmpeg no encontrado en el sistema, descargando...")
     return download_ffmpeg()
 
-def build_executable():
-    """Construye el ejecutable con todas las dependencias"""
-    print("🔨 Iniciando construcción del ejecutable...")
+def executable_path(mode, distpath="./dist"):
+    """Ruta del ejecutable construido en cada modo"""
+    if mode == MODO_ARCHIVO:
+        return os.path.join(distpath, APP_NAME + EXE_SUFFIX)
+    return os.path.join(distpath, APP_NAME, APP_NAME + EXE_SUFFIX)
+
+def tree_size(path):
+    """Bytes de un archivo o de todo lo que hay en una carpeta"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+def build_executable(mode=MODO_CARPETA, distpath="./dist"):
+    """Construye el ejecutable con todas las dependencias.
+
+    En modo carpeta (--onedir) la aplicación, yt-dlp y FFmpeg quedan ya
+    desplegados en dist/VideoDescarga/ y cada arranque los usa en su sitio;
+    en modo archivo (--onefile) el .exe vuelve a extraer más de 100 MB en
+    una carpeta temporal antes de mostrar la ventana.
+    """
+    print(f"🔨 Iniciando construcción del ejecutable (modo {mode})...")
     
     # Verificar que yt-dlp esté disponible
     yt_dlp_path = get_yt_dlp_location()
     if not yt_dlp_path:
-        print("❌ ERROR: yt-dlp no encontrado. Instalando...")
-        try:
-            subprocess.run([sys.executable, "-m", "pip", "install", "yt-dlp"], check=True)
-            yt_dlp_path = get_yt_dlp_location()
-        except:
-            print("❌ Error instalando yt-dlp")
+        print("⚠️ yt-dlp no encontrado en el sistema, descargando...")
+        yt_dlp_path = download_yt_dlp()
+        if not yt_dlp_path:
             return False
     
     print(f"✅ yt-dlp encontrado en: {yt_dlp_path}")
@@ -136,13 +150,14 @@ def build_executable():
     yt_dlp_full_path = os.path.abspath(os.path.join(data_dir, "yt-dlp.exe"))
     ffmpeg_full_path = os.path.abspath(os.path.join(data_dir, "ffmpeg.exe"))
     args = [
-        '--name=VideoDescarga',
+        f'--name={APP_NAME}',
         '--windowed',  # No mostrar consola
-        '--onefile',   # Un solo archivo ejecutable
+        # Carpeta lista para usar o un solo archivo que se extrae en cada arranque
+        '--onefile' if mode == MODO_ARCHIVO else '--onedir',
         '--icon=NONE', # Sin icono por ahora
-        '--distpath=./dist',
-        '--workpath=./build',
-        '--specpath=./build',
+        f'--distpath={distpath}',
+        f'--workpath=./build/{mode}',
+        f'--specpath=./build/{mode}',
         '--clean',
         '--noconfirm',
         # Incluir módulos necesarios
@@ -155,9 +170,12 @@ def build_executable():
         '--hidden-import=os',
         '--hidden-import=sys',
         '--hidden-import=re',
-        # Incluir datos adicionales (yt-dlp y ffmpeg)
-        f'--add-data={yt_dlp_full_path}{os.pathsep}.',
-        f'--add-data={ffmpeg_full_path}{os.pathsep}.',
+        # Pausa de procesos en Windows (se importa bajo demanda)
+        '--hidden-import=psutil',
+        # yt-dlp y ffmpeg en la carpeta de datos (sys._MEIPASS), donde los
+        # busca descarga.tools; en modo carpeta no se copian al arrancar
+        f'--add-binary={yt_dlp_full_path}{os.pathsep}.',
+        f'--add-binary={ffmpeg_full_path}{os.pathsep}.',
         # Opciones de Windows
         '--noupx',
         '--exclude-module=tkinter',
@@ -173,13 +191,14 @@ def build_executable():
         PyInstaller.__main__.run(args)
         
         # Verificar que el ejecutable se creó
-        exe_path = "./dist/VideoDescarga.exe"
+        exe_path = executable_path(mode, distpath)
         if os.path.exists(exe_path):
+            app_path = exe_path if mode == MODO_ARCHIVO else os.path.dirname(exe_path)
             print(f"✅ Ejecutable creado exitosamente: {exe_path}")
-            print(f"📁 Tamaño: {os.path.getsize(exe_path) / 1024 / 1024:.1f} MB")
+            print(f"📁 Tamaño: {tree_size(app_path) / 1024 / 1024:.1f} MB")
             
             # Crear directorio de downloads junto al ejecutable
-            downloads_dir = "./dist/downloads"
+            downloads_dir = os.path.join(os.path.dirname(exe_path), "downloads")
             os.makedirs(downloads_dir, exist_ok=True)
             print(f"✅ Directorio de descargas creado: {downloads_dir}")
             
@@ -192,6 +211,38 @@ def build_executable():
         print(f"❌ ERROR durante la construcción: {e}")
         return False
 
+def measure_startup(exe_path, runs=STARTUP_RUNS):
+    """Milisegundos desde lanzar el ejecutable hasta que cierra su ventana, en cada arranque.
+
+    Se mide desde fuera con --medir-arranque (la ventana se cierra en cuanto
+    es visible), así que incluye la extracción del modo archivo, que ocurre
+    antes de que arranque Python.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([exe_path, '--medir-arranque'], timeout=STARTUP_TIMEOUT, capture_output=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def compare_startup(runs=STARTUP_RUNS):
+    """Construye los dos modos en dist/comparar/ y compara su tiempo de arranque"""
+    results = {}
+    for mode in MODOS:
+        distpath = os.path.join("dist", "comparar", mode)
+        if not build_executable(mode, distpath):
+            return False
+        print(f"⏱️ Midiendo {runs} arranques en modo {mode}...")
+        results[mode] = measure_startup(executable_path(mode, distpath), runs)
+    print("\n⏱️ Tiempo hasta la ventana visible (ms):")
+    for mode, times in results.items():
+        rest = sorted(times[1:]) or times
+        print(f"   {mode:8} primer arranque {times[0]:7.0f} · mediana del resto {rest[len(rest) // 2]:7.0f}")
+    fast = sorted(results[MODO_CARPETA][1:] or results[MODO_CARPETA])
+    slow = sorted(results[MODO_ARCHIVO][1:] or results[MODO_ARCHIVO])
+    print(f"🚀 El modo carpeta arranca {slow[len(slow) // 2] / fast[len(fast) // 2]:.1f}x más rápido")
+    return True
+
 def cleanup_temp_files():
     """Limpia archivos temporales"""
     temp_dirs = ['build', 'additional_data']
@@ -220,12 +271,22 @@ if __name__ == "__main__":
     print("🚀 Video Descarga - Constructor de Ejecutable")
     print("=" * 50)
     
-    success = build_executable()
+    # --un-archivo: un solo .exe (se extrae en cada arranque) en lugar de la carpeta
+    # --comparar-arranque: construir ambos modos y comparar su tiempo de arranque
+    mode = MODO_ARCHIVO if "--un-archivo" in sys.argv else MODO_CARPETA
+    comparing = "--comparar-arranque" in sys.argv
+    success = compare_startup() if comparing else build_executable(mode)
     
-    if success:
+    if success and comparing:
+        print("\n✅ Comparación terminada; los ejecutables están en ./dist/comparar/")
+    elif success:
         print("\n✅ ¡Construcción completada exitosamente!")
-        print("📦 El ejecutable está en: ./dist/VideoDescarga.exe")
-        print("💡 Puedes distribuir el archivo .exe sin necesidad de instalar Python")
+        if mode == MODO_ARCHIVO:
+            print(f"📦 El ejecutable está en: {executable_path(mode)}")
+            print("💡 Puedes distribuir el archivo .exe sin necesidad de instalar Python")
+        else:
+            print(f"📦 La aplicación está en: {os.path.dirname(executable_path(mode))}")
+            print("💡 Distribuye la carpeta completa (comprimida); no necesita instalar Python")
         
         # Preguntar sobre limpieza
         response = input("\n🗑️ ¿Eliminar archivos temporales? (s/n): ").lower().strip()
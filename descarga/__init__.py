@@ -0,0 +1,11 @@
+"""Núcleo de descargas de Video Descarga (no depende de PyQt5)"""
+
+__all__ = ['Job', 'JobScheduler', 'SchedulerListener']
+
+
+def __getattr__(name):
+    # Carga diferida: importar un módulo suelto (logbuffer, progress...) no arrastra el planificador
+    if name in __all__:
+        from descarga import scheduler
+        return getattr(scheduler, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,8 @@
+# descarga/__main__.py
+"""Permite ejecutar el modo por lotes con 'python -m descarga'"""
+import sys
+
+from descarga.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# descarga/archive.py
+"""Archivo persistente de descargas completadas (extractor + ID de video) y estado de las listas sincronizadas"""
+import os
+import sqlite3
+import threading
+import time
+
+from descarga.scheduler import SchedulerListener, COMPLETADO, OMITIDO, host_de_url
+
+ARCHIVE_NAME = '.video_descarga_archivo.sqlite'
+
+# Las búsquedas son por clave primaria (WITHOUT ROWID): un acceso al índice,
+# sin recorrer la tabla, tenga el archivo cien entradas o cientos de miles
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS descargas (
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    ruta TEXT,
+    tamano INTEGER,
+    url TEXT,
+    fecha REAL NOT NULL,
+    PRIMARY KEY (extractor, video_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS listas (
+    url TEXT PRIMARY KEY,
+    titulo TEXT,
+    entradas INTEGER,
+    fecha REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS listas_vistos (
+    lista TEXT NOT NULL,
+    extractor TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    PRIMARY KEY (lista, extractor, video_id)
+) WITHOUT ROWID;
+"""
+
+
+class OfflineIdResolver:
+    """Calcula (extractor, ID) de una URL sin red, con los extractores de yt-dlp.
+
+    Es lo mismo que hace yt-dlp con --download-archive antes de extraer. Probar
+    los ~1800 extractores por URL es caro, así que se recuerda qué extractores
+    han servido para cada host y se prueban primero. Sin el módulo yt_dlp no
+    se resuelve nada (solo queda la tabla de URLs del archivo).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._classes = None
+        self._by_host = {}
+
+    def _extractor_classes(self):
+        if self._classes is None:
+            try:
+                from yt_dlp.extractor import gen_extractor_classes
+            except ImportError:
+                self._classes = []
+            else:
+                # El extractor genérico acepta cualquier URL y no da un ID fiable
+                self._classes = [ie for ie in gen_extractor_classes() if ie.ie_key() != 'Generic']
+        return self._classes
+
+    @staticmethod
+    def _try(ie, url):
+        try:
+            if not ie.suitable(url):
+                return None
+            video_id = ie.get_temp_id(url)
+        except Exception:
+            return None
+        return (ie.ie_key(), str(video_id)) if video_id else None
+
+    def resolve(self, url):
+        host = host_de_url(url)
+        with self._lock:
+            candidates = list(self._by_host.get(host, ()))
+        for ie in candidates:
+            result = self._try(ie, url)
+            if result:
+                return result
+        with self._lock:
+            classes = self._extractor_classes()
+        for ie in classes:
+            if ie in candidates:
+                continue
+            result = self._try(ie, url)
+            if result:
+                with self._lock:
+                    self._by_host.setdefault(host, []).append(ie)
+                return result
+        return None
+
+
+class DownloadArchive(SchedulerListener):
+    """Archivo SQLite de la carpeta de descarga con lo que ya se descargó.
+
+    Antes de lanzar un trabajo se busca por URL (tabla 'urls') y por
+    extractor + ID calculado sin red; al completar un trabajo se registran su
+    ruta y su tamaño.
+    """
+
+    def __init__(self, output_dir, resolver=None):
+        self.path = os.path.join(output_dir, ARCHIVE_NAME)
+        self.resolver = resolver or OfflineIdResolver()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, extractor, video_id):
+        """Devuelve {'ruta', 'tamano', 'url'} de una descarga archivada, o None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT ruta, tamano, url FROM descargas WHERE extractor = ? AND video_id = ?',
+                (extractor, video_id)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'ruta': row[0], 'tamano': row[1], 'url': row[2]}
+
+    def lookup(self, job):
+        """Busca el trabajo en el archivo sin usar la red; devuelve la entrada o None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT extractor, video_id FROM urls WHERE url = ?', (job.url,)
+            ).fetchone()
+        key = tuple(row) if row else None
+        if key is None and job.extractor_key and job.video_id:
+            key = (job.extractor_key, job.video_id)
+        if key is None:
+            key = self.resolver.resolve(job.url)
+        if key is None:
+            return None
+        return self.get(*key)
+
+    def record(self, extractor, video_id, url, path=None, size=None, map_url=True):
+        """Registra una descarga; map_url asocia además la URL de entrada a este video"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO descargas (extractor, video_id, ruta, tamano, url, fecha) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (extractor, video_id, path, size, url, time.time())
+            )
+            if map_url:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO urls (url, extractor, video_id) VALUES (?, ?, ?)',
+                    (url, extractor, video_id)
+                )
+
+    def playlist_state(self, url):
+        """{'titulo', 'entradas', 'fecha'} de la última sincronización de la lista, o None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT titulo, entradas, fecha FROM listas WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'titulo': row[0], 'entradas': row[1], 'fecha': row[2]}
+
+    def playlist_seen(self, url, extractor, video_id):
+        """¿Apareció ya este video en una expansión anterior de la lista?"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT 1 FROM listas_vistos WHERE lista = ? AND extractor = ? AND video_id = ?',
+                (url, extractor, video_id)
+            ).fetchone()
+        return row is not None
+
+    def record_playlist(self, url, title, count):
+        """Guarda el título y el tamaño de la lista tras expandirla"""
+        with self._lock, self._conn:
+            previous = self._conn.execute('SELECT entradas FROM listas WHERE url = ?', (url,)).fetchone()
+            if count is None and previous is not None:
+                count = previous[0]
+            self._conn.execute(
+                'INSERT OR REPLACE INTO listas (url, titulo, entradas, fecha) VALUES (?, ?, ?, ?)',
+                (url, title, count, time.time())
+            )
+
+    def record_playlist_entry(self, url, extractor, video_id):
+        """Anota un video de la lista como visto (su trabajo terminó)"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO listas_vistos (lista, extractor, video_id) VALUES (?, ?, ?)',
+                (url, extractor, video_id)
+            )
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM descargas').fetchone()[0]
+
+    # --- Eventos del planificador ----------------------------------------
+
+    def on_job_finished(self, job):
+        if job.state not in (COMPLETADO, OMITIDO):
+            return
+        if job.parent is not None and job.extractor_key and job.video_id:
+            # Un video de una lista cuenta como visto cuando termina (o ya estaba descargado);
+            # si falla o se cancela, la siguiente sincronización lo vuelve a ofrecer
+            self.record_playlist_entry(job.parent.url, job.extractor_key, job.video_id)
+        if job.state != COMPLETADO:
+            return
+        # Una URL de playlist produce varios videos: se archivan todos, pero la
+        # URL solo se asocia a un video cuando es de un único video (no un
+        # elemento de una lista elegido con --playlist-items)
+        single = len(job.results) == 1 and '--playlist-items' not in job.cmd
+        for result in job.results:
+            if not (result.get('extractor_key') and result.get('id')):
+                continue
+            path = result.get('filepath')
+            try:
+                size = os.path.getsize(path) if path else None
+            except OSError:
+                size = None
+            self.record(result['extractor_key'], str(result['id']), job.url, path, size, map_url=single)
@@ -0,0 +1,351 @@
+# descarga/cli.py
+"""Modo por lotes sin interfaz: python -m descarga [URL ...] [-i lista.txt | -i -]"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+from descarga.archive import DownloadArchive
+from descarga.client import EVENTS_WAIT, DaemonClient, DaemonError
+from descarga.commands import CALIDADES, DEFAULT_OUTPUT_DIR, FORMATOS, DownloadOptions
+from descarga.engines import ENGINES, startup_summary
+from descarga.ingest import UrlSource, iter_file_lines
+from descarga.fragments import FragmentTuner
+from descarga.journal import JobJournal
+from descarga.limits import format_rate, parse_rate
+from descarga.metadata import MetadataCache
+from descarga.metrics import MetricsRecorder
+from descarga.playlists import PlaylistExpander
+from descarga.priority import POLICIES, POLITICA_ORDEN
+from descarga.retry import DEFAULT_ATTEMPTS, RetryPolicy
+from descarga.scheduler import COMPLETADO, ERROR, EXPANDIDO, OMITIDO, JobScheduler, SchedulerListener
+from descarga.sharedqueue import LEASE_SECONDS, QueueWorker, SharedQueue
+from descarga.tools import lookup_tool, probe_tool
+
+
+def job_record(job):
+    """Registro pequeño de un trabajo terminado para el resumen JSON"""
+    return {
+        'number': job.number, 'url': job.url, 'referer': job.referer, 'state': job.state,
+        'error': job.error, 'failure': job.failure, 'attempts': job.attempts,
+        'title': job.title, 'files': job.output_files,
+        'seconds': round(job.elapsed, 2) if job.started_at is not None else None,
+    }
+
+
+class ConsoleListener(SchedulerListener):
+    """Escribe el avance en stderr; stdout queda libre para el resumen JSON.
+
+    De cada trabajo terminado guarda solo un registro pequeño para el resumen,
+    ya que el planificador no conserva los trabajos de una lista en flujo.
+    """
+
+    def __init__(self, stream=None, verbose=False):
+        self.stream = stream or sys.stderr
+        self.verbose = verbose
+        self.records = []
+
+    def write(self, line):
+        print(line, file=self.stream, flush=True)
+
+    def emit(self, job, text):
+        """Escribe una línea de un trabajo, precedida de su número"""
+        self.write(f"[{job.number}] {text}")
+
+    def on_job_started(self, job):
+        self.emit(job, f"▶ {job.url}")
+
+    def on_job_log(self, job, line):
+        if self.verbose:
+            self.emit(job, line)
+
+    def on_job_finished(self, job):
+        self.records.append(job_record(job))
+        if job.state == COMPLETADO:
+            self.emit(job, f"✓ {', '.join(job.output_files) or job.url}")
+        elif job.state == EXPANDIDO:
+            self.emit(job, job.expansion.describe())
+        elif job.state == OMITIDO:
+            self.emit(job, f"⏭️ ya descargado: {(job.archived or {}).get('ruta') or job.url}")
+        else:
+            self.emit(job, f"❌ {job.error}")
+            if not self.verbose and job.log:
+                # La última línea de yt-dlp suele explicar el error
+                self.emit(job, f"   {job.log[-1]}")
+
+    def on_job_retry(self, job):
+        if not self.verbose and job.log:
+            # La línea del planificador con la causa y la espera
+            self.emit(job, job.log[-1])
+
+    def on_stats(self, stats):
+        self.write(f"⬇️ {stats.describe()}")
+
+
+def input_lines(args):
+    """Líneas con URLs: las de la línea de comandos y, sin leerlos de golpe, los archivos de -i"""
+    return itertools.chain(args.urls, iter_file_lines(args.input or (), stdin=sys.stdin))
+
+
+def record_order(record):
+    # Los videos de una lista se numeran '3.1', '3.2'...
+    return [int(part) for part in str(record['number']).split('.')]
+
+
+def build_summary(records, scheduler, read, seconds, metrics):
+    """Resumen legible por máquinas del lote terminado"""
+    return {
+        'total': scheduler.total_jobs(),
+        'states': scheduler.counts(),
+        'input': read,
+        'seconds': round(seconds, 2),
+        'engine': scheduler.engine.name,
+        'stats': scheduler.stats().as_dict(),
+        'host_limits': scheduler.host_limits(),
+        'phases': metrics.as_dict(),
+        'failures': scheduler.failures.as_list(),
+        'jobs': sorted(records, key=record_order),
+    }
+
+
+def rate_type(text):
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m descarga',
+        description='Descarga por lotes con el mismo planificador que la aplicación, sin PyQt5.'
+    )
+    parser.add_argument('urls', nargs='*', help="URLs (admite 'URL:REFERER')")
+    parser.add_argument('-i', '--input', action='append', metavar='ARCHIVO',
+                        help="Archivo con URLs separadas por líneas o comas; '-' lee la entrada estándar")
+    parser.add_argument('-o', '--output-dir', default=DEFAULT_OUTPUT_DIR, help='Carpeta de descarga')
+    parser.add_argument('-f', '--format', choices=FORMATOS, default='mp4')
+    parser.add_argument('-q', '--quality', choices=CALIDADES, default='best')
+    parser.add_argument('--subs', action='store_true', help='Descargar subtítulos')
+    parser.add_argument('--audio-only', action='store_true', help='Solo audio (MP3)')
+    parser.add_argument('--playlist', action='store_true',
+                        help='Descargar playlists completas (se expanden en un trabajo por video)')
+    parser.add_argument('--sync', action='store_true',
+                        help='Sincronizar playlists: encolar solo los videos nuevos desde la última vez (implica --playlist)')
+    parser.add_argument('-j', '--workers', type=int, default=3, help='Descargas simultáneas')
+    parser.add_argument('--per-host', type=int, default=2, help='Máximo de descargas por sitio')
+    parser.add_argument('--limit-rate', type=rate_type, default=None, metavar='VELOCIDAD',
+                        help="Ancho de banda total repartido entre las descargas activas (p. ej. 5M, 500K)")
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Reducir y pausar las conexiones a un sitio si responde HTTP 429/403 o rinde menos')
+    parser.add_argument('--stream-merge', action='store_true',
+                        help='Con calidad best: bajar video y audio a la vez y unirlos con FFmpeg según llegan '
+                             '(solo HTTP directo; si no, se bajan por separado y se unen al final)')
+    parser.add_argument('-N', '--concurrent-fragments', type=int, default=None, metavar='N',
+                        help='Fragmentos simultáneos en HLS/DASH (por defecto se ajustan por sitio)')
+    parser.add_argument('--attempts', type=int, default=DEFAULT_ATTEMPTS, metavar='N',
+                        help='Intentos por URL ante errores temporales o límites del sitio; se reintenta '
+                             'al final de la cola con espera creciente (1 = sin reintentos)')
+    parser.add_argument('--queue-order', choices=sorted(POLICIES), default=POLITICA_ORDEN,
+                        help="Orden de la cola: 'orden' de llegada, 'cortos' primero (según el tamaño o la "
+                             "duración extraídos por adelantado) u 'hosts' por turnos entre sitios")
+    parser.add_argument('--priority', type=int, default=0, metavar='N',
+                        help='Con --daemon: prioridad de estas URLs en la cola del servicio (mayor antes)')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='subproceso')
+    parser.add_argument('--no-prefetch', action='store_true', help='No extraer metadatos por adelantado')
+    parser.add_argument('--no-skip-archived', action='store_true', help='Descargar aunque ya esté en el archivo')
+    parser.add_argument('--metrics-jsonl', metavar='ARCHIVO',
+                        help='Añadir una línea JSON por trabajo con el tiempo y los bytes de cada fase')
+    parser.add_argument('--metrics-prom', metavar='ARCHIVO',
+                        help='Mantener un archivo .prom con las métricas (textfile collector de Prometheus)')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Enviar las URLs al servicio local (se arranca si no está en marcha) y seguir su '
+                             'avance; Ctrl+C se desconecta sin detener las descargas')
+    parser.add_argument('--shared-queue', metavar='ARCHIVO',
+                        help='Cola SQLite compartida con otros procesos o máquinas: las URLs indicadas se '
+                             'añaden a ella y este proceso descarga filas de la cola hasta vaciarla')
+    parser.add_argument('--enqueue-only', action='store_true',
+                        help='Con --shared-queue: solo añadir las URLs, sin descargar')
+    parser.add_argument('--lease', type=float, default=LEASE_SECONDS, metavar='SEGUNDOS',
+                        help='Con --shared-queue: duración de una reserva sin latido; al caducar (trabajador '
+                             'caído) la URL vuelve a la cola para otro')
+    parser.add_argument('--no-wal', action='store_true',
+                        help='Con --shared-queue: diario clásico en lugar de WAL (cola en una carpeta de red)')
+    parser.add_argument('--summary', metavar='ARCHIVO',
+                        help='Escribir el resumen JSON en un archivo en vez de en la salida estándar')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Mostrar la salida de yt-dlp')
+    return parser.parse_args(argv)
+
+
+def write_summary(summary, path=None):
+    summary = json.dumps(summary, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(summary + '\n')
+    else:
+        print(summary)
+
+
+def run_on_daemon(args, console):
+    """--daemon: envía las URLs al servicio local y sigue sus trabajos hasta que terminan"""
+    # El servicio reutiliza ConsoleListener: se importa aquí para no importarse en círculo
+    from descarga.daemon import service_args
+
+    options = {
+        'format': args.format, 'quality': args.quality, 'subtitles': args.subs, 'audio_only': args.audio_only,
+        'no_playlist': not (args.playlist or args.sync), 'concurrent_fragments': args.concurrent_fragments,
+        'priority': args.priority,
+    }
+    start = time.monotonic()
+    records = []
+    try:
+        client = DaemonClient.ensure(service_args(
+            args.output_dir, args.workers, args.per_host, args.engine, args.limit_rate, args.adaptive,
+            args.attempts, not args.no_prefetch, args.sync, args.queue_order, args.stream_merge))
+        console.write(f"🛰️ Servicio local en {client.base_url} (carpeta {client.info['output_dir']})")
+        if os.path.abspath(args.output_dir) != client.info['output_dir']:
+            console.write("⚠️ El servicio ya estaba en marcha: se descarga en su carpeta y con sus ajustes")
+        # Desde el último evento anterior al envío, para no perder los de los trabajos enviados
+        cursor = client.status(jobs=0)['last_event']
+        numbers, read = client.submit(input_lines(args), options)
+        pending = {str(number) for number in numbers}
+        wait = 0
+        while pending:
+            reply = client.events(cursor, wait)
+            cursor = reply['next']
+            for event in reply['events']:
+                if (event.get('job') or '').split('.')[0] not in pending:
+                    continue
+                if 'record' in event:
+                    records.append(event['record'])
+                elif args.verbose or not event.get('detail'):
+                    console.write(event['line'])
+            pending &= set(reply['active'])
+            # Tras recibir eventos se vuelve a preguntar sin esperar: los trabajos
+            # activos se calculan antes que los eventos y pueden haber terminado ya
+            wait = 0 if reply['events'] else EVENTS_WAIT
+    except DaemonError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        print("⏏️ Desconectado; las descargas siguen en el servicio local", file=sys.stderr)
+        return 130
+
+    states = {}
+    for record in records:
+        states[record['state']] = states.get(record['state'], 0) + 1
+    write_summary({
+        'total': len(records), 'states': states, 'input': read, 'seconds': round(time.monotonic() - start, 2),
+        'service': client.base_url, 'failures': [record for record in records if record['state'] == ERROR],
+        'jobs': sorted(records, key=record_order),
+    }, args.summary)
+    return 1 if states.get(ERROR) else 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.urls and not args.input and not args.shared_queue:
+        print("Debes indicar al menos una URL.", file=sys.stderr)
+        return 2
+    missing = [path for path in args.input or () if path != '-' and not os.path.isfile(path)]
+    if missing:
+        print(f"No existe el archivo de URLs: {', '.join(missing)}", file=sys.stderr)
+        return 2
+    console = ConsoleListener(verbose=args.verbose)
+    if args.daemon:
+        return run_on_daemon(args, console)
+    queue = None
+    read = {}
+    if args.shared_queue:
+        queue = SharedQueue(args.shared_queue, args.lease, wal=not args.no_wal)
+        if args.urls or args.input:
+            # En la cola solo se guardan las opciones del lote; las rutas las pone cada trabajador
+            read = queue.add(input_lines(args), DownloadOptions(
+                format=args.format, quality=args.quality, subtitles=args.subs, audio_only=args.audio_only,
+                no_playlist=not (args.playlist or args.sync), concurrent_fragments=args.concurrent_fragments))
+            console.write(f"📥 {read['read']} URL(s) leídas · {read['duplicates']} ya estaban en la cola · "
+                          f"{read['queued']} añadidas a {queue.path}")
+        if args.enqueue_only:
+            write_summary({'queue': queue.path, 'states': queue.counts()}, args.summary)
+            queue.close()
+            return 0
+
+    engine_cls = ENGINES[args.engine]
+    ytdlp = lookup_tool('yt-dlp')
+    if engine_cls.requires_executable and not probe_tool('yt-dlp').available:
+        print("yt-dlp no está disponible. Instálalo primero con: pip install yt-dlp", file=sys.stderr)
+        if queue is not None:
+            queue.close()
+        return 2
+    ffmpeg = probe_tool('ffmpeg')
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = DownloadOptions(
+        ytdlp_path=ytdlp.path, output_dir=args.output_dir, format=args.format, quality=args.quality,
+        subtitles=args.subs, audio_only=args.audio_only, no_playlist=not (args.playlist or args.sync),
+        ffmpeg_path=ffmpeg.path if ffmpeg.available else None,
+        concurrent_fragments=args.concurrent_fragments,
+    )
+    # Los trabajos se generan a medida que hay hueco y se registran en el diario al generarse
+    source = UrlSource(input_lines(args), options) if queue is None else None
+
+    metrics = MetricsRecorder(args.metrics_jsonl, args.metrics_prom)
+    journal = JobJournal(os.path.abspath(args.output_dir))
+    archive = DownloadArchive(os.path.abspath(args.output_dir))
+    engine = engine_cls()
+    worker = queue_states = None
+    if queue is not None:
+        # La cola compartida hace de diario: lo que quede a medias lo recoge otro trabajador
+        worker = QueueWorker(queue, {'ytdlp_path': ytdlp.path, 'output_dir': args.output_dir,
+                                     'ffmpeg_path': options.ffmpeg_path}, args.workers, log=console.write)
+    listeners = [journal if worker is None else worker, metrics] + ([archive] if args.no_skip_archived else [])
+    scheduler = JobScheduler(
+        source if queue is None else (), max_workers=args.workers, max_per_host=args.per_host, engine=engine,
+        listener=console, listeners=listeners,
+        metadata_cache=None if args.no_prefetch else MetadataCache(),
+        archive=None if args.no_skip_archived else archive,
+        bandwidth_limit=args.limit_rate, adaptive=args.adaptive,
+        fragment_tuner=None if args.concurrent_fragments else FragmentTuner(),
+        playlists=PlaylistExpander(engine, archive, sync=args.sync),
+        retry=RetryPolicy(args.attempts), policy=POLICIES[args.queue_order](), keep_alive=queue is not None,
+        stream_merge=args.stream_merge,
+    )
+    if args.limit_rate:
+        console.write(f"📶 Ancho de banda total: {format_rate(args.limit_rate)}")
+    start = time.monotonic()
+    if worker is not None:
+        console.write(f"🧺 Trabajador {worker.name} de la cola {queue.path}")
+        worker.start(scheduler)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        # yt-dlp corre en su propio grupo de procesos: Ctrl+C no le llega, hay que terminarlo
+        print("⏹️ Detenido por el usuario; terminando las descargas en curso...", file=sys.stderr)
+        scheduler.cancel_all(keep_partial=True)
+        scheduler.wait_idle()
+    finally:
+        if worker is not None:
+            worker.stop()
+            queue_states = queue.counts()
+            queue.close()
+        if hasattr(engine, 'close'):
+            engine.close()
+        journal.close()
+        archive.close()
+        metrics.close()
+
+    if source is not None:
+        console.write(source.describe())
+    startup = startup_summary(scheduler.jobs, scheduler.finished)
+    if startup:
+        console.write(f"⏱️ {startup} (motor {engine.name})")
+    for line in metrics.summary_lines() + scheduler.failures.lines():
+        console.write(line)
+    summary = build_summary(console.records, scheduler, source.as_dict() if source is not None else read,
+                            time.monotonic() - start, metrics)
+    if queue is not None:
+        summary['queue'] = {'path': queue.path, 'states': queue_states}
+    write_summary(summary, args.summary)
+    return 1 if scheduler.counts().get(ERROR) else 0
@@ -0,0 +1,199 @@
+# descarga/client.py
+"""Cliente del servicio local de descargas (descarga.daemon): encontrarlo, arrancarlo y hablar con él"""
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from urllib.parse import urlencode
+
+from descarga.paths import cache_dir
+from descarga.processes import popen_kwargs
+
+# Datos de conexión del servicio en marcha (host, puerto, token, pid, carpeta)
+SERVICE_INFO_NAME = 'servicio.json'
+# Salida del servicio cuando se arranca en segundo plano
+SERVICE_LOG_NAME = 'servicio.log'
+TOKEN_HEADER = 'X-Token'
+
+# Segundos de espera de una petición y del arranque del servicio
+REQUEST_TIMEOUT = 5.0
+SPAWN_TIMEOUT = 15.0
+# Segundos que el servicio retiene una petición de eventos si aún no hay ninguno
+EVENTS_WAIT = 20.0
+# URLs por petición al enviar una lista larga
+SUBMIT_CHUNK = 500
+
+
+class DaemonError(Exception):
+    """El servicio no responde o rechazó la petición"""
+
+
+def service_info_path():
+    return os.path.join(cache_dir(), SERVICE_INFO_NAME)
+
+
+def read_service_info():
+    try:
+        with open(service_info_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_service_info(info):
+    """Publica los datos de conexión; solo el usuario puede leer el token"""
+    path = service_info_path()
+    temp = path + '.tmp'
+    fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(temp, path)
+
+
+def remove_service_info(pid):
+    """Borra los datos de conexión si siguen siendo los del servicio pid"""
+    info = read_service_info()
+    if info and info.get('pid') == pid:
+        try:
+            os.remove(service_info_path())
+        except OSError:
+            pass
+
+
+def service_command(args=()):
+    """Comando que arranca el servicio: el módulo con este intérprete, o el ejecutable empaquetado con --servicio"""
+    if getattr(sys, 'frozen', False):
+        return [sys.executable, '--servicio', *args]
+    return [sys.executable, '-m', 'descarga.daemon', *args]
+
+
+class DaemonClient:
+    """Peticiones HTTP al servicio local; los métodos de control imitan a JobScheduler.
+
+    Los trabajos se identifican por su número tal como se muestra ('3',
+    '3.2'). Cualquier fallo de conexión o respuesta de error se convierte
+    en DaemonError.
+    """
+
+    def __init__(self, info):
+        self.info = info
+        self.base_url = f"http://{info['host']}:{info['port']}"
+        self.token = info['token']
+        # Sin proxies: el servicio siempre está en 127.0.0.1
+        self._opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))
+
+    @classmethod
+    def connect(cls):
+        """Cliente del servicio en marcha, o None si no hay ninguno que responda"""
+        info = read_service_info()
+        if not info:
+            return None
+        client = cls(info)
+        try:
+            client.status(jobs=0)
+        except DaemonError:
+            return None
+        return client
+
+    @classmethod
+    def ensure(cls, args=(), timeout=SPAWN_TIMEOUT):
+        """Se conecta al servicio, arrancándolo en segundo plano (con args) si no está en marcha"""
+        client = cls.connect()
+        if client is not None:
+            return client
+        log_path = os.path.join(cache_dir(), SERVICE_LOG_NAME)
+        with open(log_path, 'a', encoding='utf-8') as log:
+            # Grupo de procesos propio: sobrevive al cierre de la ventana o la terminal
+            process = subprocess.Popen(service_command(args), stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                                       close_fds=True, **popen_kwargs())
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.2)
+            client = cls.connect()
+            if client is not None:
+                return client
+            if process.poll() is not None:
+                raise DaemonError(f"El servicio no pudo arrancar (código {process.returncode}); revisa {log_path}")
+        raise DaemonError(f"El servicio no respondió en {timeout:.0f} s; revisa {log_path}")
+
+    def request(self, method, path, body=None, timeout=REQUEST_TIMEOUT):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={TOKEN_HEADER: self.token, 'Content-Type': 'application/json'})
+        try:
+            with self._opener.open(request, timeout=timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.load(e).get('error')
+            except ValueError:
+                message = None
+            raise DaemonError(message or f"HTTP {e.code}") from e
+        except (OSError, ValueError) as e:
+            raise DaemonError(f"El servicio no responde: {e}") from e
+
+    # --- Consultas -------------------------------------------------------
+
+    def status(self, jobs=None):
+        """Estado del servicio: estadísticas, contadores y (como mucho jobs) trabajos activos"""
+        query = f"?{urlencode({'trabajos': jobs})}" if jobs is not None else ''
+        return self.request('GET', f'/estado{query}')
+
+    def events(self, since, wait=EVENTS_WAIT):
+        """Eventos posteriores a since; espera hasta wait segundos a que haya alguno"""
+        query = urlencode({'desde': since, 'espera': wait})
+        return self.request('GET', f'/eventos?{query}', timeout=wait + REQUEST_TIMEOUT)
+
+    # --- Trabajos --------------------------------------------------------
+
+    def submit(self, lines, options=None):
+        """Envía las líneas con URLs por tandas de SUBMIT_CHUNK; devuelve (números, resumen de la lectura)"""
+        numbers = []
+        read = {}
+        lines = iter(lines)
+        while True:
+            chunk = list(itertools.islice(lines, SUBMIT_CHUNK))
+            if not chunk:
+                break
+            reply = self.request('POST', '/trabajos', {'urls': chunk, 'options': options or {}})
+            numbers += reply['numbers']
+            for key, value in reply['input'].items():
+                read[key] = value if isinstance(value, bool) else read.get(key, 0) + value
+        return numbers, read
+
+    def pause(self, number):
+        return self.request('POST', f'/trabajos/{number}/pausar')
+
+    def resume(self, number):
+        return self.request('POST', f'/trabajos/{number}/reanudar')
+
+    def cancel(self, number, keep_partial=True):
+        return self.request('POST', f'/trabajos/{number}/cancelar', {'keep_partial': keep_partial})
+
+    def prioritize(self, number, priority=None):
+        """Fija la prioridad de un trabajo en espera; sin priority pasa delante de todos"""
+        return self.request('POST', f'/trabajos/{number}/priorizar', {'priority': priority})
+
+    def postpone(self, number):
+        return self.request('POST', f'/trabajos/{number}/posponer')
+
+    def set_policy(self, name):
+        """Cambia el orden de la cola del servicio (priority.POLICIES)"""
+        return self.request('POST', '/politica', {'policy': name})
+
+    def pause_all(self):
+        return self.request('POST', '/pausar')
+
+    def resume_all(self):
+        return self.request('POST', '/reanudar')
+
+    def cancel_all(self, keep_partial=True):
+        return self.request('POST', '/cancelar', {'keep_partial': keep_partial})
+
+    def shutdown(self):
+        """Detiene el servicio; lo que esté en curso queda en el diario para reanudarse"""
+        return self.request('POST', '/detener')
@@ -0,0 +1,158 @@
+# descarga/commands.py
+"""Lectura de URLs con referer y construcción del comando yt-dlp de cada trabajo"""
+from dataclasses import dataclass
+
+from descarga.progress import FINAL_ARGS, PROGRESS_ARGS
+from descarga.scheduler import Job
+
+FORMATOS = ("mp4", "webm", "mkv", "avi", "best", "worst")
+CALIDADES = ("best", "worst", "720p", "480p", "360p", "bestvideo+bestaudio")
+DEFAULT_OUTPUT_DIR = "./downloads"
+
+
+@dataclass
+class DownloadOptions:
+    """Opciones de un lote, las mismas que ofrece la ventana principal"""
+    ytdlp_path: str = 'yt-dlp'
+    output_dir: str = DEFAULT_OUTPUT_DIR
+    format: str = 'mp4'
+    quality: str = 'best'
+    subtitles: bool = False
+    audio_only: bool = False
+    no_playlist: bool = True
+    # None si FFmpeg no está disponible
+    ffmpeg_path: str = None
+    # Fragmentos simultáneos en HLS/DASH; None los ajusta el planificador por host
+    concurrent_fragments: int = None
+
+
+# Opciones que viajan con un envío (servicio local, cola compartida); las rutas son de quien descarga
+PORTABLE_OPTIONS = ('format', 'quality', 'subtitles', 'audio_only', 'no_playlist', 'concurrent_fragments')
+
+
+def portable_options(options):
+    """Opciones de un lote sin las rutas de esta máquina, para guardarlas en JSON"""
+    return {name: getattr(options, name) for name in PORTABLE_OPTIONS}
+
+
+def options_from_dict(values, **paths):
+    """DownloadOptions a partir de opciones JSON (portable_options) y las rutas locales (ytdlp_path...)"""
+    video_format, quality = values.get('format', 'mp4'), values.get('quality', 'best')
+    if video_format not in FORMATOS or quality not in CALIDADES:
+        raise ValueError(f"Formato o calidad no válidos: {video_format}, {quality}")
+    fragments = values.get('concurrent_fragments')
+    return DownloadOptions(
+        format=video_format, quality=quality, subtitles=bool(values.get('subtitles')),
+        audio_only=bool(values.get('audio_only')), no_playlist=bool(values.get('no_playlist', True)),
+        concurrent_fragments=int(fragments) if fragments else None, **paths
+    )
+
+
+def split_urls(text):
+    """Separa un texto con URLs por comas o saltos de línea"""
+    return [u.strip() for u in text.replace('\n', ',').split(",") if u.strip()]
+
+
+def parse_url(entry):
+    """Separa 'URL:REFERER' en (url, referer, notas); las notas describen casos especiales"""
+    url = entry.strip()
+    referer = None
+    notes = []
+    # Verificar si hay referer después de los dos puntos
+    # Solo dividir si hay ":http" que no sea parte del protocolo inicial
+    if url.count(':') > 2:  # Más de 2 dos puntos (protocolo + puerto/referer)
+        # Buscar el último ":" que no sea parte de "https://"
+        if ':http' in url[8:]:  # Buscar después de "https://"
+            last_colon_pos = url.rfind(':http')
+            if last_colon_pos > 8:  # Asegurar que no sea el protocolo inicial
+                referer = url[last_colon_pos + 1:].strip()
+                url = url[:last_colon_pos].strip()
+
+                # CORRECCIÓN ESPECIAL PARA VIMEO EMBEDS
+                if 'player.vimeo.com/video/' in url:
+                    # Para Vimeo embebido, usar la URL de Vimeo como principal
+                    # y la página del curso como referer
+                    notes.append("🎬 Vimeo embed detectado: usando URL de Vimeo como principal")
+                    notes.append(f"📺 URL de Vimeo: {url}")
+                    notes.append(f"🌐 Referer (página del curso): {referer}")
+                    # url y referer ya están en la posición correcta
+                elif 'vimeo.com' in url and 'vimeo.com' in referer:
+                    # Para otros casos de Vimeo, usar referer normalmente
+                    notes.append(f"🎬 Vimeo URL con referer: {url}")
+                    notes.append(f"🌐 Referer: {referer}")
+
+    elif ':' in url and not url.startswith(("http://", "https://")) and url.count(':') == 1:
+        # Caso simple sin protocolo
+        parts = url.split(":", 1)
+        url, referer = parts[0].strip(), parts[1].strip()
+    return url, referer, notes
+
+
+def build_command(url, referer, options):
+    """Comando yt-dlp para una URL con las opciones del lote"""
+    cmd = [options.ytdlp_path, url]
+
+    # Configurar FFmpeg si está disponible
+    if options.ffmpeg_path:
+        cmd += ["--ffmpeg-location", options.ffmpeg_path]
+
+    # Formato y calidad
+    if options.audio_only:
+        cmd += ["-f", "bestaudio/best", "--extract-audio", "--audio-format", "mp3"]
+    else:
+        if options.quality == "best":
+            # Para YouTube y sitios que separan audio y video
+            cmd += ["-f", "bestvideo+bestaudio", "--merge-output-format", options.format]
+        else:
+            cmd += ["-f", options.quality]
+            if options.format != "best":
+                cmd += ["--recode-video", options.format]
+
+    # Subtítulos
+    if options.subtitles:
+        cmd += ["--write-subs", "--sub-lang", "all"]
+
+    # Fragmentos simultáneos fijados a mano (si no, se ajustan por host)
+    if options.concurrent_fragments:
+        cmd += ["--concurrent-fragments", str(options.concurrent_fragments)]
+
+    # Referer
+    if referer:
+        cmd += ["--referer", referer]
+
+    # Directorio de salida
+    cmd += ["-o", f"{options.output_dir}/%(title)s.%(ext)s"]
+
+    # Opciones adicionales para mejor compatibilidad
+    cmd += [
+        "--no-warnings",
+        "--no-check-certificates",
+        "--restrict-filenames",
+        "--windows-filenames",
+        "--fragment-retries", "5",
+        "--retries", "3",
+        "--file-access-retries", "5",
+        # Progreso estructurado en JSON, una línea por actualización
+        *PROGRESS_ARGS,
+        # Extractor, ID y ruta final de cada video, para el archivo de descargas
+        *FINAL_ARGS,
+        # Continuar los .part existentes en lugar de empezar desde cero
+        "--continue"
+    ]
+
+    # Solo agregar --no-playlist si la opción está marcada
+    if options.no_playlist:
+        cmd.append("--no-playlist")
+    return cmd
+
+
+def build_jobs(entries, options, on_note=None):
+    """Crea un Job por entrada 'URL[:REFERER]'; on_note recibe las notas de cada URL"""
+    jobs = []
+    for entry in entries:
+        url, referer, notes = parse_url(entry)
+        if on_note is not None:
+            for note in notes:
+                on_note(note)
+        jobs.append(Job(len(jobs), build_command(url, referer, options), url, referer))
+    return jobs
@@ -0,0 +1,467 @@
+# descarga/daemon.py
+"""Servicio local de descargas: una cola permanente a la que se conectan la ventana y la CLI.
+
+python -m descarga.daemon [-o carpeta] [-j N] [--engine integrado] ...
+"""
+import argparse
+import hmac
+import json
+import os
+import secrets
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from descarga.archive import DownloadArchive
+from descarga.cli import ConsoleListener, rate_type
+from descarga.client import (TOKEN_HEADER, DaemonClient, read_service_info, remove_service_info,
+                             write_service_info)
+from descarga.commands import DEFAULT_OUTPUT_DIR, options_from_dict
+from descarga.engines import ENGINES
+from descarga.fragments import FragmentTuner
+from descarga.ingest import UrlSource
+from descarga.journal import JobJournal
+from descarga.limits import format_rate
+from descarga.metadata import MetadataCache
+from descarga.metrics import MetricsRecorder
+from descarga.playlists import PlaylistExpander
+from descarga.priority import POLICIES, POLITICA_ORDEN
+from descarga.progress import progress_line
+from descarga.retry import DEFAULT_ATTEMPTS, RetryPolicy
+from descarga.scheduler import JobScheduler
+from descarga.tools import lookup_tool, probe_tool
+
+HOST = '127.0.0.1'
+
+# Eventos que se conservan para los clientes que se quedan atrás o se reconectan
+EVENTS_KEPT = 5000
+# Registros de trabajos terminados y fallos que se conservan
+RECORDS_KEPT = 2000
+# Segundos como máximo que se retiene una petición de eventos
+EVENT_WAIT_MAX = 30.0
+# Segundos entre eventos de progreso de un mismo trabajo
+PROGRESS_EVENT_INTERVAL = 1.0
+# Trabajos activos que devuelve /estado por defecto
+STATUS_JOBS = 200
+# Tamaño máximo del cuerpo de una petición (una tanda de URLs)
+MAX_BODY = 8 * 1024 * 1024
+
+JOB_ACTIONS = ('pausar', 'reanudar', 'cancelar', 'priorizar', 'posponer')
+
+
+class EventLog:
+    """Últimos eventos del servicio, numerados, para seguirlos con peticiones largas.
+
+    Cada cliente pide los posteriores al último que vio y la petición espera
+    hasta que hay alguno; si se queda más de EVENTS_KEPT eventos atrás,
+    recibe los que quedan y cuántos se perdió.
+    """
+
+    def __init__(self, maxlen=EVENTS_KEPT):
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=maxlen)
+        self.last = 0
+        self.closed = False
+
+    def add(self, **event):
+        with self._cond:
+            self.last += 1
+            event['seq'] = self.last
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def since(self, seq, wait=0.0):
+        """(eventos posteriores a seq, eventos perdidos); espera hasta wait segundos a que haya alguno"""
+        deadline = time.monotonic() + wait
+        with self._cond:
+            if seq > self.last:
+                # Número de otro servicio (reiniciado): se empieza de nuevo
+                seq = 0
+            while self.last <= seq and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            events = [event for event in self._events if event['seq'] > seq]
+            first = events[0]['seq'] if events else self.last + 1
+        return events, max(0, first - seq - 1)
+
+    def close(self):
+        """Libera las peticiones que están esperando"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class DaemonListener(ConsoleListener):
+    """Publica como eventos las mismas líneas que escribe la CLI.
+
+    Las líneas de yt-dlp y el progreso van marcadas como detalle (la CLI solo
+    las muestra con -v); el progreso de cada trabajo se publica como mucho una
+    vez por PROGRESS_EVENT_INTERVAL. Al terminar un trabajo se publica además
+    su registro para el resumen del cliente.
+    """
+
+    def __init__(self, events):
+        super().__init__(verbose=True)
+        self.events = events
+        self.records = deque(maxlen=RECORDS_KEPT)
+        self._progress_at = {}
+
+    def write(self, line):
+        self.events.add(line=line)
+
+    def emit(self, job, text, detail=False):
+        self.events.add(job=str(job.number), line=f"[{job.number}] {text}", detail=detail)
+
+    def on_job_log(self, job, line):
+        self.emit(job, line, detail=True)
+
+    def on_job_progress(self, job):
+        now = time.monotonic()
+        if now - self._progress_at.get(job.key, 0.0) >= PROGRESS_EVENT_INTERVAL:
+            self._progress_at[job.key] = now
+            self.events.add(job=str(job.number), line=progress_line(job), detail=True)
+
+    def on_job_retry(self, job):
+        if job.log:
+            self.emit(job, job.log[-1])
+
+    def on_job_finished(self, job):
+        super().on_job_finished(job)
+        self._progress_at.pop(job.key, None)
+        self.events.add(job=str(job.number), record=self.records[-1])
+
+    def on_stats(self, stats):
+        pass
+
+
+class DownloadDaemon:
+    """Planificador permanente con su motor, diario, archivo y cachés en caliente.
+
+    La carpeta de salida y los ajustes de la cola (descargas simultáneas,
+    motor, ancho de banda, reintentos) son los del servicio; cada envío elige
+    formato, calidad, subtítulos, solo audio, playlist y prioridad. Al
+    arrancar reanuda lo que quedó pendiente en el diario de la carpeta.
+    """
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, workers=3, per_host=2, engine='subproceso',
+                 limit_rate=None, adaptive=False, attempts=DEFAULT_ATTEMPTS, prefetch=True, sync=False,
+                 policy=POLITICA_ORDEN, stream_merge=False):
+        self.output_dir = os.path.abspath(output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.ytdlp_path = lookup_tool('yt-dlp').path
+        ffmpeg = probe_tool('ffmpeg')
+        self.ffmpeg_path = ffmpeg.path if ffmpeg.available else None
+        self.events = EventLog()
+        self.listener = DaemonListener(self.events)
+        self.metrics = MetricsRecorder()
+        self.journal = JobJournal(self.output_dir)
+        self.archive = DownloadArchive(self.output_dir)
+        self.engine = ENGINES[engine]()
+        self.scheduler = JobScheduler(
+            (), max_workers=workers, max_per_host=per_host, engine=self.engine,
+            listener=self.listener, listeners=[self.journal, self.metrics],
+            metadata_cache=MetadataCache() if prefetch else None, archive=self.archive,
+            bandwidth_limit=limit_rate, adaptive=adaptive, fragment_tuner=FragmentTuner(),
+            playlists=PlaylistExpander(self.engine, self.archive, sync=sync),
+            retry=RetryPolicy(attempts), keep_alive=True, policy=POLICIES[policy](), stream_merge=stream_merge,
+        )
+        self.token = secrets.token_urlsafe(24)
+        self.started = time.time()
+        self.server = None
+        # Los envíos se numeran a continuación unos de otros
+        self._lock = threading.Lock()
+        self._next_index = 0
+
+    # --- Trabajos --------------------------------------------------------
+
+    def download_options(self, values):
+        """DownloadOptions de un envío a partir de sus opciones JSON"""
+        return options_from_dict(values, ytdlp_path=self.ytdlp_path, output_dir=self.output_dir,
+                                 ffmpeg_path=self.ffmpeg_path)
+
+    def submit(self, lines, options=None):
+        """Encola las URLs de lines; devuelve (números de los trabajos, resumen de la lectura)"""
+        priority = int((options or {}).get('priority') or 0)
+        options = self.download_options(options or {})
+        with self._lock:
+            source = UrlSource(lines, options, first_index=self._next_index)
+            jobs = list(source)
+            for job in jobs:
+                job.priority = priority
+            self._next_index += source.generated
+            self.scheduler.submit(jobs)
+        self.listener.write(source.describe())
+        return [job.number for job in jobs], source.as_dict()
+
+    def resume(self):
+        """Vuelve a encolar lo que quedó sin terminar en el diario"""
+        jobs = self.journal.resume_jobs(executable=self.ytdlp_path)
+        if not jobs:
+            return
+        with self._lock:
+            for job in jobs:
+                job.index = self._next_index
+                self._next_index += 1
+            self.scheduler.submit(jobs)
+        self.listener.write(f"♻️ Reanudando {len(jobs)} descarga(s) desde el diario {self.journal.path}")
+
+    def control(self, number, action, keep_partial=True, priority=None):
+        """Pausa, reanuda, cancela, prioriza o pospone el trabajo activo con ese número; False si no existe"""
+        job = self.scheduler.find(number)
+        if job is None:
+            return False
+        if action == 'pausar':
+            self.scheduler.pause(job)
+        elif action == 'reanudar':
+            self.scheduler.resume(job)
+        elif action == 'priorizar':
+            self.scheduler.prioritize(job, None if priority is None else int(priority))
+        elif action == 'posponer':
+            self.scheduler.postpone(job)
+        else:
+            self.scheduler.cancel(job, keep_partial)
+        return True
+
+    def set_policy(self, name):
+        """Cambia la política de la cola (priority.POLICIES) en caliente"""
+        if name not in POLICIES:
+            raise ValueError(f"Política de cola no válida: {name}")
+        self.scheduler.set_policy(POLICIES[name]())
+        self.listener.write(f"🔀 Orden de la cola: {self.scheduler.policy.describe()}")
+
+    def active_roots(self):
+        """Números de los envíos con trabajos activos ('3' por '3' y por '3.2')"""
+        return sorted({str(job.number).split('.')[0] for job in self.scheduler.active_jobs()}, key=int)
+
+    def status(self, jobs=STATUS_JOBS):
+        stats = self.scheduler.stats()
+        return {
+            'pid': os.getpid(), 'output_dir': self.output_dir, 'engine': self.engine.name,
+            'started': self.started, 'policy': self.scheduler.policy.name, 'total': self.scheduler.total_jobs(), 'states': self.scheduler.counts(),
+            'stats': stats.as_dict(), 'summary': stats.describe(), 'host_limits': self.scheduler.host_limits(),
+            'jobs': [job.as_dict() for job in self.scheduler.active_jobs()[:jobs]],
+            'failures': self.scheduler.failures.as_list()[-RECORDS_KEPT:], 'phases': self.metrics.as_dict(),
+            'last_event': self.events.last,
+        }
+
+    def events_since(self, seq, wait=0.0):
+        # Los activos se miran antes de esperar: un trabajo que termina después
+        # sigue en la lista y su registro llega en esta respuesta o en la siguiente
+        active = self.active_roots()
+        events, dropped = self.events.since(seq, min(wait, EVENT_WAIT_MAX))
+        return {'events': events, 'dropped': dropped, 'next': events[-1]['seq'] if events else max(seq, 0),
+                'active': active}
+
+    # --- Servicio --------------------------------------------------------
+
+    def serve(self, port=0):
+        """Atiende peticiones en 127.0.0.1 hasta que se pide detener el servicio (bloquea)"""
+        self.server = _Server((HOST, port), self)
+        runner = threading.Thread(target=self.scheduler.run, name='planificador', daemon=True)
+        runner.start()
+        self.resume()
+        write_service_info({'host': HOST, 'port': self.server.server_address[1], 'token': self.token,
+                            'pid': os.getpid(), 'output_dir': self.output_dir, 'started': self.started})
+        try:
+            self.server.serve_forever()
+        finally:
+            # Lo que esté en curso queda en el diario y se reanuda al volver a arrancar
+            self.scheduler.cancel_all(keep_partial=True)
+            self.scheduler.stop()
+            runner.join()
+            remove_service_info(os.getpid())
+            self.events.close()
+            self.server.server_close()
+            if hasattr(self.engine, 'close'):
+                self.engine.close()
+            self.journal.close()
+            self.archive.close()
+            self.metrics.close()
+
+    def shutdown(self):
+        """Detiene el servicio desde otro hilo"""
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, _Handler)
+        self.service = service
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """API JSON del servicio.
+
+    Todas las peticiones llevan el token de servicio.json en la cabecera
+    X-Token; una página web no puede añadirla sin permiso (CORS), así que
+    tampoco puede usar el servicio aunque esté en la misma máquina.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def _dispatch(self, method):
+        service = self.server.service
+        if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ''), service.token):
+            self._reply(403, {'error': 'Token no válido'})
+            return
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            body = self._body() if method == 'POST' else {}
+            result = self._route(service, method, parts, query, body)
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        if result is None:
+            self._reply(404, {'error': 'No encontrado'})
+        else:
+            self._reply(200, result)
+
+    @staticmethod
+    def _route(service, method, parts, query, body):
+        scheduler = service.scheduler
+        if method == 'GET' and parts == ['estado']:
+            return service.status(int(query.get('trabajos', STATUS_JOBS)))
+        if method == 'GET' and parts == ['eventos']:
+            return service.events_since(int(query.get('desde', 0)), float(query.get('espera', 0)))
+        if method != 'POST':
+            return None
+        if parts == ['trabajos']:
+            urls, options = body.get('urls'), body.get('options')
+            # Un texto se recorrería letra a letra y unas opciones que no son objeto acabarían en un 500
+            if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+                raise ValueError("'urls' debe ser una lista de textos")
+            if options is not None and not isinstance(options, dict):
+                raise ValueError("'options' debe ser un objeto JSON")
+            numbers, read = service.submit(urls, options)
+            return {'numbers': numbers, 'input': read}
+        if len(parts) == 3 and parts[0] == 'trabajos' and parts[2] in JOB_ACTIONS:
+            found = service.control(parts[1], parts[2], bool(body.get('keep_partial', True)), body.get('priority'))
+            return {'ok': True} if found else None
+        if parts == ['politica']:
+            service.set_policy(body.get('policy'))
+        elif parts == ['pausar']:
+            scheduler.pause_all()
+        elif parts == ['reanudar']:
+            scheduler.resume_all()
+        elif parts == ['cancelar']:
+            scheduler.cancel_all(bool(body.get('keep_partial', True)))
+        elif parts == ['detener']:
+            # serve_forever no puede detenerse desde una de sus peticiones
+            threading.Thread(target=service.shutdown, daemon=True).start()
+        else:
+            return None
+        return {'ok': True}
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            raise ValueError("Petición demasiado grande")
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(body, dict):
+            raise ValueError("Se esperaba un objeto JSON")
+        return body
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def service_args(output_dir=DEFAULT_OUTPUT_DIR, workers=3, per_host=2, engine='subproceso', limit_rate=None,
+                 adaptive=False, attempts=DEFAULT_ATTEMPTS, prefetch=True, sync=False, policy=POLITICA_ORDEN,
+                 stream_merge=False):
+    """Argumentos de main() para arrancar el servicio con esos ajustes (DaemonClient.ensure)"""
+    args = ['-o', os.path.abspath(output_dir), '-j', str(workers), '--per-host', str(per_host),
+            '--engine', engine, '--attempts', str(attempts), '--queue-order', policy]
+    if limit_rate:
+        args += ['--limit-rate', str(int(limit_rate))]
+    if adaptive:
+        args.append('--adaptive')
+    if not prefetch:
+        args.append('--no-prefetch')
+    if sync:
+        args.append('--sync')
+    if stream_merge:
+        args.append('--stream-merge')
+    return args
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m descarga.daemon',
+        description='Servicio local de descargas: conserva la cola, los motores y las cachés entre '
+                    'sesiones de la ventana y de la CLI (python -m descarga --daemon).'
+    )
+    parser.add_argument('-o', '--output-dir', default=DEFAULT_OUTPUT_DIR, help='Carpeta de descarga')
+    parser.add_argument('-j', '--workers', type=int, default=3, help='Descargas simultáneas')
+    parser.add_argument('--per-host', type=int, default=2, help='Máximo de descargas por sitio')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='subproceso')
+    parser.add_argument('--limit-rate', type=rate_type, default=None, metavar='VELOCIDAD',
+                        help="Ancho de banda total repartido entre las descargas activas (p. ej. 5M, 500K)")
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Reducir y pausar las conexiones a un sitio si responde HTTP 429/403 o rinde menos')
+    parser.add_argument('--attempts', type=int, default=DEFAULT_ATTEMPTS, metavar='N',
+                        help='Intentos por URL ante errores temporales o límites del sitio')
+    parser.add_argument('--no-prefetch', action='store_true', help='No extraer metadatos por adelantado')
+    parser.add_argument('--sync', action='store_true',
+                        help='Sincronizar playlists: encolar solo los videos nuevos desde la última vez')
+    parser.add_argument('--queue-order', choices=sorted(POLICIES), default=POLITICA_ORDEN,
+                        help='Orden de la cola: de llegada, más cortos primero o por turnos entre sitios')
+    parser.add_argument('--stream-merge', action='store_true',
+                        help='Bajar video y audio a la vez y unirlos con FFmpeg según llegan (solo HTTP directo)')
+    parser.add_argument('--port', type=int, default=0, help='Puerto en 127.0.0.1 (por defecto, uno libre)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if DaemonClient.connect() is not None:
+        print(f"Ya hay un servicio en marcha (pid {read_service_info()['pid']}).", file=sys.stderr)
+        return 1
+    engine_cls = ENGINES[args.engine]
+    if engine_cls.requires_executable and not probe_tool('yt-dlp').available:
+        print("yt-dlp no está disponible. Instálalo primero con: pip install yt-dlp", file=sys.stderr)
+        return 2
+    service = DownloadDaemon(
+        args.output_dir, workers=args.workers, per_host=args.per_host, engine=args.engine,
+        limit_rate=args.limit_rate, adaptive=args.adaptive, attempts=args.attempts,
+        prefetch=not args.no_prefetch, sync=args.sync, policy=args.queue_order, stream_merge=args.stream_merge,
+    )
+    # SIGTERM detiene el servicio como Ctrl+C, dejando el diario al día
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"🛰️ Servicio en marcha (pid {os.getpid()}, carpeta {service.output_dir}, motor {service.engine.name}, "
+          f"ancho de banda {format_rate(args.limit_rate)})", file=sys.stderr, flush=True)
+    try:
+        service.serve(args.port)
+    except KeyboardInterrupt:
+        pass
+    print("⏹️ Servicio detenido", file=sys.stderr, flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
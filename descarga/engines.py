@@ -0,0 +1,353 @@
+# descarga/engines.py
+"""Motores de ejecución de trabajos: proceso yt-dlp externo o API YoutubeDL integrada"""
+import importlib.util
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+from descarga.processes import kill_tree, kill_tree_async, popen_kwargs, resume_tree, suspend_tree
+from descarga.progress import FINAL_FIELDS, ProgressEvent, strip_final_args
+
+
+class SubprocessEngine:
+    """Lanza un proceso yt-dlp por trabajo y lee su salida línea a línea"""
+
+    name = 'subproceso'
+    description = 'subproceso (yt-dlp externo)'
+    requires_executable = True
+    # --limit-rate se fija al lanzar el proceso y no se puede cambiar después
+    live_rate_limit = False
+    # Cancelar y pausar alcanzan a todo el árbol, también al FFmpeg de una unión en flujo
+    controls_ffmpeg = True
+
+    @staticmethod
+    def available():
+        return True
+
+    EXTRACT_TIMEOUT = 120
+
+    def extract_info(self, job, extra_args=()):
+        """Obtiene la info JSON del trabajo con 'yt-dlp -J' (sin descargar), o None.
+
+        extra_args se añaden al comando (p. ej. --flat-playlist).
+        """
+        try:
+            result = subprocess.run(
+                # --no-simulate de FINAL_ARGS haría que -J también descargara
+                strip_final_args(job.cmd) + ['--dump-single-json', *extra_args],
+                capture_output=True, text=True, encoding='utf-8', timeout=self.EXTRACT_TIMEOUT,
+                creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0 or not result.stdout.strip():
+            return None
+        try:
+            return json.loads(result.stdout)
+        except ValueError:
+            return None
+
+    def run(self, job, scheduler, cmd=None):
+        """Ejecuta el comando del trabajo (o el de una de sus etapas) y devuelve su código de salida"""
+        start = time.monotonic()
+        cmd = cmd or job.cmd
+        info_path = scheduler.info_path(job)
+        if info_path and job.url in cmd:
+            # Descargar desde la info ya extraída en vez de volver a extraer la URL
+            cmd = [cmd[0], '--load-info-json', info_path] + [arg for arg in cmd[1:] if arg != job.url]
+        if job.rate_limit:
+            # Parte del límite global de ancho de banda que le toca a este trabajo
+            cmd = cmd + ['--limit-rate', str(int(job.rate_limit))]
+        job.process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            universal_newlines=True,
+            # Grupo propio: cancelar o pausar alcanza también a FFmpeg
+            **popen_kwargs()
+        )
+        # Cancelado o pausado mientras se preparaba el comando
+        if job.cancel_requested:
+            kill_tree(job.process)
+        elif job.paused:
+            suspend_tree(job.process)
+        for output in job.process.stdout:
+            output = output.strip()
+            if not output:
+                continue
+            if job.startup_seconds is None:
+                # La primera línea llega cuando yt-dlp ya arrancó e importó los extractores
+                job.startup_seconds = time.monotonic() - start
+            scheduler.job_output(job, output)
+        job.process.wait()
+        return job.process.returncode
+
+    @staticmethod
+    def cancel(job):
+        """Termina el árbol de procesos del trabajo (yt-dlp y FFmpeg) sin bloquear a quien llama"""
+        # Se llama desde la interfaz: la espera y el SIGKILL van en otro hilo
+        kill_tree_async(job.process)
+
+    @staticmethod
+    def pause(job):
+        """Suspende el árbol de procesos; False si el sistema no lo permite"""
+        if job.process is None:
+            # Aún no hay proceso: run() lo suspende nada más lanzarlo
+            return True
+        return suspend_tree(job.process)
+
+    @staticmethod
+    def resume(job):
+        resume_tree(job.process)
+
+
+class _JobLogger:
+    """Logger para YoutubeDL que reenvía los mensajes al trabajo activo de la instancia"""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def _emit(self, message):
+        job, scheduler = self.slot.job, self.slot.scheduler
+        if job is None:
+            return
+        if job.startup_seconds is None:
+            job.startup_seconds = time.monotonic() - self.slot.started_at
+        for line in str(message).splitlines():
+            line = line.strip()
+            if line:
+                scheduler.job_output(job, line)
+
+    def debug(self, message):
+        # yt-dlp envía por debug() tanto to_screen como los mensajes de depuración
+        if not str(message).startswith('[debug] '):
+            self._emit(message)
+
+    def info(self, message):
+        self._emit(message)
+
+    def warning(self, message):
+        self._emit(message)
+
+    def error(self, message):
+        self._emit(message)
+
+
+class _YDLSlot:
+    """Instancia de YoutubeDL reutilizable y el trabajo que la está usando"""
+
+    def __init__(self):
+        self.ydl = None
+        self.job = None
+        self.scheduler = None
+        self.started_at = 0.0
+        # Límite de velocidad propio de las opciones (--limit-rate), sin el reparto global
+        self.base_ratelimit = None
+
+    def apply_rate_limit(self, job):
+        """Aplica a la instancia la parte del límite global asignada al trabajo.
+
+        El descargador HTTP de yt-dlp lee params['ratelimit'] en cada bloque,
+        así que el cambio afecta también a la descarga en curso.
+        """
+        rate = job.rate_limit if job is not None else None
+        if rate and self.base_ratelimit:
+            rate = min(rate, self.base_ratelimit)
+        rate = rate or self.base_ratelimit
+        if self.ydl.params.get('ratelimit') != rate:
+            self.ydl.params['ratelimit'] = rate
+
+    @staticmethod
+    def check_control(job):
+        """Detiene la descarga mientras el trabajo esté en pausa y la aborta si se cancela"""
+        import yt_dlp
+        while not job.resume_event.wait(0.5):
+            if job.cancel_requested:
+                break
+        if job.cancel_requested:
+            raise yt_dlp.utils.DownloadCancelled('Cancelado por el usuario')
+
+    def progress_hook(self, d):
+        job, scheduler = self.job, self.scheduler
+        if job is None:
+            return
+        self.check_control(job)
+        if job.startup_seconds is None:
+            job.startup_seconds = time.monotonic() - self.started_at
+        # El planificador reparte de nuevo el ancho de banda al empezar o terminar otra descarga
+        self.apply_rate_limit(job)
+        if d.get('status') in ('downloading', 'finished'):
+            # Los mismos campos que la plantilla de progreso del motor de subproceso
+            scheduler.job_progress_event(job, ProgressEvent.from_dict(d))
+
+    def postprocessor_hook(self, d):
+        job, scheduler = self.job, self.scheduler
+        if job is None:
+            return
+        if d.get('postprocessor') == 'MoveFiles' and d.get('status') == 'finished':
+            # Equivale a la línea '[vd-final]' que imprime el motor de subproceso
+            info = d.get('info_dict') or {}
+            scheduler.job_result(job, {field: info.get(field) for field in FINAL_FIELDS})
+
+
+class InProcessEngine:
+    """Descarga con yt_dlp.YoutubeDL dentro del propio proceso.
+
+    Las opciones se obtienen del mismo argv que usa el motor de subproceso
+    (yt_dlp.parse_options), de modo que ambos motores se comportan igual.
+    Las instancias de YoutubeDL se guardan por conjunto de opciones y se
+    reutilizan entre trabajos: una instancia solo la usa un trabajo a la vez,
+    así que conserva extractores cargados y conexiones HTTP sin compartir
+    estado entre hilos.
+    """
+
+    name = 'integrado'
+    description = 'integrado (API de yt-dlp)'
+    requires_executable = False
+    # El límite de velocidad se reajusta en las descargas en curso
+    live_rate_limit = True
+    # La pausa y la cancelación van por los avisos de progreso, que FFmpeg no da mientras descarga
+    controls_ffmpeg = False
+
+    # Las etapas y el planificador de formatos generan opciones distintas por
+    # trabajo; se guardan como mucho estas instancias en reposo
+    MAX_IDLE_SLOTS = 8
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle = OrderedDict()
+
+    @staticmethod
+    def available():
+        # find_spec no importa yt_dlp (tarda cientos de ms), solo comprueba que exista
+        return importlib.util.find_spec('yt_dlp') is not None
+
+    @staticmethod
+    def _parse(cmd):
+        """Convierte el argv de un trabajo en (URLs, opciones de YoutubeDL, clave del pool)"""
+        import yt_dlp
+        # El primer elemento del comando es el ejecutable de yt-dlp
+        argv = list(cmd[1:])
+        parsed = yt_dlp.parse_options(argv)
+        key = tuple(arg for arg in argv if arg not in parsed.urls)
+        return parsed.urls, parsed.ydl_opts, key
+
+    def run(self, job, scheduler, cmd=None):
+        start = time.monotonic()
+        import yt_dlp
+
+        urls, ydl_opts, key = self._parse(cmd or job.cmd)
+        info_path = scheduler.info_path(job)
+        slot = self._checkout(key, ydl_opts)
+        slot.job, slot.scheduler, slot.started_at = job, scheduler, start
+        slot.apply_rate_limit(job)
+        try:
+            # YoutubeDL acumula el código de retorno entre descargas; se reinicia por trabajo
+            slot.ydl._download_retcode = 0
+            if info_path:
+                # Si la info caducó, yt-dlp vuelve a extraer desde webpage_url
+                return slot.ydl.download_with_info_file(info_path)
+            return slot.ydl.download(urls)
+        except yt_dlp.utils.DownloadError as e:
+            job.error = str(e)
+            return 1
+        except yt_dlp.utils.DownloadCancelled:
+            return 1
+        finally:
+            slot.job = slot.scheduler = None
+            slot.apply_rate_limit(None)
+            self._checkin(key, slot)
+
+    def extract_info(self, job, extra_args=()):
+        """Extrae la info del trabajo con una instancia del pool, o None si falla"""
+        import yt_dlp
+        urls, ydl_opts, key = self._parse(list(job.cmd) + list(extra_args))
+        slot = self._checkout(key, ydl_opts)
+        try:
+            info = slot.ydl.extract_info(urls[0], download=False)
+            return slot.ydl.sanitize_info(info)
+        except yt_dlp.utils.YoutubeDLError:
+            return None
+        finally:
+            self._checkin(key, slot)
+
+    @staticmethod
+    def cancel(job):
+        # El siguiente aviso de progreso aborta la descarga (check_control)
+        job.resume_event.set()
+
+    @staticmethod
+    def pause(job):
+        # El siguiente aviso de progreso espera a que se reanude
+        return True
+
+    @staticmethod
+    def resume(job):
+        pass
+
+    def close(self):
+        """Cierra todas las instancias en reposo"""
+        with self._lock:
+            slots = [slot for slots in self._idle.values() for slot in slots]
+            self._idle.clear()
+        for slot in slots:
+            slot.ydl.close()
+
+    def _checkout(self, key, ydl_opts):
+        with self._lock:
+            slots = self._idle.get(key)
+            if slots:
+                return slots.pop()
+        import yt_dlp
+        slot = _YDLSlot()
+        opts = dict(ydl_opts)
+        opts['logger'] = _JobLogger(slot)
+        opts['progress_hooks'] = [slot.progress_hook]
+        opts['postprocessor_hooks'] = [slot.postprocessor_hook]
+        # --print escribe directamente en stdout; aquí el resultado llega por el hook
+        opts['forceprint'] = {}
+        opts['noprogress'] = True
+        opts['quiet'] = True
+        slot.base_ratelimit = opts.get('ratelimit')
+        slot.ydl = yt_dlp.YoutubeDL(opts)
+        return slot
+
+    def _checkin(self, key, slot):
+        evicted = []
+        with self._lock:
+            self._idle.setdefault(key, []).append(slot)
+            self._idle.move_to_end(key)
+            while sum(len(slots) for slots in self._idle.values()) > self.MAX_IDLE_SLOTS:
+                oldest_key, oldest = next(iter(self._idle.items()))
+                evicted.append(oldest.pop(0))
+                if not oldest:
+                    del self._idle[oldest_key]
+        for old in evicted:
+            old.ydl.close()
+
+
+ENGINES = {engine.name: engine for engine in (SubprocessEngine, InProcessEngine)}
+
+
+def startup_summary(jobs, finished=None):
+    """Devuelve un resumen del coste de arranque por URL, o None si no hay datos.
+
+    finished (progress.FinishedTotals) añade los trabajos terminados que el
+    planificador ya no conserva.
+    """
+    times = [job.startup_seconds for job in jobs if job.startup_seconds is not None]
+    count, total = len(times), sum(times)
+    low, high = (min(times), max(times)) if times else (None, None)
+    if finished is not None and finished.startup_count:
+        count += finished.startup_count
+        total += finished.startup_total
+        low = finished.startup_min if low is None else min(low, finished.startup_min)
+        high = finished.startup_max if high is None else max(high, finished.startup_max)
+    if not count:
+        return None
+    return (f"Arranque por URL: media {total / count * 1000:.0f} ms, "
+            f"mín {low * 1000:.0f} ms, máx {high * 1000:.0f} ms ({count} trabajos)")
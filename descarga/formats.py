@@ -0,0 +1,186 @@
+# descarga/formats.py
+"""Planificador de formatos: remux (copia de pistas) antes que recodificar"""
+import re
+from dataclasses import dataclass
+
+# Códecs que cada contenedor admite sin recodificar (prefijo del códec de yt-dlp).
+# None significa que el contenedor acepta cualquier códec (Matroska)
+CONTAINER_CODECS = {
+    'mp4': (('avc1', 'avc3', 'h264', 'hev1', 'hvc1', 'h265', 'av01'), ('mp4a', 'aac', 'mp3', 'ac-3', 'ec-3')),
+    'webm': (('vp8', 'vp9', 'vp09', 'av01'), ('opus', 'vorbis')),
+    'mkv': (None, None),
+    'avi': (('avc1', 'h264', 'mp4v', 'mpeg4', 'xvid'), ('mp3', 'ac-3')),
+}
+
+# Modelo de coste para estimar el tiempo ahorrado: recodificar 1080p con x264
+# va aproximadamente a tiempo real en una CPU de escritorio y escala con los
+# píxeles; un remux solo copia bytes
+TRANSCODE_REALTIME_1080P = 1.0
+REMUX_BYTES_PER_SECOND = 150e6
+
+HEIGHT_RE = re.compile(r'^(\d+)p$')
+
+
+@dataclass
+class FormatPlan:
+    """Decisión del planificador para un trabajo"""
+    action: str               # 'remux' o 'recodificar'
+    container: str
+    selector: str = None      # valor de -f; None conserva el del comando
+    description: str = ''
+    saved_seconds: float = None
+
+    def describe(self):
+        if self.action == 'remux':
+            text = f"🎞️ Formato: remux a {self.container} sin recodificar ({self.description})"
+            if self.saved_seconds:
+                text += f" · ahorro estimado ~{format_duration(self.saved_seconds)} de CPU"
+            return text
+        return f"🎞️ Formato: recodificación a {self.container} necesaria ({self.description})"
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} min {seconds:02d} s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} h {minutes:02d} min"
+
+
+def codec_name(codec):
+    """'avc1.64001F' -> 'avc1'; None si no hay pista o no se conoce"""
+    if not codec or codec == 'none':
+        return None
+    return codec.split('.')[0].lower()
+
+
+def _fits(codec, allowed):
+    return allowed is None or (codec is not None and codec.startswith(allowed))
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') != 'none' and fmt.get('video_ext') != 'none'
+
+
+def _has_audio(fmt):
+    # yt-dlp pone audio_ext 'none' también cuando no conoce el códec; solo
+    # acodec 'none' indica de verdad que no hay pista de audio
+    return fmt.get('acodec') != 'none'
+
+
+def _compatible(fmt, container, video=True, audio=True):
+    """¿Puede la pista (o pistas) del formato ir al contenedor con solo copiarla?"""
+    video_codecs, audio_codecs = CONTAINER_CODECS[container]
+    vcodec, acodec = codec_name(fmt.get('vcodec')), codec_name(fmt.get('acodec'))
+    if vcodec is None and acodec is None:
+        # Sin información de códecs: solo es seguro si ya está en el contenedor
+        return fmt.get('ext') == container
+    if video and not _fits(vcodec, video_codecs):
+        return False
+    if audio and not _fits(acodec, audio_codecs):
+        return False
+    return True
+
+
+def fits_container(video, audio, container):
+    """¿Caben un formato de video y uno de audio en el contenedor con solo copiar las pistas?"""
+    if container not in CONTAINER_CODECS:
+        return False
+    return _compatible(video, container, audio=False) and _compatible(audio, container, video=False)
+
+
+def _quality_key(fmt):
+    return (fmt.get('height') or 0, fmt.get('tbr') or 0, fmt.get('filesize') or fmt.get('filesize_approx') or 0)
+
+
+def _height_limit(quality):
+    match = HEIGHT_RE.match(quality or '')
+    return int(match.group(1)) if match else None
+
+
+def _codecs(*formats):
+    names = []
+    for fmt in formats:
+        for key in ('vcodec', 'acodec'):
+            name = codec_name(fmt.get(key))
+            if name:
+                names.append(name)
+    return '+'.join(names) or formats[0].get('ext') or '?'
+
+
+def _estimate_saved(info, height, size):
+    duration = info.get('duration')
+    if not duration or not height:
+        return None
+    pixels = (height * 16 / 9) * height
+    transcode = duration * pixels / (1920 * 1080) / TRANSCODE_REALTIME_1080P
+    remux = (size or 0) / REMUX_BYTES_PER_SECOND
+    return max(transcode - remux, 0)
+
+
+def plan_format(info, quality, container):
+    """Elige formatos que quepan en el contenedor sin recodificar, o None si no aplica.
+
+    Se busca la misma altura que elegiría la calidad pedida; si a esa altura
+    hay un formato combinado (o un video y un audio por separado) con códecs
+    que admite el contenedor, se descarga ese y se remuxea. Si no, se
+    recodifica como antes.
+    """
+    if container not in CONTAINER_CODECS:
+        return None
+    formats = [fmt for fmt in (info.get('formats') or [info]) if fmt.get('format_id')]
+    limit = _height_limit(quality)
+    videos = [fmt for fmt in formats if _has_video(fmt) and (limit is None or (fmt.get('height') or 0) <= limit)]
+    if not videos:
+        return None
+    pick = min if quality == 'worst' else max
+    height = pick(fmt.get('height') or 0 for fmt in videos)
+    at_height = [fmt for fmt in videos if (fmt.get('height') or 0) == height]
+    label = f"{height}p" if height else 'altura desconocida'
+
+    combined = [fmt for fmt in at_height if _has_audio(fmt) and _compatible(fmt, container)]
+    if combined:
+        fmt = pick(combined, key=_quality_key)
+        size = fmt.get('filesize') or fmt.get('filesize_approx')
+        return FormatPlan('remux', container, fmt['format_id'], f"{_codecs(fmt)}, {label}",
+                          _estimate_saved(info, height, size))
+
+    video_only = [fmt for fmt in at_height if not _has_audio(fmt) and _compatible(fmt, container, audio=False)]
+    audios = [fmt for fmt in formats if not _has_video(fmt) and _has_audio(fmt)
+              and _compatible(fmt, container, video=False)]
+    if video_only and audios:
+        video = pick(video_only, key=_quality_key)
+        audio = max(audios, key=lambda fmt: fmt.get('abr') or fmt.get('tbr') or 0)
+        size = sum(fmt.get('filesize') or fmt.get('filesize_approx') or 0 for fmt in (video, audio))
+        return FormatPlan('remux', container, f"{video['format_id']}+{audio['format_id']}",
+                          f"{_codecs(video, audio)}, {label}", _estimate_saved(info, height, size))
+
+    available = sorted({_codecs(fmt) for fmt in at_height})
+    return FormatPlan('recodificar', container,
+                      description=f"a {label} solo hay {', '.join(available)}")
+
+
+def recode_target(cmd):
+    """Contenedor de --recode-video en el comando, o None"""
+    if '--recode-video' in cmd:
+        index = cmd.index('--recode-video')
+        if index + 1 < len(cmd):
+            return cmd[index + 1]
+    return None
+
+
+def apply_plan(cmd, plan):
+    """Devuelve el comando con el plan aplicado (-f y --remux-video en vez de --recode-video)"""
+    if plan.action != 'remux':
+        return list(cmd)
+    cmd = list(cmd)
+    cmd[cmd.index('--recode-video')] = '--remux-video'
+    if plan.selector:
+        if '-f' in cmd:
+            cmd[cmd.index('-f') + 1] = plan.selector
+        else:
+            cmd[1:1] = ['-f', plan.selector]
+    return cmd
@@ -0,0 +1,126 @@
+# descarga/fragments.py
+"""Fragmentos simultáneos (HLS/DASH) ajustados por host según el rendimiento y los errores observados"""
+import json
+import os
+import re
+import threading
+
+from descarga.paths import cache_dir
+
+FRAGMENTS_CACHE_NAME = 'fragmentos.json'
+
+DEFAULT_FRAGMENTS = 4
+MIN_FRAGMENTS = 1
+MAX_FRAGMENTS = 16
+
+# Reintentos u omisiones de fragmentos, tal como los escribe yt-dlp
+FRAGMENT_ERROR_RE = re.compile(r'Retrying fragment|Skipping fragment')
+
+# Errores por fragmento por encima de los cuales el nivel se considera excesivo
+ERROR_RATE_LIMIT = 0.05
+# Un nivel más alto solo se prefiere si rinde al menos esta proporción más
+GAIN_THRESHOLD = 1.1
+# Peso de cada descarga nueva en la media del nivel
+ALPHA = 0.5
+
+
+def with_fragments(cmd, level):
+    """Comando con --concurrent-fragments; yt-dlp lo ignora si el formato no va por fragmentos"""
+    return list(cmd) + ['--concurrent-fragments', str(level)]
+
+
+def has_fragments_option(cmd):
+    """¿Fija ya el comando los fragmentos simultáneos (ajuste manual)?"""
+    return '--concurrent-fragments' in cmd or '-N' in cmd
+
+
+class FragmentTuner:
+    """Aprende por host cuántos fragmentos bajar a la vez y lo guarda entre sesiones.
+
+    Tras cada descarga por fragmentos se actualiza la media de rendimiento
+    (bytes/s) y de errores (reintentos por fragmento) del nivel usado. Se
+    sube al doble mientras el nivel actual sea el mejor y el siguiente no se
+    haya probado; un nivel con demasiados errores se descarta y se baja a la
+    mitad. Si hay varios niveles medidos, se queda el más bajo que no rinda
+    claramente menos (GAIN_THRESHOLD) que uno más alto.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), FRAGMENTS_CACHE_NAME)
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def level(self, host):
+        """Fragmentos simultáneos a usar con el host"""
+        with self._lock:
+            entry = self._load().get(host)
+        return entry['level'] if entry else DEFAULT_FRAGMENTS
+
+    def record(self, host, level, throughput, fragments, errors):
+        """Registra una descarga por fragmentos; devuelve un aviso si cambia el nivel del host"""
+        if not fragments or not throughput:
+            return None
+        with self._lock:
+            entry = self._load().setdefault(host, {'level': level, 'levels': {}})
+            levels = entry['levels']
+            stats = levels.get(str(level))
+            error_rate = errors / fragments
+            if stats is None:
+                stats = levels[str(level)] = {'speed': throughput, 'error_rate': error_rate, 'samples': 0}
+            else:
+                stats['speed'] += ALPHA * (throughput - stats['speed'])
+                stats['error_rate'] += ALPHA * (error_rate - stats['error_rate'])
+            stats['samples'] += 1
+            previous = entry['level']
+            entry['level'] = self._choose(levels, level)
+            self._save()
+        if entry['level'] == previous:
+            return None
+        return (f"🧩 {host}: {entry['level']} fragmentos simultáneos (antes {previous}; "
+                f"{throughput / 1e6:.1f} MB/s y {error_rate:.0%} de reintentos con {level})")
+
+    @staticmethod
+    def _choose(levels, level):
+        stats = levels[str(level)]
+        if stats['error_rate'] > ERROR_RATE_LIMIT:
+            return max(MIN_FRAGMENTS, level // 2)
+        best = None
+        for candidate in sorted(int(key) for key in levels):
+            candidate_stats = levels[str(candidate)]
+            if candidate_stats['error_rate'] > ERROR_RATE_LIMIT:
+                continue
+            if best is None or candidate_stats['speed'] > levels[str(best)]['speed'] * GAIN_THRESHOLD:
+                best = candidate
+        higher = min(level * 2, MAX_FRAGMENTS)
+        if best == level and higher > level and str(higher) not in levels:
+            # El nivel actual es el mejor conocido: probar el doble
+            return higher
+        return best or level
+
+    def forget(self, host=None):
+        """Olvida lo aprendido de un host (o de todos)"""
+        with self._lock:
+            data = self._load()
+            if host is None:
+                data.clear()
+            else:
+                data.pop(host, None)
+            self._save()
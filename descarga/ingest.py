@@ -0,0 +1,116 @@
+# descarga/ingest.py
+"""Lectura incremental de listas de URLs: genera trabajos bajo demanda y descarta duplicados"""
+import hashlib
+import io
+import itertools
+import sqlite3
+import sys
+import threading
+
+from descarga.commands import build_command, parse_url, split_urls
+from descarga.scheduler import Job
+
+# Páginas de SQLite en memoria para el conjunto de URLs vistas; lo que no cabe
+# va a un archivo temporal, así que la memoria no crece con la lista
+SEEN_CACHE_KIB = 2048
+
+
+class SeenSet:
+    """Conjunto exacto de claves ya vistas con memoria acotada.
+
+    Guarda un resumen de 64 bits de cada clave en una base SQLite temporal
+    (se borra al cerrarla); SQLite mantiene en memoria solo SEEN_CACHE_KIB y
+    el resto queda en disco.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # '' crea una base temporal en disco, privada de esta conexión
+        self._conn = sqlite3.connect('', check_same_thread=False)
+        self._conn.execute(f'PRAGMA cache_size=-{SEEN_CACHE_KIB}')
+        self._conn.execute('CREATE TABLE vistas (clave INTEGER PRIMARY KEY)')
+
+    @staticmethod
+    def _digest(key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big', signed=True)
+
+    def add(self, key):
+        """Añade la clave; devuelve False si ya estaba"""
+        with self._lock:
+            cursor = self._conn.execute('INSERT OR IGNORE INTO vistas (clave) VALUES (?)', (self._digest(key),))
+            return cursor.rowcount == 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def iter_text_lines(text):
+    """Recorre un texto línea a línea sin crear la lista completa de líneas"""
+    return iter(io.StringIO(text))
+
+
+def iter_file_lines(paths, stdin=None):
+    """Recorre las líneas de varios archivos, abriendo cada uno al llegar a él ('-' es stdin)"""
+    def lines_of(path):
+        if path == '-':
+            yield from stdin or sys.stdin
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from f
+    return itertools.chain.from_iterable(lines_of(path) for path in paths)
+
+
+class UrlSource:
+    """Genera un Job por URL nueva a medida que el planificador los pide.
+
+    Las líneas se leen de una en una (cada línea puede tener varias URLs
+    separadas por comas), de modo que una lista de 50.000 URLs no se carga
+    ni se convierte en comandos de golpe. Los contadores permiten mostrar el
+    avance de la lectura sin escribir cada URL en la terminal. first_index
+    numera los trabajos a continuación de otros (envíos al servicio local).
+    """
+
+    def __init__(self, lines, options, dedupe=True, first_index=0):
+        self.lines = lines
+        self.options = options
+        self.first_index = first_index
+        self.seen = SeenSet() if dedupe else None
+        self.read = 0
+        self.duplicates = 0
+        self.generated = 0
+        self.vimeo = 0
+        self.exhausted = False
+
+    def __iter__(self):
+        try:
+            for line in self.lines:
+                for entry in split_urls(line):
+                    url, referer, notes = parse_url(entry)
+                    self.read += 1
+                    if notes:
+                        self.vimeo += 1
+                    if self.seen is not None and not self.seen.add(f"{url}\n{referer or ''}"):
+                        self.duplicates += 1
+                        continue
+                    job = Job(self.first_index + self.generated, build_command(url, referer, self.options), url, referer)
+                    self.generated += 1
+                    yield job
+        finally:
+            self.exhausted = True
+            if self.seen is not None:
+                self.seen.close()
+
+    def describe(self):
+        """Resumen de la lectura: URLs leídas, duplicadas y trabajos generados"""
+        text = f"📥 {self.read} URL(s) leídas · {self.duplicates} duplicada(s) · {self.generated} en cola"
+        if self.vimeo:
+            text += f" · {self.vimeo} con referer de Vimeo"
+        if not self.exhausted:
+            text += " · leyendo..."
+        return text
+
+    def as_dict(self):
+        return {'read': self.read, 'duplicates': self.duplicates, 'queued': self.generated,
+                'vimeo_referers': self.vimeo, 'exhausted': self.exhausted}
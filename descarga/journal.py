@@ -0,0 +1,177 @@
+# descarga/journal.py
+"""Diario persistente de trabajos (SQLite) para reanudar lotes interrumpidos"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from descarga.scheduler import (
+    Job, SchedulerListener, PENDIENTE, EJECUTANDO, COMPLETADO, CANCELADO
+)
+
+JOURNAL_NAME = '.video_descarga_journal.sqlite'
+
+# Trabajos que se ofrecen para reanudar: nunca empezaron, quedaron a medias
+# por un cierre inesperado o los detuvo el usuario
+ESTADOS_REANUDABLES = (PENDIENTE, EJECUTANDO, CANCELADO)
+DESCARTADO = 'descartado'
+
+DESTINATION_MARKER = '[download] Destination:'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    lote TEXT NOT NULL,
+    url TEXT NOT NULL,
+    referer TEXT,
+    cmd TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    parciales TEXT NOT NULL DEFAULT '[]',
+    codigo INTEGER,
+    error TEXT,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trabajos_estado ON trabajos (estado);
+"""
+
+
+def journal_path(output_dir):
+    return os.path.join(output_dir, JOURNAL_NAME)
+
+
+class JobJournal(SchedulerListener):
+    """Registra cada trabajo, sus opciones, su estado y sus archivos parciales.
+
+    Cada cambio se confirma en el momento (modo WAL), de modo que tras un
+    cierre inesperado el diario refleja lo que estaba en curso. Se conecta al
+    planificador como un receptor de eventos más. Al abrirlo se borran los
+    lotes ya terminados (compact), así que no crece con cada lote.
+    """
+
+    def __init__(self, output_dir):
+        self.path = journal_path(output_dir)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self.compact()
+
+    @classmethod
+    def exists(cls, output_dir):
+        return os.path.exists(journal_path(output_dir))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Registro de trabajos --------------------------------------------
+
+    def add_jobs(self, jobs, batch=None):
+        """Registra trabajos nuevos y les asigna journal_id"""
+        batch = batch or time.strftime('%Y-%m-%d %H:%M:%S')
+        now = time.time()
+        with self._lock, self._conn:
+            for job in jobs:
+                if job.journal_id is not None:
+                    continue
+                cursor = self._conn.execute(
+                    'INSERT INTO trabajos (lote, url, referer, cmd, estado, creado, actualizado) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (batch, job.url, job.referer, json.dumps(job.cmd), job.state, now, now)
+                )
+                job.journal_id = cursor.lastrowid
+
+    def unfinished(self):
+        """Devuelve las filas de trabajos que se pueden reanudar, en orden de alta"""
+        placeholders = ', '.join('?' for _ in ESTADOS_REANUDABLES)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT id, url, referer, cmd, estado, parciales FROM trabajos '
+                f'WHERE estado IN ({placeholders}) ORDER BY id',
+                ESTADOS_REANUDABLES
+            ).fetchall()
+        return [
+            {'id': row[0], 'url': row[1], 'referer': row[2], 'cmd': json.loads(row[3]),
+             'estado': row[4], 'parciales': json.loads(row[5])}
+            for row in rows
+        ]
+
+    def resume_jobs(self, executable=None):
+        """Crea trabajos a partir de las filas pendientes del diario.
+
+        Si se indica, el ejecutable de yt-dlp se sustituye por el actual, ya que
+        el guardado puede no existir tras una actualización.
+        """
+        jobs = []
+        for row in self.unfinished():
+            cmd = row['cmd']
+            if executable:
+                cmd = [executable] + cmd[1:]
+            job = Job(len(jobs), cmd, row['url'], row['referer'])
+            job.journal_id = row['id']
+            job.partial_files = row['parciales']
+            jobs.append(job)
+        return jobs
+
+    def discard_unfinished(self):
+        """Marca como descartados los trabajos pendientes (el usuario no quiere reanudarlos)"""
+        placeholders = ', '.join('?' for _ in ESTADOS_REANUDABLES)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f'UPDATE trabajos SET estado = ?, actualizado = ? WHERE estado IN ({placeholders})',
+                (DESCARTADO, time.time()) + ESTADOS_REANUDABLES
+            )
+
+    def compact(self):
+        """Borra los lotes sin nada que reanudar (todos sus trabajos terminaron o se descartaron); cuántas filas"""
+        placeholders = ', '.join('?' for _ in ESTADOS_REANUDABLES)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f'DELETE FROM trabajos WHERE lote NOT IN '
+                f'(SELECT lote FROM trabajos WHERE estado IN ({placeholders}))',
+                ESTADOS_REANUDABLES
+            )
+        return cursor.rowcount
+
+    def _update(self, job, **fields):
+        job_id = job.journal_id
+        if job_id is None:
+            return
+        fields['actualizado'] = time.time()
+        columns = ', '.join(f'{name} = ?' for name in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f'UPDATE trabajos SET {columns} WHERE id = ?', tuple(fields.values()) + (job_id,))
+
+    # --- Eventos del planificador ----------------------------------------
+
+    def on_job_queued(self, job):
+        self.add_jobs([job])
+
+    def on_job_started(self, job):
+        self._update(job, estado=EJECUTANDO)
+
+    def on_job_log(self, job, line):
+        if not line.startswith(DESTINATION_MARKER):
+            return
+        path = line.split(':', 1)[1].strip()
+        if path not in job.partial_files:
+            job.partial_files.append(path)
+            self._update(job, parciales=json.dumps(job.partial_files))
+
+    def on_job_retry(self, job):
+        # Vuelve a la cola: si la aplicación se cierra antes, se reanuda como pendiente
+        self._update(job, estado=job.state)
+
+    def on_job_finished(self, job):
+        if job.state == COMPLETADO:
+            # Los parciales ya se convirtieron en el archivo final
+            self._update(job, estado=job.state, codigo=job.returncode, error=None, parciales='[]')
+        elif job.state == CANCELADO and not job.keep_partial:
+            # Cancelado borrando los parciales: no hay nada que reanudar
+            self._update(job, estado=DESCARTADO, codigo=job.returncode, error=job.error, parciales='[]')
+        else:
+            self._update(job, estado=job.state, codigo=job.returncode, error=job.error)
@@ -0,0 +1,194 @@
+# descarga/limits.py
+"""Reparto del ancho de banda entre trabajos y límite de conexiones por host, fijo o adaptativo"""
+import re
+import time
+
+# Respuestas con las que un sitio indica que recibe demasiadas peticiones
+THROTTLE_RE = re.compile(r'HTTP Error (429|403)')
+
+# Pausa de un host tras un 429/403: se duplica con cada aviso seguido
+BACKOFF_INITIAL = 5.0
+BACKOFF_MAX = 300.0
+
+# Trabajos completados sin avisos antes de devolver una conexión al host
+RECOVER_AFTER = 3
+
+# Si con una conexión más el host rinde menos de esta fracción que con una
+# menos, se considera que el sitio penaliza la concurrencia
+THROUGHPUT_DROP = 0.7
+# Peso de cada muestra en la media móvil del rendimiento por host
+THROUGHPUT_ALPHA = 0.3
+
+# Unidades decimales, como el resto de cifras de la aplicación (1 MB = 10^6 bytes)
+RATE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?(?:/s)?\s*$', re.IGNORECASE)
+RATE_UNITS = {'': 1, 'k': 1e3, 'm': 1e6, 'g': 1e9}
+
+
+def parse_rate(text):
+    """'5M', '500K', '1.5MB/s' o '200000' -> bytes por segundo; 0 o vacío -> None"""
+    if text is None or not str(text).strip():
+        return None
+    match = RATE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Límite de velocidad no válido: {text}")
+    rate = float(match.group(1)) * RATE_UNITS[match.group(2).lower()]
+    return rate or None
+
+
+def format_rate(rate):
+    if not rate:
+        return 'sin límite'
+    if rate >= 1e6:
+        return f"{rate / 1e6:.1f} MB/s"
+    return f"{rate / 1e3:.0f} KB/s"
+
+
+class BandwidthBudget:
+    """Límite global de ancho de banda repartido a partes iguales entre las descargas activas.
+
+    Los motores que pueden cambiar el límite de un trabajo en marcha
+    (engine.live_rate_limit) reciben limit / descargas activas y se reajustan
+    cada vez que una empieza o termina. Con yt-dlp externo el límite se fija
+    al lanzar (--limit-rate), así que se reparte entre las descargas que
+    habrá a la vez (huecos libres y trabajos en espera) para no pasarse del
+    total cuando se llenan los huecos.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit or None
+
+    def assign(self, launched, running, pending, max_workers, live):
+        """Fija job.rate_limit del trabajo recién lanzado y, si el motor lo admite, del resto"""
+        if not self.limit:
+            return
+        if live:
+            share = self.limit / max(1, len(running))
+            for job in running:
+                job.rate_limit = share
+        else:
+            expected = min(max_workers, len(running) + pending)
+            launched.rate_limit = self.limit / max(1, expected)
+
+
+class HostLimiter:
+    """Conexiones simultáneas por host y, en modo adaptativo, pausas y recortes por host.
+
+    Un trabajo cuenta contra el host de su URL y contra el de su referer
+    (job.hosts): varios videos de Vimeo embebidos en la misma página de un
+    curso comparten el límite de ese sitio aunque vengan de CDN distintas.
+
+    En modo adaptativo, un HTTP 429/403 reduce a la mitad el máximo del host
+    y lo pausa (BACKOFF_INITIAL, duplicándose hasta BACKOFF_MAX); si el
+    rendimiento conjunto del host cae al añadir una conexión, el máximo baja
+    a la cantidad anterior. Cada RECOVER_AFTER trabajos completados sin
+    avisos se devuelve una conexión, hasta el máximo configurado.
+
+    No usa lock propio: el planificador lo llama con su lock tomado.
+    """
+
+    def __init__(self, max_per_host=2, adaptive=False):
+        self.max_per_host = max(1, int(max_per_host))
+        self.adaptive = adaptive
+        self._caps = {}
+        self._blocked_until = {}
+        self._strikes = {}
+        self._successes = {}
+        self._throughput = {}
+
+    def cap(self, host):
+        return self._caps.get(host, self.max_per_host)
+
+    def allows(self, job, running):
+        """¿Puede empezar el trabajo sin pasar el máximo ni la pausa de ninguno de sus hosts?"""
+        now = time.monotonic()
+        for host in job.hosts:
+            if self._blocked_until.get(host, 0.0) > now:
+                return False
+            if sum(1 for other in running if host in other.hosts) >= self.cap(host):
+                return False
+        return True
+
+    def next_wakeup(self):
+        """Segundos hasta que acaba la pausa más próxima, o None si no hay ninguna"""
+        now = time.monotonic()
+        pending = [until - now for until in self._blocked_until.values() if until > now]
+        return max(min(pending), 0.01) if pending else None
+
+    def describe(self):
+        """Hosts con el máximo reducido o en pausa, o '' si ninguno"""
+        now = time.monotonic()
+        parts = []
+        for host in sorted(set(self._caps) | set(self._blocked_until)):
+            until = self._blocked_until.get(host, 0.0)
+            if host not in self._caps and until <= now:
+                continue
+            text = f"{host} {self.cap(host)}/{self.max_per_host}"
+            if until > now:
+                text += f" (pausa {until - now:.0f} s)"
+            parts.append(text)
+        return ', '.join(parts)
+
+    def job_line(self, job, line):
+        """Revisa una línea de salida; devuelve un aviso para el log si el host pide frenar"""
+        if not self.adaptive:
+            return None
+        match = THROTTLE_RE.search(line)
+        if match is None:
+            return None
+        host = job.host
+        now = time.monotonic()
+        self._successes[host] = 0
+        if self._blocked_until.get(host, 0.0) > now:
+            # yt-dlp reintenta y repite el error; la pausa en curso ya lo cubre
+            return None
+        strikes = self._strikes.get(host, 0) + 1
+        self._strikes[host] = strikes
+        delay = min(BACKOFF_INITIAL * 2 ** (strikes - 1), BACKOFF_MAX)
+        self._blocked_until[host] = now + delay
+        self._caps[host] = max(1, self.cap(host) // 2)
+        return (f"🐢 {host} respondió HTTP {match.group(1)}: máximo {self.cap(host)} por host "
+                f"y pausa de {delay:.0f} s antes de abrir más conexiones")
+
+    def job_finished(self, job, completed):
+        """Cuenta un trabajo terminado; devuelve un aviso si el host recupera una conexión"""
+        if not self.adaptive or not completed:
+            return None
+        host = job.host
+        self._successes[host] = self._successes.get(host, 0) + 1
+        if self._successes[host] < RECOVER_AFTER or host not in self._caps:
+            return None
+        self._successes[host] = 0
+        self._strikes[host] = max(0, self._strikes.get(host, 0) - 1)
+        cap = self._caps[host] + 1
+        if cap >= self.max_per_host:
+            del self._caps[host]
+        else:
+            self._caps[host] = cap
+        return f"🐇 {host} sin avisos en {RECOVER_AFTER} descargas: máximo {self.cap(host)} por host"
+
+    def sample(self, running):
+        """Actualiza el rendimiento por host y nivel de concurrencia; devuelve (trabajo, aviso) o None"""
+        if not self.adaptive:
+            return None
+        by_host = {}
+        for job in running:
+            by_host.setdefault(job.host, []).append(job)
+        for host, jobs in by_host.items():
+            speeds = [job.bytes.speed for job in jobs if job.bytes.speed]
+            if len(speeds) < len(jobs):
+                # Alguna conexión aún no informa de velocidad: la muestra no es comparable
+                continue
+            level = len(jobs)
+            levels = self._throughput.setdefault(host, {})
+            previous = levels.get(level)
+            total = sum(speeds)
+            levels[level] = total if previous is None else previous + THROUGHPUT_ALPHA * (total - previous)
+            below = levels.get(level - 1)
+            if level > 1 and below and levels[level] < THROUGHPUT_DROP * below and level <= self.cap(host):
+                self._caps[host] = level - 1
+                self._successes[host] = 0
+                # Si el host recupera esa conexión, se vuelve a medir desde cero
+                del levels[level]
+                return jobs[0], (f"📉 {host} rinde menos con {level} conexiones que con {level - 1}: "
+                                 f"máximo {level - 1} por host")
+        return None
@@ -0,0 +1,81 @@
+# descarga/logbuffer.py
+"""Canal de log con búfer circular: los workers escriben y la interfaz vacía por lotes"""
+import threading
+from collections import deque
+
+from descarga.progress import parse_percent
+
+
+class LogBuffer:
+    """Búfer circular de líneas de log, seguro entre hilos.
+
+    - Las líneas de progreso ('[download] xx%') de un mismo trabajo que aún
+      no se han vaciado se sustituyen en lugar de acumularse.
+    - Si se llena, se descartan las líneas más antiguas y se cuentan.
+    - Opcionalmente, todas las líneas (sin colapsar) se escriben en un archivo.
+    """
+
+    def __init__(self, max_lines=2000):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=max_lines)
+        # Entrada de progreso pendiente de vaciar por clave (trabajo)
+        self._progress = {}
+        self._dropped = 0
+        self._file = None
+
+    def write(self, line, key=None):
+        """Añade una línea; key identifica el trabajo para colapsar su progreso"""
+        is_progress = key is not None and parse_percent(line) is not None
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + '\n')
+            if is_progress:
+                entry = self._progress.get(key)
+                if entry is not None:
+                    entry[1] = line
+                    return
+            elif key is not None:
+                self._progress.pop(key, None)
+            if len(self._entries) == self._entries.maxlen:
+                old = self._entries[0]
+                if self._progress.get(old[0]) is old:
+                    del self._progress[old[0]]
+                self._dropped += 1
+            entry = [key, line, is_progress]
+            self._entries.append(entry)
+            if is_progress:
+                self._progress[key] = entry
+
+    def write_file(self, line):
+        """Escribe una línea solo en el archivo de log (si hay uno abierto)"""
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + '\n')
+
+    def drain(self):
+        """Devuelve (entradas, descartadas) y vacía el búfer.
+
+        Cada entrada es una tupla (clave, línea, es_progreso).
+        """
+        with self._lock:
+            entries = [tuple(entry) for entry in self._entries]
+            dropped = self._dropped
+            self._entries.clear()
+            self._progress.clear()
+            self._dropped = 0
+            if self._file is not None:
+                self._file.flush()
+        return entries, dropped
+
+    def open_file(self, path):
+        """Empieza a volcar el log completo a un archivo"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def close_file(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,200 @@
+# descarga/metadata.py
+"""Caché de metadatos (info JSON de yt-dlp) y extracción anticipada de la cola"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from descarga.paths import cache_dir
+from descarga.progress import FASE_EXTRACCION
+
+# Las URL de los formatos suelen caducar en pocas horas; una info más antigua
+# obliga a yt-dlp a volver a extraer al descargar
+DEFAULT_TTL = 30 * 60
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+INFO_SUFFIX = '.info.json'
+
+
+def cache_key(url, referer=None):
+    """Clave de caché: URL más referer (la misma URL con otro referer puede dar otra info)"""
+    raw = f"{url}\n{referer or ''}".encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+
+def summarize_info(info):
+    """Extrae de una info JSON los datos que usa la cola: título, tamaño, duración e IDs"""
+    formats = info.get('requested_formats') or [info]
+    size = 0
+    for fmt in formats:
+        size += fmt.get('filesize') or fmt.get('filesize_approx') or 0
+    if not size:
+        size = info.get('filesize') or info.get('filesize_approx') or 0
+    return {
+        'title': info.get('title'),
+        'size': size or None,
+        'duration': info.get('duration'),
+        'extractor_key': info.get('extractor_key'),
+        'id': info.get('id'),
+        'ext': info.get('ext'),
+    }
+
+
+class MetadataCache:
+    """Caché en disco de info JSON con caducidad (TTL) y límite de tamaño.
+
+    Cada entrada es un archivo <clave>.info.json. El índice en memoria mantiene
+    el orden de uso; al superar max_bytes se expulsan las menos usadas.
+    """
+
+    def __init__(self, directory=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or cache_dir('metadatos')
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # clave -> (tamaño, momento de creación)
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(INFO_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name[:-len(INFO_SUFFIX)], st.st_size))
+        for mtime, key, size in sorted(entries):
+            self._index[key] = (size, mtime)
+            self._bytes += size
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key + INFO_SUFFIX)
+
+    def get_path(self, url, referer=None):
+        """Ruta de la info en caché si existe y no ha caducado, o None"""
+        key = cache_key(url, referer)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl:
+                self._remove(key)
+                return None
+            self._index.move_to_end(key)
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def get(self, url, referer=None):
+        path = self.get_path(url, referer)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url, referer, info):
+        """Guarda la info y devuelve su ruta"""
+        key = cache_key(url, referer)
+        path = self.path_for(key)
+        data = json.dumps(info, ensure_ascii=False).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if key in self._index:
+                self._bytes -= self._index.pop(key)[0]
+            self._index[key] = (len(data), time.time())
+            self._bytes += len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        now = time.time()
+        for key, (_, created) in list(self._index.items()):
+            if now - created > self.ttl:
+                self._remove(key)
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            self._remove(next(iter(self._index)))
+
+    def _remove(self, key):
+        size, _ = self._index.pop(key)
+        self._bytes -= size
+        try:
+            os.remove(self.path_for(key))
+        except OSError:
+            pass
+
+
+class MetadataPrefetcher:
+    """Extrae en paralelo la info de los próximos trabajos de la cola.
+
+    La extracción la hace el motor (engine.extract_info), de modo que el motor
+    integrado reutiliza sus instancias de YoutubeDL. Cuando un trabajo empieza,
+    info_for() espera a la extracción en curso en lugar de repetirla.
+    """
+
+    def __init__(self, engine, cache=None, max_workers=2, on_info=None):
+        self.engine = engine
+        self.cache = cache or MetadataCache()
+        self.on_info = on_info
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def schedule(self, jobs):
+        """Programa la extracción de los trabajos que aún no tienen info"""
+        for job in jobs:
+            with self._lock:
+                if job.key in self._futures:
+                    continue
+                self._futures[job.key] = self._executor.submit(self._fetch, job)
+
+    def info_for(self, job, timeout=None):
+        """Ruta de la info del trabajo (esperando a su extracción si está en curso), o None"""
+        with self._lock:
+            future = self._futures.get(job.key)
+        if future is not None:
+            try:
+                return future.result(timeout=timeout)
+            except Exception:
+                return None
+        return self.cache.get_path(job.url, job.referer)
+
+    def forget(self, job):
+        """Olvida la extracción de un trabajo terminado (la info sigue en la caché)"""
+        with self._lock:
+            self._futures.pop(job.key, None)
+
+    def shutdown(self):
+        with self._lock:
+            futures = list(self._futures.values())
+        for future in futures:
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _fetch(self, job):
+        path = self.cache.get_path(job.url, job.referer)
+        if path is None:
+            start = time.monotonic()
+            info = self.engine.extract_info(job)
+            job.timings.add(FASE_EXTRACCION, time.monotonic() - start)
+            if not info:
+                return None
+            path = self.cache.put(job.url, job.referer, info)
+        else:
+            info = self.cache.get(job.url, job.referer)
+            if info is None:
+                return None
+        job.set_info(summarize_info(info))
+        if self.on_info is not None:
+            self.on_info(job)
+        return path
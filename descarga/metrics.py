@@ -0,0 +1,188 @@
+# descarga/metrics.py
+"""Métricas por fase de cada trabajo: agregados por host, histogramas y exportación"""
+import json
+import os
+import threading
+import time
+
+from descarga.formats import format_duration
+from descarga.progress import FASE_DESCARGA, PHASE_LABELS, PHASES
+from descarga.scheduler import SchedulerListener
+
+METRICS_JSONL_NAME = 'video_descarga_metricas.jsonl'
+METRICS_PROM_NAME = 'video_descarga.prom'
+METRIC_PREFIX = 'video_descarga'
+
+# Límites (en segundos) de los cubos del histograma de duración por fase
+HISTOGRAM_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# Intervalo mínimo entre dos escrituras del archivo de Prometheus
+PROM_WRITE_INTERVAL = 5.0
+
+
+class PhaseStats:
+    """Suma, cuenta, bytes e histograma de una fase en un host"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(HISTOGRAM_BUCKETS)
+
+    def add(self, seconds, count_bytes):
+        self.count += 1
+        self.seconds += seconds
+        self.bytes += count_bytes or 0
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_label(value)}"' for key, value in labels.items()) + '}'
+
+
+class MetricsRecorder(SchedulerListener):
+    """Recoge los tiempos por fase (job.timings) de cada trabajo terminado.
+
+    Guarda agregados por host y fase con histograma de duraciones; opcionalmente
+    añade una línea JSON por trabajo a jsonl_path y mantiene en prom_path un
+    archivo de texto en formato Prometheus (para el textfile collector de
+    node_exporter). Solo conserva agregados, no los trabajos.
+    """
+
+    def __init__(self, jsonl_path=None, prom_path=None):
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+        self._phases = {}
+        self._states = {}
+        self._last_prom = 0.0
+
+    @classmethod
+    def in_directory(cls, directory):
+        """Exporta a los archivos estándar dentro de la carpeta de descarga"""
+        return cls(os.path.join(directory, METRICS_JSONL_NAME), os.path.join(directory, METRICS_PROM_NAME))
+
+    def on_job_finished(self, job):
+        record = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'number': job.number, 'url': job.url,
+            'host': job.host, 'state': job.state, 'engine_startup': job.startup_seconds,
+            'total_seconds': round(job.elapsed, 3) if job.started_at is not None else None,
+            'phases': job.timings.as_dict(),
+        }
+        with self._lock:
+            key = (job.host, job.state)
+            self._states[key] = self._states.get(key, 0) + 1
+            for phase, seconds in job.timings.seconds.items():
+                self._phases.setdefault((job.host, phase), PhaseStats()).add(seconds, job.timings.bytes.get(phase))
+            if self._jsonl is not None:
+                self._jsonl.write(json.dumps(record, ensure_ascii=False) + '\n')
+                self._jsonl.flush()
+            write_prom = time.monotonic() - self._last_prom >= PROM_WRITE_INTERVAL
+        if write_prom:
+            self.write_prometheus()
+
+    def totals(self):
+        """{fase: PhaseStats} sumando todos los hosts"""
+        with self._lock:
+            items = list(self._phases.items())
+        totals = {}
+        for (_, phase), stats in items:
+            total = totals.setdefault(phase, PhaseStats())
+            total.count += stats.count
+            total.seconds += stats.seconds
+            total.bytes += stats.bytes
+            total.buckets = [a + b for a, b in zip(total.buckets, stats.buckets)]
+        return totals
+
+    def by_host(self):
+        """{host: {fase: PhaseStats}}"""
+        with self._lock:
+            items = list(self._phases.items())
+        hosts = {}
+        for (host, phase), stats in items:
+            hosts.setdefault(host, {})[phase] = stats
+        return hosts
+
+    @staticmethod
+    def _describe(phase, stats):
+        duration = f"{stats.seconds:.1f} s" if stats.seconds < 10 else format_duration(stats.seconds)
+        text = f"{PHASE_LABELS[phase]} {duration}"
+        if stats.bytes:
+            text += f", {stats.bytes / 1e6:.0f} MB"
+            if phase == FASE_DESCARGA and stats.seconds:
+                text += f" a {stats.bytes / stats.seconds / 1e6:.1f} MB/s"
+        return text + f" ({stats.count})"
+
+    def summary_lines(self):
+        """Resumen del lote: tiempo total de cada fase y el desglose por host"""
+        totals = self.totals()
+        if not totals:
+            return []
+        lines = ["⏱️ Tiempo por fase: " + " · ".join(
+            self._describe(phase, totals[phase]) for phase in PHASES if phase in totals)]
+        hosts = self.by_host()
+        if len(hosts) > 1:
+            for host, phases in sorted(hosts.items(), key=lambda item: -sum(s.seconds for s in item[1].values())):
+                lines.append(f"   {host}: " + " · ".join(
+                    self._describe(phase, phases[phase]) for phase in PHASES if phase in phases))
+        return lines
+
+    def as_dict(self):
+        return {host: {phase: {'count': stats.count, 'seconds': round(stats.seconds, 3), 'bytes': stats.bytes}
+                       for phase, stats in phases.items()}
+                for host, phases in self.by_host().items()}
+
+    def prometheus_text(self):
+        """Métricas en formato de texto de Prometheus"""
+        with self._lock:
+            phases = sorted(self._phases.items())
+            states = sorted(self._states.items())
+        name = f"{METRIC_PREFIX}_phase_seconds"
+        lines = [f"# HELP {name} Duración de cada fase de los trabajos por host",
+                 f"# TYPE {name} histogram"]
+        for (host, phase), stats in phases:
+            for bound, count in zip(HISTOGRAM_BUCKETS, stats.buckets):
+                lines.append(f"{name}_bucket{_labels(host=host, phase=phase, le=bound)} {count}")
+            lines.append(f"{name}_bucket{_labels(host=host, phase=phase, le='+Inf')} {stats.count}")
+            lines.append(f"{name}_sum{_labels(host=host, phase=phase)} {stats.seconds:.3f}")
+            lines.append(f"{name}_count{_labels(host=host, phase=phase)} {stats.count}")
+        name = f"{METRIC_PREFIX}_phase_bytes_total"
+        lines += [f"# HELP {name} Bytes descargados o producidos en cada fase por host",
+                  f"# TYPE {name} counter"]
+        for (host, phase), stats in phases:
+            lines.append(f"{name}{_labels(host=host, phase=phase)} {stats.bytes}")
+        name = f"{METRIC_PREFIX}_jobs_total"
+        lines += [f"# HELP {name} Trabajos terminados por host y estado",
+                  f"# TYPE {name} counter"]
+        for (host, state), count in states:
+            lines.append(f"{name}{_labels(host=host, state=state)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self):
+        """Reescribe el archivo de Prometheus de forma atómica (si hay ruta)"""
+        if not self.prom_path:
+            return
+        text = self.prometheus_text()
+        with self._lock:
+            self._last_prom = time.monotonic()
+            tmp_path = self.prom_path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, self.prom_path)
+            except OSError:
+                pass
+
+    def close(self):
+        self.write_prometheus()
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
@@ -0,0 +1,19 @@
+# descarga/paths.py
+"""Rutas de datos persistentes de la aplicación (cachés y ajustes aprendidos)"""
+import os
+import sys
+
+APP_DIR_NAME = 'VideoDescarga'
+
+
+def cache_dir(*parts):
+    """Directorio de caché del usuario (se crea si no existe)"""
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    path = os.path.join(base, APP_DIR_NAME, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,103 @@
+# descarga/pipeline.py
+"""División de un trabajo en etapa de descarga (red) y etapa de posproceso (CPU)"""
+import os
+from dataclasses import dataclass
+
+# Opciones de posproceso que se quitan de la etapa de descarga (con su valor)
+POSTPROCESS_OPTIONS = ('--recode-video', '--remux-video', '--merge-output-format',
+                       '--audio-format', '--audio-quality')
+POSTPROCESS_FLAGS = ('--extract-audio', '-x')
+
+EXT_SUFFIX = '.%(ext)s'
+DEFAULT_TEMPLATE = '%(title)s [%(id)s].%(ext)s'
+
+# Posprocesos en espera por cada hueco de CPU antes de frenar nuevas descargas
+POSTPROCESS_QUEUE_PER_WORKER = 2
+
+
+def default_postprocess_workers():
+    return os.cpu_count() or 2
+
+
+@dataclass
+class StagePlan:
+    """Comando de la etapa de descarga y descripción del posproceso pendiente"""
+    download_cmd: list
+    postprocess: str
+
+
+def _option_value(cmd, option):
+    if option in cmd:
+        index = cmd.index(option)
+        if index + 1 < len(cmd):
+            return cmd[index + 1]
+    return None
+
+
+def _without(cmd, options=POSTPROCESS_OPTIONS, flags=POSTPROCESS_FLAGS):
+    result = []
+    skip = False
+    for arg in cmd:
+        if skip:
+            skip = False
+        elif arg in options:
+            skip = True
+        elif arg not in flags:
+            result.append(arg)
+    return result
+
+
+def split_stages(cmd):
+    """Divide el comando en descarga + posproceso, o devuelve None si no hay nada que separar.
+
+    - Unir video y audio ('-f A+B'): la descarga baja A y B por separado
+      ('-f A,B') con los mismos nombres que usa yt-dlp para sus intermedios
+      (<nombre>.f<id>.<ext>), y el posproceso los une.
+    - --recode-video / --remux-video / --extract-audio: la descarga baja el
+      archivo sin convertir y el posproceso lo convierte.
+
+    El posproceso es el comando original: yt-dlp encuentra los archivos ya
+    descargados, no vuelve a bajarlos y solo ejecuta FFmpeg.
+    """
+    selector = _option_value(cmd, '-f')
+    merge = bool(selector and '+' in selector and '/' not in selector and ',' not in selector)
+    steps = []
+    if merge:
+        steps.append('unir video y audio')
+    if '--recode-video' in cmd:
+        steps.append(f"recodificar a {_option_value(cmd, '--recode-video')}")
+    if '--remux-video' in cmd:
+        steps.append(f"remux a {_option_value(cmd, '--remux-video')}")
+    if '--extract-audio' in cmd or '-x' in cmd:
+        steps.append(f"extraer audio {_option_value(cmd, '--audio-format') or ''}".strip())
+    if not steps:
+        return None
+
+    download_cmd = _without(cmd)
+    if merge:
+        template = _option_value(download_cmd, '-o')
+        if template is None:
+            download_cmd += ['-o', DEFAULT_TEMPLATE]
+            template = DEFAULT_TEMPLATE
+        if not template.endswith(EXT_SUFFIX):
+            # Sin '.%(ext)s' no se pueden reproducir los nombres intermedios de yt-dlp
+            return None
+        index = download_cmd.index('-o') + 1
+        download_cmd[index] = template[:-len(EXT_SUFFIX)] + '.f%(format_id)s' + EXT_SUFFIX
+        download_cmd[download_cmd.index('-f') + 1] = selector.replace('+', ',')
+    return StagePlan(download_cmd, ', '.join(steps))
+
+
+def postprocess_command(cmd, results):
+    """Comando del posproceso: el original, fijando los formatos que bajó la descarga.
+
+    Fijar '-f' evita que una nueva extracción elija otros formatos y obligue
+    a descargar de nuevo. Con varios videos (playlist) se deja el selector
+    original, ya que cada video tiene sus propios formatos.
+    """
+    cmd = list(cmd)
+    ids = {result.get('id') for result in results}
+    format_ids = [str(result['format_id']) for result in results if result.get('format_id')]
+    if len(ids) == 1 and format_ids and '-f' in cmd:
+        cmd[cmd.index('-f') + 1] = '+'.join(format_ids)
+    return cmd
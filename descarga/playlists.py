@@ -0,0 +1,183 @@
+# descarga/playlists.py
+"""Expansión de playlists en un trabajo por video y sincronización incremental"""
+from dataclasses import dataclass, field
+
+FLAT_ARGS = ['--flat-playlist']
+
+# Tipos de info de yt-dlp que agrupan varios videos
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+# Entradas planas que apuntan a la página de su video
+URL_TYPES = ('url', 'url_transparent')
+
+# Entradas que son a su vez listas (pestañas de un canal, listas de una
+# página); se expanden en lugar de pasarse como video
+NESTED_SUFFIXES = ('Tab', 'Playlist', 'Channel')
+MAX_DEPTH = 2
+
+# Primeras entradas que se revisan al sincronizar; se amplía (x4) mientras
+# todas sean nuevas
+SYNC_WINDOW = 50
+SYNC_GROWTH = 4
+
+
+@dataclass
+class PlaylistEntry:
+    """Un video de la lista: su URL propia o, si no tiene, la de la lista y su posición"""
+    url: str
+    extractor: str = None
+    video_id: str = None
+    title: str = None
+    position: int = None
+
+    @property
+    def key(self):
+        return (self.extractor, self.video_id) if self.extractor and self.video_id else None
+
+
+@dataclass
+class Expansion:
+    """Resultado de expandir una playlist"""
+    title: str
+    entries: list = field(default_factory=list)
+    total: int = None
+    sync: bool = False
+
+    def describe(self):
+        text = f"📃 Lista «{self.title}»: {len(self.entries)} video(s)"
+        if self.sync:
+            text += " nuevo(s) desde la última sincronización"
+        if self.total is not None and self.total != len(self.entries):
+            text += f" (de {self.total})"
+        return text
+
+
+def child_command(cmd, parent_url, entry):
+    """Comando de un video de la lista: el de la lista con su URL y --no-playlist,
+    o con --playlist-items si el video no tiene página propia"""
+    cmd = [entry.url if arg == parent_url else arg for arg in cmd]
+    if entry.position is not None:
+        return cmd + ['--playlist-items', str(entry.position)]
+    if '--no-playlist' not in cmd:
+        cmd.append('--no-playlist')
+    return cmd
+
+
+def _entry(raw, list_url, position):
+    """PlaylistEntry de una entrada de la extracción plana, o None si no se puede direccionar"""
+    key = (raw.get('ie_key') or raw.get('extractor_key'), str(raw['id']) if raw.get('id') else None)
+    if raw.get('_type') in URL_TYPES and raw.get('url'):
+        return PlaylistEntry(raw['url'], *key, raw.get('title'))
+    # Entrada ya resuelta (p. ej. varios <video> en una página): su página, si es
+    # otra, o la de la lista con la posición del video
+    page = raw.get('webpage_url')
+    if page and page != list_url:
+        return PlaylistEntry(page, *key, raw.get('title'))
+    position = raw.get('playlist_index') or position
+    if position is None:
+        return None
+    return PlaylistEntry(list_url, *key, raw.get('title'), position=position)
+
+
+def _is_nested(raw):
+    return raw.get('_type') in PLAYLIST_TYPES or (raw.get('ie_key') or '').endswith(NESTED_SUFFIXES)
+
+
+class PlaylistExpander:
+    """Convierte un trabajo de playlist en sus videos con una extracción plana (--flat-playlist).
+
+    La extracción plana solo lee el índice de la lista (sin visitar cada
+    video), así que expandir 500 entradas cuesta lo que leer sus páginas de
+    índice. Con sync=True y un archivo de descargas, solo se revisan las
+    primeras entradas (SYNC_WINDOW, ampliando mientras todas sean nuevas)
+    hasta dar con una ya vista; si la lista crece por el final (las primeras
+    ya eran conocidas), se revisan solo las que exceden el tamaño anterior.
+    Un video cuenta como visto cuando su trabajo termina (el archivo de
+    descargas lo anota), así que los que fallaron o se cancelaron vuelven a
+    salir en la siguiente sincronización si están entre las entradas leídas.
+    """
+
+    def __init__(self, engine, archive=None, sync=False):
+        self.engine = engine
+        self.archive = archive
+        self.sync = sync and archive is not None
+
+    def extract(self, job, items=None):
+        args = list(FLAT_ARGS)
+        if items:
+            args += ['--playlist-items', items]
+        return self.engine.extract_info(job, args)
+
+    def expand(self, job):
+        """Devuelve (Expansion, None) si el trabajo es una playlist, o (None, info) si es un video"""
+        if self.sync and self.archive.playlist_state(job.url) is not None:
+            return self._sync(job)
+        info = self.extract(job)
+        if not info or info.get('_type') not in PLAYLIST_TYPES:
+            return None, info
+        expansion = Expansion(info.get('title') or job.url, self._entries(job, info), self._total(info))
+        self._remember(job, expansion)
+        return expansion, None
+
+    def _sync(self, job):
+        state = self.archive.playlist_state(job.url)
+        window = SYNC_WINDOW
+        while True:
+            info = self.extract(job, f"1:{window}")
+            if not info or info.get('_type') not in PLAYLIST_TYPES:
+                return None, info
+            entries = self._entries(job, info)
+            known = next((i for i, entry in enumerate(entries) if self._seen(job, entry)), None)
+            if known is not None or len(entries) < window:
+                break
+            window *= SYNC_GROWTH
+        total = self._total(info)
+        title = info.get('title') or state.get('titulo') or job.url
+        # Las nuevas del principio y, tras ellas, las leídas que no llegaron a terminar
+        limit = known if known is not None else len(entries)
+        new = [entry for i, entry in enumerate(entries)
+               if i < limit or (entry.key and not self._seen(job, entry))]
+        if known == 0 and total and state.get('entradas') and total > state['entradas']:
+            # Las primeras ya eran conocidas: la lista crece por el final
+            tail = self.extract(job, f"{state['entradas'] + 1}:")
+            pending = {entry.key for entry in new}
+            new += [entry for entry in self._entries(job, tail or {})
+                    if not self._seen(job, entry) and (entry.key is None or entry.key not in pending)]
+        expansion = Expansion(title, new, total, sync=True)
+        self._remember(job, expansion)
+        return expansion, None
+
+    @staticmethod
+    def _total(info):
+        return info.get('playlist_count') or (len(info['entries']) if isinstance(info.get('entries'), list) else None)
+
+    def _entries(self, job, info, depth=0, url=None):
+        entries = []
+        for position, raw in enumerate(info.get('entries') or (), 1):
+            if not raw:
+                continue
+            if _is_nested(raw) and depth < MAX_DEPTH and raw.get('url'):
+                nested = self.engine.extract_info(_UrlJob(job, raw['url']), FLAT_ARGS)
+                if nested and nested.get('_type') in PLAYLIST_TYPES:
+                    entries += self._entries(job, nested, depth + 1, raw['url'])
+                    continue
+            entry = _entry(raw, url or job.url, position)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def _seen(self, job, entry):
+        return bool(entry.key) and self.archive.playlist_seen(job.url, *entry.key)
+
+    def _remember(self, job, expansion):
+        # Solo el tamaño y el título: cada video se anota como visto al terminar su trabajo
+        if self.archive is not None:
+            self.archive.record_playlist(job.url, expansion.title, expansion.total)
+
+
+class _UrlJob:
+    """Trabajo mínimo para extraer otra URL con el mismo comando (listas anidadas)"""
+
+    def __init__(self, job, url):
+        self.url = url
+        self.referer = job.referer
+        self.cmd = [url if arg == job.url else arg for arg in job.cmd]
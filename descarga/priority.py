@@ -0,0 +1,125 @@
+# descarga/priority.py
+"""Orden de la cola: qué trabajo en espera se lanza cuando queda un hueco de descarga"""
+import itertools
+import time
+
+# Políticas
+POLITICA_ORDEN = 'orden'
+POLITICA_CORTOS = 'cortos'
+POLITICA_HOSTS = 'hosts'
+
+POLICY_LABELS = {
+    POLITICA_ORDEN: 'Orden de llegada',
+    POLITICA_CORTOS: 'Más cortos primero',
+    POLITICA_HOSTS: 'Por turnos entre sitios',
+}
+
+# Bytes/s supuestos para estimar el tamaño de un video del que solo se sabe la duración (~2 Mbit/s)
+ASSUMED_BYTES_PER_SECOND = 250_000
+# Segundos que un video sin tamaño conocido espera a su extracción anticipada antes de lanzarse igualmente
+INFO_GRACE = 5.0
+# Segundos en cola tras los que un trabajo largo pasa delante de los cortos (nunca se queda sin turno)
+MAX_WAIT = 1800.0
+
+
+def estimated_size(job):
+    """Bytes estimados del trabajo: el tamaño de su info o, sin él, su duración; None si no se sabe"""
+    if job.size_estimate:
+        return job.size_estimate
+    if job.duration:
+        return job.duration * ASSUMED_BYTES_PER_SECOND
+    return None
+
+
+class QueuePolicy:
+    """Orden de llegada (la política por defecto) y base de las demás.
+
+    En todas las políticas manda primero la prioridad que fija el usuario
+    (Job.priority, mayor antes) y, a igualdad de criterio, se respeta el
+    orden de la cola; el planificador lanza el primero de order() que tenga
+    hueco en su host.
+    """
+
+    name = POLITICA_ORDEN
+    # ¿Necesita la info de los trabajos en espera (tamaño, duración)?
+    needs_info = False
+
+    def order(self, jobs, now=None):
+        """Los trabajos en el orden en que se lanzarían"""
+        now = time.monotonic() if now is None else now
+        # sorted es estable: los empates conservan el orden de la cola
+        return sorted(jobs, key=lambda job: (-job.priority, self.rank(job, now)))
+
+    def rank(self, job, now):
+        return 0
+
+    def ready(self, job, now):
+        """¿Puede lanzarse ya? (False mientras se espera a conocer su tamaño)"""
+        return True
+
+    def next_wakeup(self, jobs, now):
+        """Segundos hasta que un trabajo que no estaba listo lo esté, o None"""
+        return None
+
+    def launched(self, job):
+        """Aviso de que el trabajo se ha lanzado"""
+
+    def describe(self):
+        return POLICY_LABELS[self.name]
+
+
+class ShortestFirstPolicy(QueuePolicy):
+    """Los videos más pequeños primero, según el tamaño (o la duración) de su info.
+
+    Las playlists se expanden antes que nada para conocer sus videos. Un
+    video sin info espera hasta INFO_GRACE a la extracción anticipada y,
+    si no llega, va detrás de los de tamaño conocido. Tras MAX_WAIT en cola
+    un trabajo pasa delante para que los largos no esperen para siempre.
+    """
+
+    name = POLITICA_CORTOS
+    needs_info = True
+
+    def __init__(self, max_wait=MAX_WAIT, info_grace=INFO_GRACE):
+        self.max_wait = max_wait
+        self.info_grace = info_grace
+
+    def rank(self, job, now):
+        if job.expandable or now - job.queued_at >= self.max_wait:
+            return (0, 0)
+        size = estimated_size(job)
+        return (1, size) if size is not None else (2, 0)
+
+    def ready(self, job, now):
+        return job.expandable or estimated_size(job) is not None or now - job.queued_at >= self.info_grace
+
+    def next_wakeup(self, jobs, now):
+        waits = [job.queued_at + self.info_grace - now for job in jobs if not self.ready(job, now)]
+        return max(0.0, min(waits)) if waits else None
+
+
+class RoundRobinPolicy(QueuePolicy):
+    """Por turnos entre sitios: primero el host que lleva más tiempo sin lanzar nada.
+
+    Un lote con cientos de URLs de un sitio y unas pocas de otros no hace
+    esperar a estas hasta que acabe el primero.
+    """
+
+    name = POLITICA_HOSTS
+
+    def __init__(self):
+        self._turns = itertools.count()
+        self._last = {}
+
+    def rank(self, job, now):
+        return self._last.get(job.host, -1)
+
+    def launched(self, job):
+        self._last[job.host] = next(self._turns)
+
+
+POLICIES = {
+    POLITICA_ORDEN: QueuePolicy,
+    POLITICA_CORTOS: ShortestFirstPolicy,
+    POLITICA_HOSTS: RoundRobinPolicy,
+}
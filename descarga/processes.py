@@ -0,0 +1,152 @@
+# descarga/processes.py
+"""Árbol de procesos de un trabajo (yt-dlp y su FFmpeg): lanzar, terminar, pausar y reanudar"""
+import glob
+import importlib.util
+import os
+import signal
+import subprocess
+import threading
+
+# Segundos que se espera a que el árbol termine tras pedírselo antes de forzarlo
+KILL_TIMEOUT = 5.0
+
+# Restos de una descarga a medias junto al archivo de destino
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp')
+
+
+def popen_kwargs():
+    """Opciones de Popen para que yt-dlp y sus hijos formen un grupo propio.
+
+    En POSIX el proceso abre una sesión nueva (su PID es el del grupo), así
+    que una señal al grupo alcanza también a FFmpeg; en Windows se crea un
+    grupo de procesos nuevo y sin ventana.
+    """
+    if os.name == 'nt':
+        return {'creationflags': subprocess.CREATE_NO_WINDOW | subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {'start_new_session': True}
+
+
+def _psutil():
+    # Opcional: en Windows no hay SIGSTOP y la pausa necesita psutil
+    if importlib.util.find_spec('psutil') is None:
+        return None
+    import psutil
+    return psutil
+
+
+def _tree(process):
+    """Procesos psutil del árbol (el propio y sus descendientes), o None sin psutil"""
+    psutil = _psutil()
+    if psutil is None:
+        return None
+    try:
+        parent = psutil.Process(process.pid)
+        return [parent] + parent.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def _signal_tree(process):
+    """Pide al árbol que termine sin esperar; False si ya no hay proceso"""
+    if process is None or process.poll() is not None:
+        return False
+    if os.name != 'nt':
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            # Un proceso pausado no atiende SIGTERM hasta que continúa
+            os.killpg(process.pid, signal.SIGCONT)
+        except ProcessLookupError:
+            return False
+    return True
+
+
+def _reap_tree(process, timeout):
+    """Espera a que el árbol termine y lo fuerza si no sale a tiempo (bloquea hasta timeout)"""
+    if os.name == 'nt':
+        # taskkill /T recorre el árbol aunque no esté psutil
+        subprocess.run(['taskkill', '/T', '/F', '/PID', str(process.pid)], capture_output=True,
+                       creationflags=subprocess.CREATE_NO_WINDOW)
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        if os.name == 'nt':
+            process.kill()
+        else:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+
+def kill_tree(process, timeout=KILL_TIMEOUT):
+    """Termina el proceso y todos sus descendientes; los fuerza si no salen a tiempo"""
+    if _signal_tree(process):
+        _reap_tree(process, timeout)
+
+
+def kill_tree_async(process, timeout=KILL_TIMEOUT):
+    """Como kill_tree, pero sin bloquear: la señal sale ya y la espera y el forzado van en un hilo propio.
+
+    Para llamarla desde la interfaz, o en bucle sobre muchos trabajos, sin
+    esperar KILL_TIMEOUT por cada árbol que no atienda la señal.
+    """
+    if _signal_tree(process):
+        threading.Thread(target=_reap_tree, args=(process, timeout), daemon=True,
+                         name=f'terminar-{process.pid}').start()
+
+
+def suspend_tree(process):
+    """Pausa el árbol de procesos; False si no es posible en este sistema"""
+    if process is None or process.poll() is not None:
+        return False
+    if os.name != 'nt':
+        try:
+            os.killpg(process.pid, signal.SIGSTOP)
+        except ProcessLookupError:
+            return False
+        return True
+    tree = _tree(process)
+    if tree is None:
+        return False
+    for proc in tree:
+        try:
+            proc.suspend()
+        except Exception:
+            pass
+    return True
+
+
+def resume_tree(process):
+    """Reanuda un árbol pausado con suspend_tree()"""
+    if process is None or process.poll() is not None:
+        return
+    if os.name != 'nt':
+        try:
+            os.killpg(process.pid, signal.SIGCONT)
+        except ProcessLookupError:
+            pass
+        return
+    for proc in _tree(process) or ():
+        try:
+            proc.resume()
+        except Exception:
+            pass
+
+
+def remove_partials(paths):
+    """Borra los restos de descargas a medias (.part, .ytdl, fragmentos) de los destinos dados.
+
+    Los destinos terminados no se tocan. Devuelve cuántos archivos se borraron.
+    """
+    removed = 0
+    for path in paths:
+        leftovers = [path + suffix for suffix in PARTIAL_SUFFIXES]
+        leftovers += glob.glob(glob.escape(path) + '.part-Frag*')
+        existing = [leftover for leftover in leftovers if os.path.exists(leftover)]
+        for leftover in existing:
+            try:
+                os.remove(leftover)
+                removed += 1
+            except OSError:
+                pass
+    return removed
@@ -0,0 +1,377 @@
+# descarga/progress.py
+"""Canal estructurado de yt-dlp (progreso y resultado final), fases de cada trabajo y agregados por bytes"""
+import json
+import re
+import time
+from dataclasses import dataclass
+
+PROGRESS_PREFIX = '[vd-progreso] '
+
+PROGRESS_FIELDS = (
+    'status', 'filename', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate',
+    'speed', 'eta', 'fragment_index', 'fragment_count', 'elapsed',
+)
+
+# Una línea JSON por actualización (--newline) con los campos de PROGRESS_FIELDS
+PROGRESS_TEMPLATE = f"download:{PROGRESS_PREFIX}%(progress.{{{','.join(PROGRESS_FIELDS)}}})j"
+
+PROGRESS_ARGS = ['--newline', '--progress-template', PROGRESS_TEMPLATE]
+
+# Al terminar cada video (ya movido a su ruta final) yt-dlp imprime extractor,
+# ID y ruta. --print activaría el modo silencioso y la simulación; --no-quiet y
+# --no-simulate los desactivan para que el resto de la salida no cambie
+FINAL_PREFIX = '[vd-final] '
+FINAL_FIELDS = ('extractor_key', 'id', 'format_id', 'filepath', 'title')
+FINAL_TEMPLATE = f"after_move:{FINAL_PREFIX}%(.{{{','.join(FINAL_FIELDS)}}})j"
+FINAL_ARGS = ['--print', FINAL_TEMPLATE, '--no-quiet', '--no-simulate']
+
+
+def strip_final_args(cmd):
+    """Quita FINAL_ARGS de un comando (para extraer la info con -J sin descargar)"""
+    result = []
+    i = 0
+    while i < len(cmd):
+        if cmd[i:i + len(FINAL_ARGS)] == FINAL_ARGS:
+            i += len(FINAL_ARGS)
+            continue
+        result.append(cmd[i])
+        i += 1
+    return result
+
+# Porcentaje de una línea '[download] xx%' de yt-dlp (sin el canal estructurado)
+PERCENT_RE = re.compile(r'(\d+\.?\d*)%')
+
+# Una velocidad sin actualizar en este tiempo ya no cuenta para el total
+SPEED_STALE_SECONDS = 5.0
+
+
+@dataclass
+class ProgressEvent:
+    """Una actualización de progreso de yt-dlp para un archivo concreto"""
+    status: str
+    filename: str = ''
+    downloaded_bytes: int = 0
+    total_bytes: int = None
+    speed: float = None
+    eta: float = None
+    fragment_index: int = None
+    fragment_count: int = None
+    elapsed: float = None
+
+    @classmethod
+    def from_dict(cls, d):
+        """Crea el evento desde el diccionario de progreso de yt-dlp (hook o plantilla)"""
+        return cls(
+            status=d.get('status') or 'downloading',
+            filename=d.get('filename') or '',
+            downloaded_bytes=d.get('downloaded_bytes') or 0,
+            total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+            speed=d.get('speed'),
+            eta=d.get('eta'),
+            fragment_index=d.get('fragment_index'),
+            fragment_count=d.get('fragment_count'),
+            elapsed=d.get('elapsed'),
+        )
+
+
+def parse_progress_line(line):
+    """Convierte una línea '[vd-progreso] {...}' en ProgressEvent, o None si no lo es"""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        data = json.loads(line[len(PROGRESS_PREFIX):])
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    return ProgressEvent.from_dict(data)
+
+
+def parse_final_line(line):
+    """Convierte una línea '[vd-final] {...}' en diccionario, o None si no lo es"""
+    if not line.startswith(FINAL_PREFIX):
+        return None
+    try:
+        data = json.loads(line[len(FINAL_PREFIX):])
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_percent(line):
+    """Extrae el porcentaje de una línea '[download] xx%' de yt-dlp, o None"""
+    if '[download]' not in line or '%' not in line:
+        return None
+    match = PERCENT_RE.search(line)
+    if match:
+        try:
+            return min(float(match.group(1)), 100.0)
+        except ValueError:
+            return None
+    return None
+
+
+class JobProgress:
+    """Bytes descargados y totales de un trabajo, sumando todos sus archivos.
+
+    Un trabajo 'bestvideo+bestaudio' descarga dos archivos seguidos; cada uno
+    se sigue por separado para que el progreso no vuelva a cero entre ambos.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.speed = None
+        self.eta = None
+        self.fragment_index = None
+        self.fragment_count = None
+        self.updated_at = 0.0
+
+    def update(self, event):
+        downloaded, total = self.files.get(event.filename, (0, None))
+        downloaded = max(downloaded, event.downloaded_bytes)
+        total = event.total_bytes or total
+        if event.status == 'finished':
+            total = total or downloaded
+            downloaded = total
+            self.speed = None
+        else:
+            self.speed = event.speed
+        self.files[event.filename] = (downloaded, total)
+        self.eta = event.eta
+        self.fragment_index = event.fragment_index
+        self.fragment_count = event.fragment_count
+        self.updated_at = time.monotonic()
+
+    @property
+    def downloaded_bytes(self):
+        return sum(downloaded for downloaded, _ in self.files.values())
+
+    @property
+    def total_bytes(self):
+        """Total conocido, o None si algún archivo aún no informa de su tamaño"""
+        if not self.files or any(total is None for _, total in self.files.values()):
+            return None
+        return sum(total for _, total in self.files.values())
+
+    def current_speed(self, now=None):
+        now = now or time.monotonic()
+        if self.speed is None or now - self.updated_at > SPEED_STALE_SECONDS:
+            return 0.0
+        return self.speed
+
+
+# Fases de un trabajo, en el orden en que suelen ocurrir
+FASE_EXTRACCION = 'extraccion'
+FASE_DESCARGA = 'descarga'
+FASE_ESPERA = 'espera'
+FASE_UNION = 'union'
+FASE_REMUX = 'remux'
+FASE_RECODIFICACION = 'recodificacion'
+FASE_AUDIO = 'audio'
+
+PHASES = (FASE_EXTRACCION, FASE_DESCARGA, FASE_ESPERA, FASE_UNION, FASE_REMUX, FASE_RECODIFICACION, FASE_AUDIO)
+PHASE_LABELS = {
+    FASE_EXTRACCION: 'Extracción', FASE_DESCARGA: 'Descarga', FASE_ESPERA: 'Espera de posproceso',
+    FASE_UNION: 'Unión', FASE_REMUX: 'Remux', FASE_RECODIFICACION: 'Recodificación', FASE_AUDIO: 'Extracción de audio',
+}
+POSTPROCESS_PHASES = (FASE_UNION, FASE_REMUX, FASE_RECODIFICACION, FASE_AUDIO)
+
+# Prefijos con los que yt-dlp anuncia el comienzo de cada fase
+PHASE_MARKERS = (
+    ('[download] Destination:', FASE_DESCARGA),
+    ('[hlsnative]', FASE_DESCARGA),
+    ('[dashsegments]', FASE_DESCARGA),
+    ('[Merger]', FASE_UNION),
+    ('[VideoRemuxer]', FASE_REMUX),
+    ('[VideoConvertor]', FASE_RECODIFICACION),
+    ('[ExtractAudio]', FASE_AUDIO),
+)
+
+
+class PhaseTimings:
+    """Segundos y bytes de cada fase de un trabajo.
+
+    El planificador marca las transiciones que conoce (inicio, paso al
+    posproceso, fin) y las demás se deducen de la salida de yt-dlp
+    (PHASE_MARKERS). Una fase puede repetirse (p. ej. una playlist); sus
+    tiempos se suman.
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.bytes = {}
+        self.current = None
+        self._since = None
+
+    def enter(self, phase, now=None):
+        """Cierra la fase en curso y empieza phase (si no es ya la actual)"""
+        if phase == self.current:
+            return
+        now = now or time.monotonic()
+        self.close(now)
+        self.current = phase
+        self._since = now
+
+    def close(self, now=None):
+        if self.current is not None:
+            now = now or time.monotonic()
+            self.seconds[self.current] = self.seconds.get(self.current, 0.0) + now - self._since
+        self.current = None
+        self._since = None
+
+    def add(self, phase, seconds):
+        """Suma una fase ocurrida fuera del trabajo (p. ej. la extracción anticipada)"""
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    def line(self, line):
+        """Cambia de fase si la línea de yt-dlp anuncia otra"""
+        for prefix, phase in PHASE_MARKERS:
+            if line.startswith(prefix):
+                self.enter(phase)
+                return
+
+    def set_bytes(self, phase, count):
+        if count:
+            self.bytes[phase] = count
+
+    def as_dict(self):
+        return {phase: {'seconds': round(self.seconds[phase], 3), 'bytes': self.bytes.get(phase)}
+                for phase in PHASES if phase in self.seconds}
+
+
+@dataclass
+class AggregateStats:
+    """Progreso del lote completo, ponderado por bytes"""
+    percent: float
+    downloaded_bytes: int
+    total_bytes: int
+    speed: float
+    eta: float
+    running: int
+    finished: int
+    total_jobs: int
+
+    def describe(self):
+        """Resumen legible: velocidad, MB descargados/estimados y ETA"""
+        eta = format_eta(self.eta) if self.eta is not None else '--:--'
+        return (f"{self.speed / 1e6:.1f} MB/s · {self.downloaded_bytes / 1e6:.0f}/"
+                f"{self.total_bytes / 1e6:.0f} MB · ETA {eta} · "
+                f"{self.finished}/{self.total_jobs} terminados")
+
+    def as_dict(self):
+        return {
+            'percent': round(self.percent, 2), 'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes, 'speed': round(self.speed, 1),
+            'eta': None if self.eta is None else round(self.eta, 1),
+            'running': self.running, 'finished': self.finished, 'total_jobs': self.total_jobs,
+        }
+
+
+def format_eta(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def progress_line(job):
+    """Línea de progreso legible de un trabajo ('[3] [download]  42.0% de 120.0 MB a 2.50 MB/s ETA 00:30')"""
+    progress = job.bytes
+    line = f"[{job.number}] [download] {job.progress:5.1f}%"
+    if progress.total_bytes:
+        line += f" de {progress.total_bytes / 1e6:.1f} MB"
+    speed = progress.current_speed()
+    if speed:
+        line += f" a {speed / 1e6:.2f} MB/s"
+    if progress.eta is not None:
+        line += f" ETA {format_eta(progress.eta)}"
+    if progress.fragment_count:
+        line += f" (fragmento {progress.fragment_index}/{progress.fragment_count})"
+    return line
+
+
+class FinishedTotals:
+    """Resumen de los trabajos ya terminados que el planificador ya no conserva.
+
+    Con una entrada en flujo (miles de URLs) los trabajos terminados se
+    descartan; aquí queda lo necesario para el progreso agregado, los
+    contadores por estado y el coste de arranque.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.states = {}
+        self.sized = 0
+        self.sizes = 0
+        self.downloaded = 0
+        self.startup_count = 0
+        self.startup_total = 0.0
+        self.startup_min = None
+        self.startup_max = None
+
+    def add(self, job):
+        self.count += 1
+        self.states[job.state] = self.states.get(job.state, 0) + 1
+        size = job.bytes.total_bytes or job.size_estimate
+        if size:
+            self.sized += 1
+            self.sizes += size
+        self.downloaded += job.bytes.downloaded_bytes
+        if job.startup_seconds is not None:
+            seconds = job.startup_seconds
+            self.startup_count += 1
+            self.startup_total += seconds
+            self.startup_min = seconds if self.startup_min is None else min(self.startup_min, seconds)
+            self.startup_max = seconds if self.startup_max is None else max(self.startup_max, seconds)
+
+
+def aggregate(jobs, is_finished, totals=None):
+    """Calcula AggregateStats para una lista de trabajos.
+
+    Cada trabajo pesa lo que ocupa en bytes (según yt-dlp o, antes de empezar,
+    según la extracción anticipada). Los que aún no conocen su tamaño
+    pesan la media de los conocidos, de modo que un clip de 10 MB ya no cuenta
+    lo mismo que una clase de 3 GB. Los trabajos sin datos de bytes (salida sin
+    plantilla de progreso) usan su porcentaje. totals (FinishedTotals) suma
+    los trabajos terminados que ya no están en la lista.
+    """
+    finished_totals = totals or FinishedTotals()
+    now = time.monotonic()
+    sizes = [job.bytes.total_bytes or job.size_estimate for job in jobs]
+    known = [size for size in sizes if size]
+    known_count = len(known) + finished_totals.sized
+    default_weight = (sum(known) + finished_totals.sizes) / known_count if known_count else 1.0
+
+    # Los terminados fuera de la lista cuentan completos
+    unsized = finished_totals.count - finished_totals.sized
+    weighted_done = weight_total = finished_totals.sizes + unsized * default_weight
+    downloaded = finished_totals.downloaded
+    total = finished_totals.sizes + int(unsized * default_weight if known_count else 0)
+    speed = 0.0
+    running = 0
+    finished = finished_totals.count
+    for job, size in zip(jobs, sizes):
+        weight = size or default_weight
+        if is_finished(job):
+            fraction = 1.0
+            finished += 1
+        elif job.bytes.total_bytes:
+            fraction = min(job.bytes.downloaded_bytes / job.bytes.total_bytes, 1.0)
+        else:
+            fraction = job.progress / 100.0
+        weighted_done += weight * fraction
+        weight_total += weight
+        downloaded += job.bytes.downloaded_bytes
+        total += size or int(default_weight if known_count else 0)
+        if job.started_at is not None and not is_finished(job):
+            running += 1
+            speed += job.bytes.current_speed(now)
+
+    percent = 100.0 * weighted_done / weight_total if weight_total else 100.0
+    eta = None
+    if speed > 0 and total:
+        eta = max(total - downloaded, 0) / speed
+    return AggregateStats(percent, downloaded, max(total, downloaded), speed, eta, running, finished,
+                          len(jobs) + finished_totals.count)
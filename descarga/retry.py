@@ -0,0 +1,142 @@
+# descarga/retry.py
+"""Clasificación de los fallos de yt-dlp, reintentos con espera exponencial e informe final"""
+import random
+import re
+
+# Clases de fallo
+FALLO_TRANSITORIO = 'transitorio'
+FALLO_LIMITADO = 'limitado'
+FALLO_AUTENTICACION = 'autenticación'
+FALLO_PERMANENTE = 'permanente'
+
+# Los que merece la pena reintentar más tarde
+REINTENTABLES = (FALLO_TRANSITORIO, FALLO_LIMITADO)
+
+FAILURE_LABELS = {
+    FALLO_TRANSITORIO: 'error temporal',
+    FALLO_LIMITADO: 'el sitio limita las peticiones',
+    FALLO_AUTENTICACION: 'requiere iniciar sesión o cookies',
+    FALLO_PERMANENTE: 'error permanente',
+}
+
+# Patrones en orden de prioridad: el primero que aparezca en la salida decide
+FAILURE_PATTERNS = (
+    (FALLO_LIMITADO, re.compile(
+        r'HTTP Error (429|403)|Too Many Requests|rate[- ]limit|try again later', re.IGNORECASE)),
+    (FALLO_AUTENTICACION, re.compile(
+        r'HTTP Error 401|Sign in to confirm|login required|--cookies|private video|'
+        r'members[- ]only|Join this channel|confirm your age|age[- ]restricted|This video is private',
+        re.IGNORECASE)),
+    (FALLO_PERMANENTE, re.compile(
+        r'Unsupported URL|is not a valid URL|HTTP Error (404|410)|Video unavailable|has been removed|'
+        r'no longer available|does not exist|not available in your country|geo[- ]?restrict|'
+        r'No video formats found|Requested format is not available|Postprocessing|'
+        r'No space left on device|Permission denied', re.IGNORECASE)),
+    (FALLO_TRANSITORIO, re.compile(
+        r'HTTP Error 5\d\d|timed? ?out|Connection (reset|refused|aborted)|Remote end closed|'
+        r'Temporary failure|Name or service not known|getaddrinfo failed|IncompleteRead|'
+        r'Unable to download (webpage|JSON|API)|giving up after|Got error|SSL|EOF occurred|'
+        r'Network is unreachable', re.IGNORECASE)),
+)
+
+# Líneas del final del log que se revisan al clasificar
+CLASSIFY_TAIL = 30
+
+# Intentos por trabajo (el primero incluido) antes de darlo por fallido
+DEFAULT_ATTEMPTS = 3
+
+# Espera antes de cada reintento: base * 2^(reintento - 1), con jitter y tope
+RETRY_BASE = 10.0
+THROTTLED_BASE = 60.0
+RETRY_MAX = 900.0
+
+
+def _error_lines(job):
+    return [line for line in list(job.log)[-CLASSIFY_TAIL:] if line.startswith('ERROR:')]
+
+
+def failure_reason(job):
+    """Línea que mejor explica el fallo: la última 'ERROR:' de yt-dlp, o el error del trabajo"""
+    errors = _error_lines(job)
+    if errors:
+        return errors[-1][len('ERROR:'):].strip()
+    return job.error
+
+
+def classify_failure(job):
+    """Clase del fallo de un trabajo según su salida y su código de salida.
+
+    Manda lo que dicen las líneas 'ERROR:'; del resto de la salida solo se
+    tienen en cuenta los avisos de límite y los errores de red (los
+    reintentos internos de yt-dlp), ya que una advertencia cualquiera no
+    explica el fallo.
+    """
+    errors = [job.error or ''] + _error_lines(job)
+    for failure, pattern in FAILURE_PATTERNS:
+        if any(pattern.search(text) for text in errors):
+            return failure
+    tail = list(job.log)[-CLASSIFY_TAIL:]
+    for failure, pattern in FAILURE_PATTERNS:
+        if failure in REINTENTABLES and any(pattern.search(line) for line in tail):
+            return failure
+    if job.returncode == 2:
+        # yt-dlp termina con 2 ante opciones no válidas: repetir no cambia nada
+        return FALLO_PERMANENTE
+    if job.returncode is None:
+        # Excepción antes de terminar el proceso (p. ej. yt-dlp no encontrado)
+        return FALLO_PERMANENTE
+    return FALLO_TRANSITORIO
+
+
+class RetryPolicy:
+    """Cuántas veces y tras cuánta espera se reintenta cada clase de fallo.
+
+    La espera crece al doble con cada reintento (RETRY_BASE, o THROTTLED_BASE
+    si el sitio limita) hasta RETRY_MAX, y se elige al azar entre la mitad y
+    el total ("equal jitter") para que los trabajos que fallaron a la vez no
+    vuelvan a la vez.
+    """
+
+    def __init__(self, attempts=DEFAULT_ATTEMPTS, base=RETRY_BASE, throttled_base=THROTTLED_BASE,
+                 maximum=RETRY_MAX):
+        self.attempts = max(1, int(attempts))
+        self.base = base
+        self.throttled_base = throttled_base
+        self.maximum = maximum
+
+    def should_retry(self, failure, attempt):
+        return failure in REINTENTABLES and attempt < self.attempts
+
+    def delay(self, failure, attempt):
+        """Segundos de espera antes del intento attempt + 1"""
+        base = self.throttled_base if failure == FALLO_LIMITADO else self.base
+        ceiling = min(self.maximum, base * 2 ** (attempt - 1))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class FailureReport:
+    """Trabajos que terminaron en error, para el informe del final del lote"""
+
+    def __init__(self):
+        self.failures = []
+
+    def add(self, job):
+        self.failures.append({
+            'number': job.number, 'url': job.url, 'title': job.title, 'failure': job.failure,
+            'reason': failure_reason(job), 'attempts': job.attempts,
+        })
+
+    def as_list(self):
+        return list(self.failures)
+
+    def lines(self):
+        """Informe legible: un renglón por descarga fallida, agrupadas por clase"""
+        if not self.failures:
+            return []
+        lines = [f"❌ {len(self.failures)} descarga(s) fallida(s):"]
+        order = {failure: i for i, failure in enumerate(FAILURE_LABELS)}
+        for record in sorted(self.failures, key=lambda record: order.get(record['failure'], len(order))):
+            attempts = f", {record['attempts']} intentos" if record['attempts'] > 1 else ""
+            lines.append(f"   [{record['number']}] {FAILURE_LABELS.get(record['failure'], record['failure'])}"
+                         f"{attempts}: {record['reason']} — {record['title'] or record['url']}")
+        return lines
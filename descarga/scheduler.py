@@ -0,0 +1,1024 @@
+# descarga/scheduler.py
+"""Planificador de descargas concurrentes con límite global y por host y posproceso en paralelo"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from descarga.engines import SubprocessEngine
+from descarga.formats import apply_plan, plan_format, recode_target
+from descarga.fragments import FRAGMENT_ERROR_RE, has_fragments_option, with_fragments
+from descarga.limits import BandwidthBudget, HostLimiter
+from descarga.metadata import MetadataPrefetcher, summarize_info
+from descarga.playlists import PlaylistExpander, child_command
+from descarga.priority import QueuePolicy
+from descarga.processes import remove_partials
+from descarga.pipeline import (POSTPROCESS_QUEUE_PER_WORKER, default_postprocess_workers,
+                               postprocess_command, split_stages)
+from descarga.retry import FAILURE_LABELS, FailureReport, RetryPolicy, classify_failure, failure_reason
+from descarga.progress import (FASE_ESPERA, FASE_EXTRACCION, POSTPROCESS_PHASES, FinishedTotals, JobProgress,
+                               PhaseTimings, aggregate, parse_final_line, parse_percent,
+                               parse_progress_line)
+from descarga.streammerge import PartWatcher, StreamPlan, apply_stream_plan, merge_selector, plan_stream_merge
+
+# Estados de un trabajo
+PENDIENTE = 'pendiente'
+EJECUTANDO = 'ejecutando'
+PAUSADO = 'pausado'
+COMPLETADO = 'completado'
+ERROR = 'error'
+CANCELADO = 'cancelado'
+OMITIDO = 'omitido'
+# Playlist sustituida por un trabajo por video (no cuenta como descarga)
+EXPANDIDO = 'expandido'
+
+ESTADOS_FINALES = (COMPLETADO, ERROR, CANCELADO, OMITIDO)
+
+# Etapas de un trabajo en ejecución
+FASE_DESCARGA = 'descarga'
+FASE_POSPROCESO = 'posproceso'
+
+# Intervalo mínimo entre dos avisos on_stats a los receptores
+STATS_INTERVAL = 1.0
+
+# Cuántos trabajos pendientes se extraen por adelantado, por cada hueco de descarga
+PREFETCH_PER_WORKER = 2
+
+# Trabajos que se generan por adelantado cuando la entrada es un flujo de URLs
+STREAM_LOOKAHEAD = 64
+
+
+def host_de_url(url):
+    """Obtiene el host de una URL (en minúsculas y sin 'www.')"""
+    try:
+        host = (urlparse(url).hostname or '').lower()
+    except ValueError:
+        host = ''
+    if host.startswith('www.'):
+        host = host[4:]
+    return host or 'desconocido'
+
+
+class Job:
+    """Un trabajo de descarga: comando, estado, progreso y log propios"""
+
+    LOG_LINES = 500
+
+    def __init__(self, index, cmd, url, referer=None, parent=None, entry=None):
+        self.index = index
+        # Trabajo de playlist del que sale este video y su posición en la lista (base 1)
+        self.parent = parent
+        self.entry = entry
+        self.expansion = None
+        self.cmd = cmd
+        self.url = url
+        self.referer = referer
+        self.host = host_de_url(url)
+        # Hosts contra los que cuenta el límite por host: el de la URL y el del referer
+        self.hosts = (self.host,)
+        if referer and host_de_url(referer) != self.host:
+            self.hosts += (host_de_url(referer),)
+        # Bytes/s asignados por el límite global de ancho de banda, o None
+        self.rate_limit = None
+        self.state = PENDIENTE
+        self.progress = 0.0
+        # Bytes por archivo, velocidad y ETA según el canal de progreso estructurado
+        self.bytes = JobProgress()
+        # Segundos y bytes por fase (extracción, descarga, unión, recodificación...)
+        self.timings = PhaseTimings()
+        self.returncode = None
+        self.error = None
+        self.log = deque(maxlen=self.LOG_LINES)
+        self.process = None
+        self.started_at = None
+        self.finished_at = None
+        # Segundos hasta la primera señal de vida del motor (coste de arranque)
+        self.startup_seconds = None
+        # Fila del diario persistente y archivos de destino (posibles .part)
+        self.journal_id = None
+        self.partial_files = []
+        # Datos de la info JSON (extracción anticipada), None hasta conocerlos
+        self.title = None
+        self.size_estimate = None
+        self.duration = None
+        self.extractor_key = None
+        self.video_id = None
+        # Videos terminados por este trabajo (extractor_key, id, filepath, title)
+        self.results = []
+        # Entrada del archivo de descargas si se omitió por estar ya descargado
+        self.archived = None
+        # formats.FormatPlan elegido antes de lanzar (solo con --recode-video)
+        self.format_plan = None
+        # streammerge.StreamPlan si video y audio se unieron mientras se descargaban
+        self.stream_plan = None
+        # Etapa actual y archivos que la descarga dejó para el posproceso
+        self.phase = None
+        self.intermediate_files = []
+        # Descarga por fragmentos (HLS/DASH): nivel aplicado, fragmentos vistos y reintentos
+        self.fragment_level = None
+        self.fragment_count = None
+        self.fragment_errors = 0
+        # Intentos lanzados, clase del último fallo (retry.FALLO_*) y cuándo puede volver a lanzarse
+        self.attempts = 0
+        self.failure = None
+        self.retry_at = None
+        # Prioridad fijada por el usuario (mayor antes) y cuándo entró en la cola
+        self.priority = 0
+        self.queued_at = time.monotonic()
+        # Control del usuario: cancelación (conservando o no los parciales) y pausa
+        self.cancel_requested = False
+        self.keep_partial = True
+        self.resume_event = threading.Event()
+        self.resume_event.set()
+
+    @property
+    def paused(self):
+        return not self.resume_event.is_set()
+
+    def as_dict(self):
+        """Estado del trabajo para mostrarlo fuera del planificador (tabla de trabajos, servicio local)"""
+        return {
+            'number': self.number, 'url': self.url, 'title': self.title, 'state': self.state,
+            'phase': self.phase, 'progress': round(self.progress, 1),
+            'speed': self.bytes.current_speed() if self.state == EJECUTANDO else 0.0,
+            'retry_in': round(max(0.0, self.retry_at - time.monotonic())) if self.retry_at is not None else None,
+            'cancelling': self.cancel_requested, 'error': self.error, 'files': self.output_files,
+            'priority': self.priority,
+        }
+
+    @property
+    def output_files(self):
+        return [result['filepath'] for result in self.results if result.get('filepath')]
+
+    def prepare_retry(self, retry_at):
+        """Deja el trabajo como pendiente para un nuevo intento a partir de retry_at"""
+        self.state = PENDIENTE
+        self.phase = None
+        self.progress = 0.0
+        self.bytes = JobProgress()
+        self.returncode = None
+        self.error = None
+        self.process = None
+        self.results = []
+        self.rate_limit = None
+        self.fragment_count = None
+        self.fragment_errors = 0
+        self.retry_at = retry_at
+
+    def set_info(self, summary):
+        """Aplica el resumen de metadata.summarize_info()"""
+        self.title = summary.get('title')
+        self.size_estimate = summary.get('size')
+        self.duration = summary.get('duration')
+        self.extractor_key = summary.get('extractor_key')
+        self.video_id = summary.get('id')
+
+    @property
+    def key(self):
+        """Identifica al trabajo entre los del planificador (los videos de una lista comparten índice)"""
+        return (self.index,) if self.parent is None else self.parent.key + (self.entry,)
+
+    @property
+    def number(self):
+        """Número del trabajo tal como se muestra al usuario (base 1); '3.2' es el 2.º video de la lista 3"""
+        if self.parent is None:
+            return self.index + 1
+        return f"{self.parent.number}.{self.entry}"
+
+    @property
+    def expandable(self):
+        """¿Puede ser una playlist a expandir? (sin --no-playlist y sin salir ya de una lista)"""
+        return self.parent is None and '--no-playlist' not in self.cmd
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def __repr__(self):
+        return f"<Job #{self.number} {self.state} {self.url}>"
+
+
+class SchedulerListener:
+    """Receptor de eventos del planificador; todos los métodos son opcionales.
+
+    Los métodos se invocan desde los hilos de trabajo, no desde el hilo que
+    llamó a JobScheduler.run().
+    """
+
+    def on_job_queued(self, job):
+        """Un trabajo generado desde un flujo de entrada entra en la cola"""
+        pass
+
+    def on_job_started(self, job):
+        pass
+
+    def on_job_info(self, job):
+        """La extracción anticipada ya conoce título, tamaño y duración del trabajo"""
+        pass
+
+    def on_job_log(self, job, line):
+        pass
+
+    def on_job_progress(self, job):
+        pass
+
+    def on_job_retry(self, job):
+        """El trabajo falló de forma transitoria y vuelve al final de la cola (job.retry_at)"""
+        pass
+
+    def on_job_finished(self, job):
+        pass
+
+    def on_stats(self, stats):
+        """Estadísticas agregadas del lote (progress.AggregateStats), como mucho una vez por segundo"""
+        pass
+
+
+class ListenerGroup(SchedulerListener):
+    """Reenvía cada evento a varios receptores, en orden"""
+
+    def __init__(self, listeners):
+        self.listeners = [listener for listener in listeners if listener is not None]
+
+    def on_job_queued(self, job):
+        for listener in self.listeners:
+            listener.on_job_queued(job)
+
+    def on_job_started(self, job):
+        for listener in self.listeners:
+            listener.on_job_started(job)
+
+    def on_job_info(self, job):
+        for listener in self.listeners:
+            listener.on_job_info(job)
+
+    def on_job_log(self, job, line):
+        for listener in self.listeners:
+            listener.on_job_log(job, line)
+
+    def on_job_progress(self, job):
+        for listener in self.listeners:
+            listener.on_job_progress(job)
+
+    def on_job_retry(self, job):
+        for listener in self.listeners:
+            listener.on_job_retry(job)
+
+    def on_job_finished(self, job):
+        for listener in self.listeners:
+            listener.on_job_finished(job)
+
+    def on_stats(self, stats):
+        for listener in self.listeners:
+            listener.on_stats(stats)
+
+
+class JobScheduler:
+    """Ejecuta varios trabajos a la vez respetando un límite global y otro por host.
+
+    Los trabajos se lanzan en el orden de la política de la cola
+    (priority.QueuePolicy: orden de llegada, más cortos primero o por turnos
+    entre sitios), siempre detrás de la prioridad que fije el usuario
+    (prioritize/postpone); si el host del siguiente trabajo ya está al
+    límite, se adelanta el primero cuyo host tenga hueco.
+    El límite por host cuenta tanto el host de la URL como el del referer, y
+    con adaptive=True se reduce y pausa ante HTTP 429/403 o si el rendimiento
+    del host cae (limits.HostLimiter). bandwidth_limit (bytes/s) se reparte
+    entre las descargas activas (limits.BandwidthBudget).
+
+    Con fragment_tuner (fragments.FragmentTuner), la descarga usa los
+    fragmentos simultáneos aprendidos para su host, salvo que el comando ya
+    los fije, y el resultado de cada descarga por fragmentos ajusta ese nivel.
+
+    Los trabajos sin --no-playlist se expanden al empezar con una extracción
+    plana (playlists.PlaylistExpander): si la URL es una lista, se sustituyen
+    por un trabajo por video que pasa por la cola, el archivo y los límites
+    como cualquier otro. Con playlists=PlaylistExpander(..., sync=True) solo
+    se encolan los videos nuevos desde la última vez.
+
+    Los fallos se clasifican por la salida de yt-dlp (retry.classify_failure).
+    Los temporales y los límites del sitio vuelven al final de la cola tras
+    una espera exponencial con jitter (retry.RetryPolicy), sin bloquear a los
+    que vienen detrás; los que fallan del todo quedan en self.failures.
+
+    Con pipeline activo, los trabajos que necesitan FFmpeg (unir, recodificar,
+    extraer audio) liberan su hueco de descarga al terminar de bajar y pasan a
+    un grupo de posproceso con un hilo por núcleo. Si ese grupo acumula
+    demasiados trabajos en espera, no se lanzan más descargas hasta que baje.
+
+    Con stream_merge=True, un trabajo que une video y audio servidos por
+    HTTP(S) los descarga a la vez con un solo FFmpeg que escribe el archivo
+    final (streammerge); si la fuente no lo permite o esa descarga falla,
+    sigue el camino anterior.
+
+    jobs puede ser una lista o un iterable de trabajos (p. ej. un
+    ingest.UrlSource). Con un iterable, los trabajos se generan a medida que
+    hay hueco (como mucho STREAM_LOOKAHEAD en espera) y los terminados se
+    resumen en self.finished, así que la memoria no depende del tamaño del lote.
+
+    Con keep_alive=True, run() no termina al vaciarse la cola sino al llamar
+    a stop(), y submit() añade trabajos en cualquier momento (servicio local).
+    """
+
+    def __init__(self, jobs, max_workers=3, max_per_host=2, engine=None, listener=None, listeners=(),
+                 metadata_cache=None, archive=None, pipeline=True, postprocess_workers=None,
+                 bandwidth_limit=None, adaptive=False, fragment_tuner=None, playlists=None, retry=None,
+                 keep_alive=False, policy=None, stream_merge=False):
+        self.max_workers = max(1, int(max_workers))
+        self.max_per_host = max(1, int(max_per_host))
+        self.hosts = HostLimiter(self.max_per_host, adaptive)
+        self.bandwidth = BandwidthBudget(bandwidth_limit)
+        self.fragment_tuner = fragment_tuner
+        self.retry = retry or RetryPolicy()
+        self.policy = policy or QueuePolicy()
+        self.failures = FailureReport()
+        self.keep_alive = keep_alive
+        self.stream_merge = stream_merge
+        # Un servicio que no se detiene tampoco puede conservar todos sus trabajos
+        self.streaming = keep_alive or not isinstance(jobs, (list, tuple))
+        if self.streaming:
+            # Solo los trabajos activos (en espera, descargando o en posproceso)
+            self.jobs = []
+            self._source = iter(jobs)
+        else:
+            self.jobs = list(jobs)
+            self._source = None
+        self.finished = FinishedTotals()
+        self.lookahead = max(STREAM_LOOKAHEAD, self.max_workers * (PREFETCH_PER_WORKER + 1))
+        self.engine = engine or SubprocessEngine()
+        self.archive = archive
+        self.playlists = playlists or PlaylistExpander(self.engine, archive)
+        self.listener = ListenerGroup([listener, *listeners, archive])
+        self._pending = deque(self.jobs)
+        self._running = {}
+        self._postprocessing = {}
+        self._cond = threading.Condition()
+        self._is_running = True
+        self._last_stats = 0.0
+        self.postprocess_workers = max(1, int(postprocess_workers or default_postprocess_workers()))
+        self.postprocess_limit = self.postprocess_workers * POSTPROCESS_QUEUE_PER_WORKER
+        self._postprocess_pool = None
+        if pipeline:
+            self._postprocess_pool = ThreadPoolExecutor(max_workers=self.postprocess_workers,
+                                                        thread_name_prefix='posproceso')
+        self.prefetcher = None
+        if metadata_cache is not None:
+            self.prefetcher = MetadataPrefetcher(self.engine, metadata_cache, on_info=self._info_ready)
+
+    # --- API pública -----------------------------------------------------
+
+    def run(self):
+        """Bloquea hasta que todos los trabajos terminan (o se detiene el planificador)"""
+        if self.archive is not None and not self.streaming:
+            self._skip_archived()
+        while True:
+            self._refill()
+            with self._cond:
+                if self._is_running:
+                    self._launch_ready()
+                exhausted = not self._pending and self._source is None and not self.keep_alive
+                if not self._running and not self._postprocessing and (exhausted or not self._is_running):
+                    break
+                if self._source is None or len(self._pending) >= self.lookahead or not self._is_running:
+                    # Con un host en pausa o un reintento en espera hay que despertar a tiempo
+                    self._cond.wait(self._next_wakeup())
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown()
+        if self._postprocess_pool is not None:
+            self._postprocess_pool.shutdown(wait=False)
+        self.listener.on_stats(self.stats())
+
+    def stop(self):
+        """No lanza más trabajos; los que están en curso terminan por su cuenta"""
+        with self._cond:
+            self._is_running = False
+            self._cond.notify_all()
+
+    def stats(self):
+        """Progreso, bytes, velocidad y ETA agregados de todos los trabajos"""
+        with self._cond:
+            jobs = list(self.jobs)
+        return aggregate(jobs, lambda job: job.state in ESTADOS_FINALES, self.finished)
+
+    def counts(self):
+        """Trabajos por estado (incluidos los terminados que ya no se conservan)"""
+        with self._cond:
+            counts = dict(self.finished.states)
+            for job in self.jobs:
+                counts[job.state] = counts.get(job.state, 0) + 1
+        return counts
+
+    def total_jobs(self):
+        """Trabajos generados hasta ahora (en flujo, la lista aún puede crecer)"""
+        with self._cond:
+            return len(self.jobs) + self.finished.count
+
+    def overall_progress(self):
+        """Progreso global (0-100) ponderado por el tamaño de cada trabajo"""
+        return int(self.stats().percent)
+
+    def submit(self, jobs):
+        """Añade trabajos a la cola de un planificador en marcha"""
+        for job in jobs:
+            self._enqueue(job)
+        with self._cond:
+            self._cond.notify_all()
+
+    def find(self, number):
+        """Trabajo activo con ese número (tal como se muestra, p. ej. '3' o '3.2'), o None"""
+        number = str(number)
+        return next((job for job in self.active_jobs() if str(job.number) == number), None)
+
+    def active_jobs(self):
+        """Trabajos descargando, en posproceso y en espera (estos en el orden en que se lanzarían)"""
+        with self._cond:
+            return (list(self._running.values()) + list(self._postprocessing.values())
+                    + self.policy.order(self._pending))
+
+    def set_policy(self, policy):
+        """Cambia la política de la cola; se aplica desde el siguiente hueco"""
+        with self._cond:
+            self.policy = policy
+            self._cond.notify_all()
+
+    def prioritize(self, job, priority=None):
+        """Fija la prioridad de un trabajo en espera; sin priority pasa delante de todos.
+
+        Devuelve False si el trabajo ya no está en la cola.
+        """
+        with self._cond:
+            if job not in self._pending:
+                return False
+            if priority is None:
+                priority = max((j.priority for j in self._pending if j is not job), default=0) + 1
+            job.priority = int(priority)
+            self._cond.notify_all()
+        self._log(job, f"⏫ Prioridad {job.priority}")
+        self.listener.on_job_progress(job)
+        return True
+
+    def postpone(self, job):
+        """Pasa un trabajo en espera detrás de todos; False si ya no está en la cola"""
+        with self._cond:
+            if job not in self._pending:
+                return False
+            job.priority = min((j.priority for j in self._pending if j is not job), default=0) - 1
+        self._log(job, f"⏬ Prioridad {job.priority}")
+        self.listener.on_job_progress(job)
+        return True
+
+    def cancel(self, job, keep_partial=True):
+        """Cancela un trabajo: si está en marcha termina su árbol de procesos.
+
+        Con keep_partial=False se borran los .part y fragmentos (y los
+        archivos intermedios del posproceso); si no, quedan para reanudarlo.
+        """
+        with self._cond:
+            if job.state in ESTADOS_FINALES or job.cancel_requested:
+                return
+            job.cancel_requested = True
+            job.keep_partial = keep_partial
+            job.resume_event.set()
+            queued = job in self._pending
+            if queued:
+                self._pending.remove(job)
+        if not queued:
+            # El hilo del trabajo lo da por cancelado cuando termine el proceso
+            self.engine.cancel(job)
+            return
+        self._set_cancelled(job)
+        self.listener.on_job_finished(job)
+        self._retire(job)
+        with self._cond:
+            self._cond.notify_all()
+
+    def pause(self, job):
+        """Pausa un trabajo: en espera no se lanza; en marcha se suspenden sus procesos"""
+        with self._cond:
+            if job.state not in (PENDIENTE, EJECUTANDO) or job.cancel_requested:
+                return False
+            running = job.state == EJECUTANDO
+            job.resume_event.clear()
+            job.state = PAUSADO
+        if running and not self.engine.pause(job):
+            with self._cond:
+                job.resume_event.set()
+                job.state = EJECUTANDO
+            self._log(job, "⚠️ No se puede pausar el proceso en este sistema (instala psutil)")
+            return False
+        self._log(job, "⏸️ En pausa")
+        self.listener.on_job_progress(job)
+        return True
+
+    def resume(self, job):
+        """Reanuda un trabajo pausado donde lo dejó"""
+        with self._cond:
+            if job.state != PAUSADO:
+                return
+            running = job.key in self._running or job.key in self._postprocessing
+            job.state = EJECUTANDO if running else PENDIENTE
+            job.resume_event.set()
+            self._cond.notify_all()
+        if running:
+            self.engine.resume(job)
+        self._log(job, "▶️ Reanudado")
+        self.listener.on_job_progress(job)
+
+    def pause_all(self):
+        for job in self.active_jobs():
+            self.pause(job)
+
+    def resume_all(self):
+        for job in self.active_jobs():
+            self.resume(job)
+
+    def cancel_all(self, keep_partial=True):
+        """Detiene el lote: no lanza nada más y cancela lo que está en marcha o en espera"""
+        self.stop()
+        for job in self.active_jobs():
+            self.cancel(job, keep_partial)
+
+    def wait_idle(self):
+        """Espera a que terminen los trabajos en marcha (p. ej. tras cancel_all)"""
+        with self._cond:
+            while self._running or self._postprocessing:
+                self._cond.wait()
+
+    def running_jobs(self):
+        """Trabajos en la etapa de descarga"""
+        with self._cond:
+            return list(self._running.values())
+
+    def postprocessing_jobs(self):
+        """Trabajos que esperan o ejecutan su posproceso"""
+        with self._cond:
+            return list(self._postprocessing.values())
+
+    def info_path(self, job):
+        """Ruta de la info JSON ya extraída para el trabajo (llamado por el motor), o None"""
+        if self.prefetcher is None:
+            return None
+        return self.prefetcher.info_for(job)
+
+    def job_output(self, job, line):
+        """Procesa una línea de salida de un trabajo (llamado por el motor)"""
+        event = parse_progress_line(line)
+        if event is not None:
+            self.job_progress_event(job, event)
+            return
+        result = parse_final_line(line)
+        if result is not None:
+            self.job_result(job, result)
+            return
+        job.log.append(line)
+        self.listener.on_job_log(job, line)
+        job.timings.line(line)
+        if job.stream_plan is not None:
+            job.stream_plan.output_line(line)
+        if FRAGMENT_ERROR_RE.search(line):
+            job.fragment_errors += 1
+        with self._cond:
+            notice = self.hosts.job_line(job, line)
+        if notice is not None:
+            self._log(job, notice)
+        percent = parse_percent(line)
+        if percent is not None:
+            # Salida sin plantilla de progreso (p. ej. un comando antiguo del diario)
+            self.set_job_progress(job, percent)
+
+    def job_progress_event(self, job, event):
+        """Aplica un progress.ProgressEvent al trabajo"""
+        job.bytes.update(event)
+        if job.phase == FASE_DESCARGA:
+            job.timings.enter(FASE_DESCARGA)
+        if event.fragment_count:
+            job.fragment_count = max(job.fragment_count or 0, event.fragment_count)
+        total = job.bytes.total_bytes
+        if total:
+            job.progress = min(job.bytes.downloaded_bytes * 100.0 / total, 100.0)
+        self.listener.on_job_progress(job)
+        self._maybe_emit_stats()
+
+    def job_result(self, job, result):
+        """Registra un video terminado por el trabajo (extractor, ID y ruta final)"""
+        job.results.append(result)
+        if not job.video_id:
+            job.extractor_key = result.get('extractor_key')
+            job.video_id = result.get('id')
+        self._log(job, f"[download] Archivo final: {result.get('filepath')}")
+
+    def set_job_progress(self, job, percent):
+        job.progress = percent
+        self.listener.on_job_progress(job)
+        self._maybe_emit_stats()
+
+    def host_limits(self):
+        """Hosts con el máximo reducido o en pausa por el modo adaptativo, o ''"""
+        with self._cond:
+            return self.hosts.describe()
+
+    # --- Interno ---------------------------------------------------------
+
+    def _log(self, job, line):
+        """Añade al log del trabajo una línea propia del planificador"""
+        job.log.append(line)
+        self.listener.on_job_log(job, line)
+
+    def _skip_archived(self):
+        """Marca como omitidos, sin tocar la red, los trabajos que ya están en el archivo"""
+        for job in list(self._pending):
+            if self._is_archived(job):
+                with self._cond:
+                    self._pending.remove(job)
+                self.listener.on_job_finished(job)
+
+    def _is_archived(self, job):
+        entry = self.archive.lookup(job)
+        if entry is None:
+            return False
+        job.state = OMITIDO
+        job.archived = entry
+        job.progress = 100.0
+        return True
+
+    def _refill(self):
+        """Genera trabajos del flujo de entrada hasta tener self.lookahead en espera"""
+        while self._source is not None and self._is_running:
+            with self._cond:
+                if len(self._pending) >= self.lookahead:
+                    return
+            job = next(self._source, None)
+            if job is None:
+                with self._cond:
+                    self._source = None
+                return
+            self._enqueue(job)
+
+    def _enqueue(self, job):
+        """Pone en cola un trabajo nuevo, o lo da por omitido si ya está en el archivo"""
+        self.listener.on_job_queued(job)
+        if self.archive is not None and self._is_archived(job):
+            self.listener.on_job_finished(job)
+            self._retire(job)
+            return
+        with self._cond:
+            self.jobs.append(job)
+            self._pending.append(job)
+
+    def _retire(self, job):
+        """En flujo, sustituye un trabajo terminado por su resumen en self.finished"""
+        if not self.streaming:
+            return
+        with self._cond:
+            if job in self.jobs:
+                self.jobs.remove(job)
+            self.finished.add(job)
+        if self.prefetcher is not None:
+            self.prefetcher.forget(job)
+
+    def _next_wakeup(self):
+        """Segundos hasta que acabe la pausa de un host, toque un reintento o venza la espera
+        de la info de un trabajo, o None (con el lock tomado)"""
+        waits = [self.hosts.next_wakeup()]
+        if self._pending:
+            now = time.monotonic()
+            waits += [max(0.0, job.retry_at - now) for job in self._pending if job.retry_at is not None]
+            if self.prefetcher is not None:
+                waits.append(self.policy.next_wakeup(self._pending, now))
+        waits = [wait for wait in waits if wait is not None]
+        return min(waits) if waits else None
+
+    def _maybe_emit_stats(self):
+        now = time.monotonic()
+        if now - self._last_stats >= STATS_INTERVAL:
+            self._last_stats = now
+            with self._cond:
+                notice = self.hosts.sample(list(self._running.values()))
+            if notice is not None:
+                self._log(*notice)
+            self.listener.on_stats(self.stats())
+
+    def _launch_ready(self):
+        """Lanza trabajos pendientes mientras haya hueco (con el lock tomado)"""
+        # Contrapresión: con la cola de posproceso llena no se empieza a bajar nada más
+        while (self._pending and len(self._running) < self.max_workers
+               and len(self._postprocessing) < self.postprocess_limit):
+            running = list(self._running.values())
+            now = time.monotonic()
+            # Sin extracción anticipada no llegará la info: no tiene sentido esperarla
+            job = next((j for j in self.policy.order(self._pending, now) if j.state != PAUSADO
+                        and (j.retry_at is None or j.retry_at <= now) and self.hosts.allows(j, running)
+                        and (self.prefetcher is None or self.policy.ready(j, now))), None)
+            if job is None:
+                break
+            self._pending.remove(job)
+            self.policy.launched(job)
+            job.attempts += 1
+            job.retry_at = None
+            job.state = EJECUTANDO
+            job.phase = FASE_DESCARGA
+            job.started_at = time.monotonic()
+            self._running[job.key] = job
+            self.bandwidth.assign(job, list(self._running.values()), len(self._pending), self.max_workers,
+                                  getattr(self.engine, 'live_rate_limit', False))
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+        if self.prefetcher is not None:
+            # Extraer la info de los siguientes mientras estos descargan
+            # (las posibles playlists no: su extracción es la expansión al empezar)
+            # Una política por tamaño necesita la de toda la ventana de la cola
+            ahead = self.lookahead if self.policy.needs_info else self.max_workers * PREFETCH_PER_WORKER
+            self.prefetcher.schedule([j for j in list(self._pending)[:ahead] if not j.expandable])
+
+    def _info_ready(self, job):
+        """La extracción anticipada trajo la info de un trabajo: puede cambiar su turno"""
+        self.listener.on_job_info(job)
+        if self.policy.needs_info:
+            with self._cond:
+                self._cond.notify_all()
+
+    def _load_info(self, job):
+        """Info JSON del trabajo: la extraída por adelantado o, si no hay, una extracción nueva"""
+        path = self.info_path(job)
+        if path is None:
+            return self.engine.extract_info(job)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _plan_format(self, job):
+        """Sustituye --recode-video por --remux-video si hay formatos con códecs compatibles"""
+        container = recode_target(job.cmd)
+        if container is None:
+            return
+        info = self._load_info(job)
+        if not info:
+            return
+        quality = job.cmd[job.cmd.index('-f') + 1] if '-f' in job.cmd else None
+        plan = plan_format(info, quality, container)
+        if plan is None:
+            return
+        job.format_plan = plan
+        job.cmd = apply_plan(job.cmd, plan)
+        self._log(job, plan.describe())
+
+    def _plan_stream_merge(self, job):
+        """streammerge.StreamPlan del trabajo, o None si no une video y audio o la opción está desactivada"""
+        if not self.stream_merge or job.cancel_requested or merge_selector(job.cmd) is None:
+            return None
+        if not getattr(self.engine, 'controls_ffmpeg', False):
+            plan = StreamPlan(False, description=f"el motor {self.engine.name} no puede pausar ni cancelar FFmpeg")
+        elif self.bandwidth.limit:
+            plan = StreamPlan(False, description='FFmpeg no respeta el límite de ancho de banda')
+        else:
+            plan = plan_stream_merge(self._load_info(job), job.cmd)
+        if plan is not None:
+            self._log(job, plan.describe())
+        return plan
+
+    def _run_stream_merge(self, job):
+        """Descarga y une en flujo; False si el trabajo debe seguir el camino normal"""
+        job.stream_plan = None
+        plan = self._plan_stream_merge(job)
+        if plan is None or not plan.streamable:
+            return False
+        job.stream_plan = plan
+        with PartWatcher(job, self, plan):
+            job.returncode = self.engine.run(job, self, apply_stream_plan(job.cmd, plan))
+        if job.returncode == 0 or job.cancel_requested:
+            return True
+        # P. ej. un servidor que corta a FFmpeg: lo bajado no sirve para reanudar por separado
+        if plan.filename:
+            remove_partials([plan.filename])
+        job.stream_plan = None
+        job.bytes = JobProgress()
+        self._log(job, f"↩️ La unión en flujo falló (código {job.returncode}); se descarga y se une como siempre")
+        return False
+
+    def _tune_fragments(self, job, cmd):
+        """Añade los fragmentos simultáneos aprendidos para el host, salvo ajuste manual"""
+        if self.fragment_tuner is None or has_fragments_option(cmd):
+            return cmd
+        job.fragment_level = self.fragment_tuner.level(job.host)
+        return with_fragments(cmd, job.fragment_level)
+
+    def _learn_fragments(self, job, seconds):
+        """Informa al ajustador del rendimiento de una descarga por fragmentos terminada"""
+        if self.fragment_tuner is None or not job.fragment_level or not job.fragment_count:
+            return
+        if job.returncode != 0 or seconds <= 0:
+            return
+        notice = self.fragment_tuner.record(job.host, job.fragment_level, job.bytes.downloaded_bytes / seconds,
+                                            job.fragment_count, job.fragment_errors)
+        if notice is not None:
+            self._log(job, notice)
+
+    def _run_job(self, job):
+        job.timings.enter(FASE_EXTRACCION)
+        self.listener.on_job_started(job)
+        try:
+            if job.expandable and self._expand(job):
+                return
+            self._plan_format(job)
+            if not self._run_stream_merge(job):
+                stages = split_stages(job.cmd) if self._postprocess_pool is not None else None
+                cmd = self._tune_fragments(job, stages.download_cmd if stages else job.cmd)
+                start = time.monotonic()
+                job.returncode = self.engine.run(job, self, cmd)
+                self._learn_fragments(job, time.monotonic() - start)
+                if stages is not None and job.returncode == 0 and not job.cancel_requested:
+                    self._hand_off(job, stages)
+                    return
+            self._set_result(job)
+        except Exception as e:
+            self._set_exception(job, e)
+        if job.cancel_requested:
+            self._set_cancelled(job)
+        elif job.state == ERROR and self._retry(job):
+            return
+        self._finish(job, self._running)
+
+    def _retry(self, job):
+        """Devuelve al final de la cola un trabajo con un fallo reintentable; False si no se reintenta"""
+        job.failure = classify_failure(job)
+        if not self._is_running or not self.retry.should_retry(job.failure, job.attempts):
+            return False
+        delay = self.retry.delay(job.failure, job.attempts)
+        reason = failure_reason(job)
+        job.timings.close()
+        job.prepare_retry(time.monotonic() + delay)
+        self._log(job, f"🔁 {FAILURE_LABELS[job.failure].capitalize()} ({reason}); "
+                       f"intento {job.attempts + 1}/{self.retry.attempts} en {delay:.0f} s")
+        self.listener.on_job_retry(job)
+        with self._cond:
+            self._running.pop(job.key, None)
+            self._pending.append(job)
+            self._rebalance()
+            self._cond.notify_all()
+        return True
+
+    def _expand(self, job):
+        """Sustituye una playlist por un trabajo por video; False si la URL es de un solo video"""
+        expansion, info = self.playlists.expand(job)
+        if expansion is None:
+            if info:
+                job.set_info(summarize_info(info))
+                self.listener.on_job_info(job)
+                if self.prefetcher is not None:
+                    # La extracción plana de un video es su info completa: no repetirla
+                    self.prefetcher.cache.put(job.url, job.referer, info)
+            return False
+        job.expansion = expansion
+        job.title = expansion.title
+        self._log(job, expansion.describe())
+        children = []
+        for number, entry in enumerate(expansion.entries, 1):
+            child = Job(job.index, child_command(job.cmd, job.url, entry), entry.url, job.referer,
+                        parent=job, entry=number)
+            child.title = entry.title
+            child.extractor_key = entry.extractor
+            child.video_id = entry.video_id
+            child.priority = job.priority
+            children.append(child)
+        with self._cond:
+            self.jobs.extend(children)
+        queued = []
+        for child in children:
+            self.listener.on_job_queued(child)
+            if self.archive is not None and self._is_archived(child):
+                self.listener.on_job_finished(child)
+                self._retire(child)
+            else:
+                queued.append(child)
+        job.state = EXPANDIDO
+        job.progress = 100.0
+        job.finished_at = time.monotonic()
+        job.timings.close(job.finished_at)
+        self.listener.on_job_finished(job)
+        if self.prefetcher is not None:
+            self.prefetcher.forget(job)
+        with self._cond:
+            # La lista deja de contar como trabajo; sus videos van al frente de la cola
+            if job in self.jobs:
+                self.jobs.remove(job)
+            self.finished.states[EXPANDIDO] = self.finished.states.get(EXPANDIDO, 0) + 1
+            self._pending.extendleft(reversed(queued))
+            self._running.pop(job.key, None)
+            self._rebalance()
+            self._cond.notify_all()
+        return True
+
+    def _hand_off(self, job, stages):
+        """Pasa un trabajo descargado al grupo de posproceso y libera su hueco de descarga"""
+        cmd = postprocess_command(job.cmd, job.results)
+        job.intermediate_files = job.output_files
+        job.results = []
+        job.phase = FASE_POSPROCESO
+        job.timings.enter(FASE_ESPERA)
+        job.process = None
+        job.rate_limit = None
+        with self._cond:
+            self._running.pop(job.key, None)
+            self._postprocessing[job.key] = job
+            self._rebalance()
+            waiting = len(self._postprocessing)
+            self._cond.notify_all()
+        self._log(job, f"⚙️ Descarga terminada; posproceso en cola ({stages.postprocess}, {waiting} en cola)")
+        self._postprocess_pool.submit(self._run_postprocess, job, cmd)
+
+    def _run_postprocess(self, job, cmd):
+        try:
+            if not job.cancel_requested:
+                job.returncode = self.engine.run(job, self, cmd)
+            self._set_result(job)
+        except Exception as e:
+            self._set_exception(job, e)
+        if job.cancel_requested:
+            self._set_cancelled(job)
+        self._finish(job, self._postprocessing)
+
+    @staticmethod
+    def _set_result(job):
+        if job.returncode == 0:
+            job.state = COMPLETADO
+            job.progress = 100.0
+        else:
+            job.state = ERROR
+            job.error = job.error or f"Código de salida {job.returncode}"
+
+    def _set_cancelled(self, job):
+        job.state = CANCELADO
+        job.error = "Cancelado por el usuario"
+        if job.stream_plan is not None and job.stream_plan.filename:
+            # FFmpeg no continúa un .part: la unión en flujo vuelve a empezar desde cero
+            job.partial_files = [path for path in job.partial_files if path != job.stream_plan.filename]
+            if remove_partials([job.stream_plan.filename]):
+                self._log(job, "🗑️ El parcial de la unión en flujo no se puede reanudar; se borró")
+        if job.keep_partial:
+            if job.partial_files:
+                self._log(job, "⏹️ Cancelado; los archivos parciales se conservan para reanudarlo")
+            return
+        removed = remove_partials(job.partial_files)
+        for path in job.intermediate_files:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        job.partial_files = []
+        job.intermediate_files = []
+        self._log(job, f"⏹️ Cancelado; {removed} archivo(s) parcial(es) borrado(s)")
+
+    @staticmethod
+    def _set_exception(job, exc):
+        job.state = ERROR
+        if isinstance(exc, FileNotFoundError):
+            job.error = "yt-dlp no encontrado. Asegúrate de que esté instalado y en el PATH."
+        else:
+            job.error = f"Error inesperado: {str(exc)}"
+
+    def _rebalance(self):
+        """Reparte de nuevo el ancho de banda entre las descargas que siguen (con el lock tomado)"""
+        running = list(self._running.values())
+        if running and getattr(self.engine, 'live_rate_limit', False):
+            self.bandwidth.assign(running[-1], running, len(self._pending), self.max_workers, True)
+
+    @staticmethod
+    def _close_timings(job):
+        """Cierra la fase en curso y anota los bytes: descargados y, en el posproceso, los resultantes"""
+        job.timings.close(job.finished_at)
+        job.timings.set_bytes(FASE_DESCARGA, job.bytes.downloaded_bytes)
+        output = 0
+        for path in job.output_files:
+            try:
+                output += os.path.getsize(path)
+            except OSError:
+                pass
+        for phase in POSTPROCESS_PHASES:
+            if phase in job.timings.seconds:
+                job.timings.set_bytes(phase, output)
+
+    def _finish(self, job, slots):
+        job.finished_at = time.monotonic()
+        job.process = None
+        self._close_timings(job)
+        if job.state == ERROR:
+            job.failure = classify_failure(job)
+            with self._cond:
+                self.failures.add(job)
+        with self._cond:
+            notice = self.hosts.job_finished(job, job.state == COMPLETADO)
+        if notice is not None:
+            self._log(job, notice)
+        self.listener.on_job_finished(job)
+        self._retire(job)
+        with self._cond:
+            slots.pop(job.key, None)
+            self._rebalance()
+            self._cond.notify_all()
@@ -0,0 +1,411 @@
+# descarga/sharedqueue.py
+"""Cola compartida en SQLite: varios procesos (o máquinas) descargan un mismo lote.
+
+python -m descarga.sharedqueue cola.sqlite          # estado de la cola y de sus trabajadores
+python -m descarga --shared-queue cola.sqlite -i lista.txt --enqueue-only
+python -m descarga --shared-queue cola.sqlite -o ./downloads -j 4
+"""
+import argparse
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from descarga.commands import build_command, options_from_dict, parse_url, portable_options, split_urls
+from descarga.scheduler import (CANCELADO, COMPLETADO, ERROR, ESTADOS_FINALES, OMITIDO, PAUSADO, PENDIENTE, Job,
+                                SchedulerListener)
+
+# Estado de una fila reservada por un trabajador
+RESERVADO = 'reservado'
+
+# Segundos que dura una reserva sin latido; al caducar, otro trabajador recoge la fila
+LEASE_SECONDS = 120.0
+# Segundos entre latidos (renovaciones de las reservas de un trabajador)
+HEARTBEAT_INTERVAL = 30.0
+# Segundos entre consultas de una cola vacía mientras otros aún tienen reservas
+POLL_INTERVAL = 5.0
+# Reservas que puede perder una fila (trabajador caído) antes de darla por fallida
+MAX_CLAIMS = 5
+# Segundos que se espera al bloqueo de escritura de otro proceso
+BUSY_TIMEOUT = 30.0
+# Filas por transacción al encolar una lista larga
+ADD_CHUNK = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cola (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    referer TEXT,
+    opciones TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    trabajador TEXT,
+    vence REAL,
+    reservas INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    archivos TEXT NOT NULL DEFAULT '[]',
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS cola_url ON cola (url, IFNULL(referer, ''));
+CREATE INDEX IF NOT EXISTS cola_estado ON cola (estado, id);
+CREATE TABLE IF NOT EXISTS trabajadores (
+    id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    inicio REAL NOT NULL,
+    latido REAL NOT NULL
+);
+"""
+
+
+def worker_name():
+    """Identificador de este proceso entre los trabajadores de la cola"""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(2)}"
+
+
+class SharedQueue:
+    """Filas de URLs con su estado, reservadas de forma atómica por los trabajadores.
+
+    Cada reserva (claim) se hace en una transacción BEGIN IMMEDIATE, así que
+    dos procesos nunca se llevan la misma fila. La reserva caduca a los
+    lease segundos salvo que el trabajador la renueve con heartbeat(); la de
+    un trabajador caído vuelve a pendiente y la recoge otro (tras MAX_CLAIMS
+    reservas perdidas la fila se da por fallida). Las fechas son time.time()
+    de cada máquina: con varias, sus relojes deben estar sincronizados.
+
+    El modo WAL deja leer mientras otro escribe, pero necesita memoria
+    compartida entre los procesos: solo sirve con la base en un disco local.
+    Para varias máquinas sobre una carpeta de red, wal=False usa el diario
+    clásico, que se apoya en los bloqueos de archivo del sistema de red.
+    """
+
+    def __init__(self, path, lease=LEASE_SECONDS, wal=True):
+        self.path = os.path.abspath(path)
+        self.lease = lease
+        self._lock = threading.Lock()
+        # Sin transacciones implícitas: cada escritura abre la suya con BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute('PRAGMA synchronous=NORMAL' if wal else 'PRAGMA synchronous=FULL')
+        # executescript confirmaría por su cuenta: las sentencias van una a una en la transacción
+        with self._transaction() as conn:
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Transacción de escritura: toma el bloqueo al empezar, no al primer UPDATE"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            self._conn.execute('COMMIT')
+
+    # --- Productores -----------------------------------------------------
+
+    def add(self, lines, options):
+        """Encola las URLs de lines con las opciones del lote; las que ya estaban se descartan.
+
+        Devuelve los contadores de la lectura (como ingest.UrlSource.as_dict()).
+        """
+        opciones = json.dumps(portable_options(options))
+        counts = {'read': 0, 'duplicates': 0, 'queued': 0}
+        chunk = []
+
+        def flush():
+            now = time.time()
+            with self._transaction() as conn:
+                for url, referer in chunk:
+                    cursor = conn.execute(
+                        'INSERT OR IGNORE INTO cola (url, referer, opciones, estado, creado, actualizado) '
+                        'VALUES (?, ?, ?, ?, ?, ?)', (url, referer, opciones, PENDIENTE, now, now))
+                    counts['queued' if cursor.rowcount == 1 else 'duplicates'] += 1
+            chunk.clear()
+
+        for line in lines:
+            for entry in split_urls(line):
+                url, referer, _ = parse_url(entry)
+                counts['read'] += 1
+                chunk.append((url, referer))
+                if len(chunk) >= ADD_CHUNK:
+                    flush()
+        if chunk:
+            flush()
+        return counts
+
+    # --- Trabajadores ----------------------------------------------------
+
+    def register(self, worker):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO trabajadores (id, host, pid, inicio, latido) VALUES (?, ?, ?, ?, ?)',
+                         (worker, socket.gethostname(), os.getpid(), now, now))
+
+    def unregister(self, worker):
+        """Da de baja al trabajador y devuelve a la cola lo que tuviera reservado"""
+        with self._transaction() as conn:
+            # Una baja ordenada no es una reserva perdida: no cuenta para MAX_CLAIMS
+            conn.execute('UPDATE cola SET estado = ?, trabajador = NULL, vence = NULL, '
+                         'reservas = MAX(reservas - 1, 0), actualizado = ? WHERE estado = ? AND trabajador = ?',
+                         (PENDIENTE, time.time(), RESERVADO, worker))
+            conn.execute('DELETE FROM trabajadores WHERE id = ?', (worker,))
+
+    def recover(self, conn, now):
+        """Devuelve a pendiente las reservas caducadas (dentro de una transacción); cuántas"""
+        conn.execute('UPDATE cola SET estado = ?, error = ?, trabajador = NULL, vence = NULL, actualizado = ? '
+                     'WHERE estado = ? AND vence < ? AND reservas >= ?',
+                     (ERROR, f'Reserva caducada {MAX_CLAIMS} veces (¿el trabajador se cierra con esta URL?)',
+                      now, RESERVADO, now, MAX_CLAIMS))
+        cursor = conn.execute('UPDATE cola SET estado = ?, trabajador = NULL, vence = NULL, actualizado = ? '
+                              'WHERE estado = ? AND vence < ?', (PENDIENTE, now, RESERVADO, now))
+        # Trabajadores que dejaron de latir: solo se conservan para consultar el estado
+        conn.execute('DELETE FROM trabajadores WHERE latido < ?', (now - self.lease,))
+        return cursor.rowcount
+
+    def claim(self, worker, limit=1):
+        """Reserva hasta limit filas pendientes para worker; devuelve (filas, reservas recuperadas)"""
+        now = time.time()
+        with self._transaction() as conn:
+            recovered = self.recover(conn, now)
+            rows = conn.execute('SELECT id, url, referer, opciones FROM cola WHERE estado = ? ORDER BY id LIMIT ?',
+                                (PENDIENTE, limit)).fetchall()
+            for row in rows:
+                conn.execute('UPDATE cola SET estado = ?, trabajador = ?, vence = ?, reservas = reservas + 1, '
+                             'actualizado = ? WHERE id = ?', (RESERVADO, worker, now + self.lease, now, row[0]))
+        return ([{'id': row[0], 'url': row[1], 'referer': row[2], 'opciones': json.loads(row[3])} for row in rows],
+                recovered)
+
+    def heartbeat(self, worker, ids):
+        """Renueva las reservas de worker; devuelve las de ids que ya no son suyas"""
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute('UPDATE trabajadores SET latido = ? WHERE id = ?', (now, worker))
+            conn.execute('UPDATE cola SET vence = ? WHERE estado = ? AND trabajador = ?',
+                         (now + self.lease, RESERVADO, worker))
+            held = {row[0] for row in conn.execute('SELECT id FROM cola WHERE estado = ? AND trabajador = ?',
+                                                   (RESERVADO, worker))}
+        return [row_id for row_id in ids if row_id not in held]
+
+    def finish(self, worker, row_id, state, error=None, files=()):
+        """Guarda el resultado de una fila; False si la reserva ya no era de worker"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE cola SET estado = ?, error = ?, archivos = ?, trabajador = NULL, vence = NULL, '
+                'actualizado = ? WHERE id = ? AND estado = ? AND trabajador = ?',
+                (state, error, json.dumps(list(files)), time.time(), row_id, RESERVADO, worker))
+        return cursor.rowcount == 1
+
+    def release(self, worker, row_id):
+        """Devuelve una fila reservada a la cola sin resultado (p. ej. al detener el trabajador).
+
+        La reserva devuelta a propósito se descuenta: solo las que caducan
+        (trabajador caído) cuentan para MAX_CLAIMS.
+        """
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'UPDATE cola SET estado = ?, trabajador = NULL, vence = NULL, reservas = MAX(reservas - 1, 0), '
+                'actualizado = ? WHERE id = ? AND estado = ? AND trabajador = ?',
+                (PENDIENTE, time.time(), row_id, RESERVADO, worker))
+        return cursor.rowcount == 1
+
+    # --- Consultas -------------------------------------------------------
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute('SELECT estado, COUNT(*) FROM cola GROUP BY estado').fetchall())
+
+    def drained(self):
+        """¿No queda nada pendiente ni reservado por nadie?"""
+        with self._lock:
+            row = self._conn.execute('SELECT 1 FROM cola WHERE estado IN (?, ?) LIMIT 1',
+                                     (PENDIENTE, RESERVADO)).fetchone()
+        return row is None
+
+    def workers(self):
+        """Trabajadores registrados con su último latido y sus filas reservadas"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT t.id, t.host, t.pid, t.latido, COUNT(c.id) FROM trabajadores t '
+                'LEFT JOIN cola c ON c.trabajador = t.id AND c.estado = ? GROUP BY t.id ORDER BY t.inicio',
+                (RESERVADO,)).fetchall()
+        now = time.time()
+        return [{'id': row[0], 'host': row[1], 'pid': row[2], 'seconds_since_heartbeat': round(now - row[3], 1),
+                 'claimed': row[4]} for row in rows]
+
+
+class QueueWorker(SchedulerListener):
+    """Alimenta un planificador (keep_alive=True) con filas reservadas de la cola compartida.
+
+    Reserva como mucho claim_ahead filas más de las que están descargando,
+    renueva sus reservas cada HEARTBEAT_INTERVAL y, cuando terminan todos
+    los trabajos de una fila (una playlist se expande en varios), guarda el
+    resultado. Los trabajos cancelados (Ctrl+C) vuelven a la cola para otro
+    trabajador. El número de cada trabajo es el id de su fila, igual en
+    todas las máquinas. Detiene el planificador cuando la cola se vacía.
+    """
+
+    def __init__(self, queue, paths, claim_ahead, log=None, poll=POLL_INTERVAL):
+        self.queue = queue
+        self.paths = paths
+        self.claim_ahead = max(1, int(claim_ahead))
+        self.log = log or (lambda line: None)
+        self.poll = poll
+        # Varios latidos por reserva: uno perdido no basta para que caduque
+        self.heartbeat_interval = min(HEARTBEAT_INTERVAL, queue.lease / 4)
+        self.name = worker_name()
+        self._lock = threading.Lock()
+        # Por fila: claves de sus trabajos abiertos y resultados de los terminados
+        self._open = {}
+        self._results = {}
+        self._lost = set()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self, scheduler):
+        self.queue.register(self.name)
+        self._thread = threading.Thread(target=self._feed, args=(scheduler,), name='cola-compartida', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Deja de reservar filas y devuelve a la cola las que no llegaron a terminar"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.queue.unregister(self.name)
+
+    def job_for(self, row):
+        """Job de una fila reservada, con las opciones del lote y las rutas de esta máquina"""
+        try:
+            options = options_from_dict(row['opciones'], **self.paths)
+        except ValueError as e:
+            self.queue.finish(self.name, row['id'], ERROR, str(e))
+            return None
+        return Job(row['id'] - 1, build_command(row['url'], row['referer'], options), row['url'], row['referer'])
+
+    def _feed(self, scheduler):
+        last_beat = time.monotonic()
+        while not self._stopped.is_set():
+            claimed = 0
+            try:
+                if time.monotonic() - last_beat >= self.heartbeat_interval:
+                    last_beat = time.monotonic()
+                    self._heartbeat()
+                claimed = self._claim(scheduler)
+                if not claimed and self._drained(scheduler):
+                    self.log("🏁 La cola compartida está vacía")
+                    scheduler.stop()
+                    return
+            except sqlite3.Error as e:
+                # Base bloqueada demasiado tiempo o carpeta de red caída: se reintenta en la siguiente vuelta
+                self.log(f"⚠️ Cola compartida: {e}")
+            # Con filas recién reservadas se vuelve pronto a mirar si hay hueco
+            self._stopped.wait(1.0 if claimed else min(self.poll, self.heartbeat_interval))
+
+    def _claim(self, scheduler):
+        """Reserva filas hasta tener claim_ahead trabajos en espera; devuelve cuántos se encolaron"""
+        waiting = sum(1 for job in scheduler.active_jobs() if job.state in (PENDIENTE, PAUSADO))
+        if waiting >= self.claim_ahead:
+            return 0
+        rows, recovered = self.queue.claim(self.name, self.claim_ahead - waiting)
+        if recovered:
+            self.log(f"♻️ {recovered} reserva(s) caducada(s) de otros trabajadores vuelven a la cola")
+        jobs = [job for job in map(self.job_for, rows) if job is not None]
+        with self._lock:
+            for job in jobs:
+                self._open.setdefault(job.index + 1, set())
+        scheduler.submit(jobs)
+        return len(jobs)
+
+    def _drained(self, scheduler):
+        """¿Nada en curso aquí ni pendiente o reservado en la cola?"""
+        with self._lock:
+            if self._open:
+                return False
+        return not scheduler.active_jobs() and self.queue.drained()
+
+    def _heartbeat(self):
+        with self._lock:
+            held = list(self._open)
+        lost = set(self.queue.heartbeat(self.name, held)) - self._lost
+        if lost:
+            self._lost |= lost
+            self.log(f"⚠️ Se perdió la reserva de {', '.join(map(str, sorted(lost)))}: "
+                     f"su resultado lo decidirá otro trabajador")
+
+    def _row_done(self, row_id):
+        """Guarda el resultado de una fila cuyos trabajos han terminado todos"""
+        states, errors, files = self._results.pop(row_id, ([], [], []))
+        if CANCELADO in states:
+            self.queue.release(self.name, row_id)
+            return
+        if ERROR in states:
+            state = ERROR
+        elif states and all(state == OMITIDO for state in states):
+            state = OMITIDO
+        else:
+            state = COMPLETADO
+        self.queue.finish(self.name, row_id, state, '; '.join(errors) or None, files)
+
+    # --- Eventos del planificador ----------------------------------------
+
+    def on_job_queued(self, job):
+        # También los videos de una playlist: la fila espera a todos
+        with self._lock:
+            self._open.setdefault(job.index + 1, set()).add(job.key)
+
+    def on_job_finished(self, job):
+        row_id = job.index + 1
+        with self._lock:
+            keys = self._open.get(row_id, set())
+            keys.discard(job.key)
+            if job.state in ESTADOS_FINALES:
+                states, errors, files = self._results.setdefault(row_id, ([], [], []))
+                states.append(job.state)
+                if job.error:
+                    errors.append(job.error)
+                files.extend(job.output_files)
+            if keys:
+                return
+            self._open.pop(row_id, None)
+        self._row_done(row_id)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m descarga.sharedqueue',
+        description='Estado de una cola compartida: filas por estado y trabajadores con su último latido.'
+    )
+    parser.add_argument('path', help='Archivo SQLite de la cola')
+    parser.add_argument('--no-wal', action='store_true', help='Diario clásico (cola en una carpeta de red)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(args.path):
+        print(f"No existe la cola: {args.path}", file=sys.stderr)
+        return 2
+    queue = SharedQueue(args.path, wal=not args.no_wal)
+    try:
+        print(json.dumps({'states': queue.counts(), 'workers': queue.workers()}, ensure_ascii=False, indent=2))
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
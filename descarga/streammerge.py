@@ -0,0 +1,155 @@
+# descarga/streammerge.py
+"""Unión en flujo: video y audio se descargan a la vez y FFmpeg los une según llegan los bytes"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from descarga.formats import codec_name, fits_container
+from descarga.progress import ProgressEvent
+
+# Protocolos que FFmpeg lee directamente de la URL; HLS y DASH por fragmentos siguen el camino normal
+STREAMABLE_PROTOCOLS = ('http', 'https')
+
+# Con un video y un audio, el descargador FFmpeg de yt-dlp hace una sola llamada que lee las
+# dos URLs a la vez y escribe el archivo final (.part hasta terminar); sin intermedios ni [Merger]
+DOWNLOADER_ARGS = [
+    # 'http' abarca también https
+    '--downloader', 'http:ffmpeg',
+    # Reconectar si el servidor corta una conexión larga, en vez de dejar el archivo a medias
+    '--downloader-args', 'ffmpeg_i:-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5',
+    # Sin la línea de estadísticas que FFmpeg reescribe con '\r' (el progreso sale del tamaño del .part)
+    '--downloader-args', 'ffmpeg:-nostats -loglevel warning',
+]
+
+# Segundos entre dos lecturas del tamaño del archivo en curso
+POLL_INTERVAL = 1.0
+
+# Línea con la que yt-dlp anuncia la ruta final antes de lanzar FFmpeg
+DESTINATION_MARKER = '[download] Destination:'
+
+
+@dataclass
+class StreamPlan:
+    """Decisión para un trabajo que une video y audio"""
+    streamable: bool
+    selector: str = None      # formatos fijados ('137+140'), los mismos de la info
+    total_bytes: int = None
+    description: str = ''
+    filename: str = None      # ruta final, cuando yt-dlp la anuncia; FFmpeg escribe en <ruta>.part
+
+    def describe(self):
+        if self.streamable:
+            return f"⚡ Unión en flujo: {self.description}; FFmpeg escribe el archivo final mientras se descarga"
+        return f"↩️ Sin unión en flujo ({self.description}): se descarga y se une como siempre"
+
+    def output_line(self, line):
+        """Toma la ruta de destino de la salida de yt-dlp"""
+        if line.startswith(DESTINATION_MARKER):
+            self.filename = line[len(DESTINATION_MARKER):].strip()
+
+
+def merge_selector(cmd):
+    """Valor de -f si une video y audio ('A+B'), o None"""
+    if '-f' not in cmd:
+        return None
+    selector = cmd[cmd.index('-f') + 1]
+    if '+' in selector and '/' not in selector and ',' not in selector:
+        return selector
+    return None
+
+
+def _option_value(cmd, option):
+    if option in cmd:
+        index = cmd.index(option)
+        if index + 1 < len(cmd):
+            return cmd[index + 1]
+    return None
+
+
+def plan_stream_merge(info, cmd):
+    """Plan para unir en flujo el trabajo, o None si no une video y audio.
+
+    Solo se une en flujo un video y un audio servidos por HTTP(S) de una
+    pieza, con códecs que caben en el contenedor de --merge-output-format y
+    sin subtítulos (yt-dlp los bajaría también con FFmpeg). En cualquier otro
+    caso el plan devuelto no es streamable y el trabajo sigue el camino de
+    siempre: dos descargas y la unión al final.
+    """
+    if merge_selector(cmd) is None:
+        return None
+    if not info:
+        return StreamPlan(False, description='sin la info del video')
+    if info.get('_type', 'video') != 'video':
+        return None
+    requested = info.get('requested_formats') or []
+    if len(requested) != 2:
+        return StreamPlan(False, description=f"{len(requested) or 'un'} formato(s) en vez de video + audio")
+    video, audio = requested
+    protocols = [fmt.get('protocol') or 'https' for fmt in requested]
+    unsupported = [protocol for protocol in protocols if protocol not in STREAMABLE_PROTOCOLS]
+    if unsupported:
+        return StreamPlan(False, description=f"protocolo {', '.join(unsupported)}")
+    if '--write-subs' in cmd:
+        return StreamPlan(False, description='con subtítulos')
+    container = _option_value(cmd, '--merge-output-format') or info.get('ext')
+    if not fits_container(video, audio, container):
+        codecs = '+'.join(filter(None, (codec_name(video.get('vcodec')), codec_name(audio.get('acodec')))))
+        return StreamPlan(False, description=f"{codecs or 'códecs desconocidos'} no caben en {container} "
+                                             f"sin recodificar")
+    sizes = [fmt.get('filesize') or fmt.get('filesize_approx') for fmt in requested]
+    selector = '+'.join(str(fmt['format_id']) for fmt in requested)
+    return StreamPlan(True, selector, sum(sizes) if all(sizes) else None, f"{selector} a la vez en {container}")
+
+
+def apply_stream_plan(cmd, plan):
+    """Comando con los formatos del plan fijados y el descargador FFmpeg para HTTP(S)"""
+    cmd = list(cmd)
+    cmd[cmd.index('-f') + 1] = plan.selector
+    return cmd + DOWNLOADER_ARGS
+
+
+class PartWatcher:
+    """Progreso de una unión en flujo a partir del tamaño del .part que escribe FFmpeg.
+
+    El descargador FFmpeg de yt-dlp solo avisa al terminar; mientras tanto
+    se lee el tamaño del archivo cada POLL_INTERVAL y se envía como un
+    progress.ProgressEvent del mismo archivo, así que el aviso final de
+    yt-dlp lo sustituye sin contar dos veces.
+    """
+
+    def __init__(self, job, scheduler, plan, interval=POLL_INTERVAL):
+        self.job = job
+        self.scheduler = scheduler
+        self.plan = plan
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._watch, daemon=True, name='union-en-flujo')
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _watch(self):
+        last_size, last_time = 0, time.monotonic()
+        while not self._stop.wait(self.interval):
+            if self.plan.filename is None:
+                continue
+            try:
+                size = os.path.getsize(self.plan.filename + '.part')
+            except OSError:
+                continue
+            now = time.monotonic()
+            speed = (size - last_size) / (now - last_time) if size >= last_size else None
+            last_size, last_time = size, now
+            if self.job.paused or size == 0:
+                continue
+            total = self.plan.total_bytes
+            eta = (total - size) / speed if total and speed and total > size else None
+            self.scheduler.job_progress_event(self.job, ProgressEvent(
+                'downloading', self.plan.filename, size, total, speed, eta))
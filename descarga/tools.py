@@ -0,0 +1,193 @@
+# descarga/tools.py
+"""Localización de yt-dlp y FFmpeg con caché en disco de rutas y versiones"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from dataclasses import dataclass
+
+from descarga.paths import cache_dir
+
+TOOLS_CACHE_NAME = 'herramientas.json'
+VERSION_TIMEOUT = 10
+
+
+@dataclass
+class ToolInfo:
+    """Resultado de localizar una herramienta; available es None si aún no se comprobó"""
+    name: str
+    path: str
+    available: bool = None
+    version: str = None
+    from_cache: bool = False
+
+
+def _stat_key(path):
+    """Clave de validez de una ruta: (mtime_ns, tamaño), o None si no existe"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class ToolCache:
+    """Caché JSON de herramientas: ruta, mtime/tamaño, disponibilidad y versión"""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), TOOLS_CACHE_NAME)
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def get(self, name):
+        """Devuelve el ToolInfo guardado si la ruta sigue existiendo con el mismo mtime"""
+        with self._lock:
+            entry = self._load().get(name)
+        if not entry or _stat_key(entry['path']) != entry.get('stat'):
+            return None
+        if not entry.get('available'):
+            # Un fallo (p. ej. un antivirus que retuvo el primer arranque) no se da por definitivo
+            return None
+        return ToolInfo(name, entry['path'], entry.get('available'), entry.get('version'), from_cache=True)
+
+    def put(self, info):
+        """Guarda una herramienta comprobada; las no disponibles no se guardan y se vuelven a comprobar"""
+        with self._lock:
+            data = self._load()
+            if info.available:
+                data[info.name] = {'path': info.path, 'stat': _stat_key(info.path),
+                                   'available': info.available, 'version': info.version}
+            elif data.pop(info.name, None) is None:
+                return
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+_default_cache = None
+
+
+def default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ToolCache()
+    return _default_cache
+
+
+def bundle_dirs():
+    """Carpetas donde un ejecutable de PyInstaller deja las herramientas empaquetadas.
+
+    sys._MEIPASS es la carpeta de los datos: la de extracción temporal con
+    --onefile o la carpeta de la aplicación (o su '_internal') con --onedir.
+    Junto al ejecutable se buscan las que el usuario haya puesto a mano.
+    """
+    if not getattr(sys, 'frozen', False):
+        return []
+    dirs = [getattr(sys, '_MEIPASS', None), os.path.dirname(sys.executable)]
+    return [path for i, path in enumerate(dirs) if path and path not in dirs[:i]]
+
+
+def _bundled(exe_name):
+    """Ruta de la herramienta empaquetada con la aplicación, si existe"""
+    for app_dir in bundle_dirs():
+        bundled = os.path.join(app_dir, exe_name)
+        if os.path.exists(bundled):
+            return bundled
+    return None
+
+
+def _find_ytdlp():
+    bundled = _bundled('yt-dlp.exe')
+    if bundled:
+        return bundled
+    # Buscar en el entorno virtual local (Windows y Unix)
+    for venv_ytdlp in (os.path.join(os.getcwd(), '.venv', 'Scripts', 'yt-dlp.exe'),
+                       os.path.join(os.getcwd(), '.venv', 'bin', 'yt-dlp')):
+        if os.path.exists(venv_ytdlp):
+            return venv_ytdlp
+    # Buscar en el PATH del sistema sin lanzar procesos (funciona en Windows y Linux)
+    return shutil.which('yt-dlp') or 'yt-dlp'
+
+
+def _find_ffmpeg():
+    bundled = _bundled('ffmpeg.exe')
+    if bundled:
+        return bundled
+    return shutil.which('ffmpeg') or 'ffmpeg'
+
+
+FINDERS = {'yt-dlp': _find_ytdlp, 'ffmpeg': _find_ffmpeg}
+
+
+def lookup_tool(name, cache=None):
+    """Localiza la herramienta sin lanzar procesos, usando la caché si sigue siendo válida"""
+    cache = cache or default_cache()
+    cached = cache.get(name)
+    if cached is not None:
+        return cached
+    return ToolInfo(name, FINDERS[name]())
+
+
+def _probe_version(name, path):
+    """Ejecuta la herramienta para obtener su versión; devuelve (disponible, versión)"""
+    flag = '--version' if name == 'yt-dlp' else '-version'
+    try:
+        result = subprocess.run(
+            [path, flag], capture_output=True, text=True, timeout=VERSION_TIMEOUT,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False, None
+    if result.returncode != 0:
+        return False, None
+    if name == 'yt-dlp':
+        return True, result.stdout.strip()
+    # Extraer versión de ffmpeg de la primera línea
+    version_line = result.stdout.split('\n')[0]
+    if 'ffmpeg version' in version_line:
+        return True, version_line.split('ffmpeg version')[1].split()[0]
+    return True, "Desconocida"
+
+
+def probe_tool(name, cache=None):
+    """Comprueba disponibilidad y versión; solo lanza la herramienta si la caché no sirve"""
+    cache = cache or default_cache()
+    info = lookup_tool(name, cache)
+    if info.available is not None:
+        return info
+    info.available, info.version = _probe_version(name, info.path)
+    cache.put(info)
+    return info
+
+
+def get_ytdlp_path():
+    """Obtiene la ruta correcta de yt-dlp, ya sea empaquetado o instalado"""
+    return lookup_tool('yt-dlp').path
+
+
+def get_ffmpeg_path():
+    """Obtiene la ruta correcta de ffmpeg, ya sea empaquetado o instalado"""
+    return lookup_tool('ffmpeg').path
@@ -57,8 +57,9 @@ if %errorlevel% neq 0 (
 )
 
 echo ✅ ¡Construcción completada!
-echo 📦 El ejecutable está en: dist\VideoDescarga.exe
-echo 💡 Puedes distribuir este archivo sin necesidad de instalar Python ni FFmpeg
+echo 📦 La aplicación está en: dist\VideoDescarga\VideoDescarga.exe
+echo 💡 Distribuye la carpeta dist\VideoDescarga completa (o usa package_for_distribution.bat); no necesita Python ni FFmpeg
+echo    Para un único .exe ^(más lento al abrir^): python build_exe.py --un-archivo
 
 echo.
 echo Presiona cualquier tecla para salir...
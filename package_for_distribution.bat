@@ -3,8 +3,10 @@ echo ======================================
 echo Video Descarga - Empaquetador para Distribución
 echo ======================================
 
-REM Verificar que el ejecutable existe
-if not exist "dist\VideoDescarga.exe" (
+REM Verificar que el ejecutable existe (modo carpeta o un solo .exe)
+set APP_DIR=
+if exist "dist\VideoDescarga\VideoDescarga.exe" set APP_DIR=dist\VideoDescarga
+if not defined APP_DIR if not exist "dist\VideoDescarga.exe" (
     echo ❌ ERROR: El ejecutable no existe
     echo Ejecuta primero: install_and_build.bat
     pause
@@ -23,12 +25,16 @@ if exist "%DIST_DIR%" (
 echo 📦 Creando paquete de distribución...
 mkdir "%DIST_DIR%"
 
-REM Copiar ejecutable
-copy "dist\VideoDescarga.exe" "%DIST_DIR%\"
+REM Copiar la aplicación: la carpeta completa o el único .exe
+if defined APP_DIR (
+    xcopy "%APP_DIR%" "%DIST_DIR%\" /E /I /Q /Y >nul
+) else (
+    copy "dist\VideoDescarga.exe" "%DIST_DIR%\"
+)
 echo ✅ Ejecutable copiado
 
 REM Crear directorio de descargas
-mkdir "%DIST_DIR%\downloads"
+if not exist "%DIST_DIR%\downloads" mkdir "%DIST_DIR%\downloads"
 echo ✅ Directorio de descargas creado
 
 REM Crear archivo README para el usuario final
@@ -0,0 +1,131 @@
+"""Caché de construcción contra un servidor HTTP local con ETag"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from build_cache import OBJECTS_DIR, BuildCache, BuildCacheError
+
+MEMBERS = {
+    'ffmpeg-x/bin/ffmpeg.exe': b'ffmpeg ' * 1000,
+    'ffmpeg-x/bin/ffprobe.exe': b'ffprobe ' * 1000,
+    'ffmpeg-x/LICENSE.txt': b'licencia',
+}
+
+
+def make_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in MEMBERS.items():
+            zf.writestr(name, data)
+    return buffer.getvalue()
+
+
+class ZipHandler(BaseHTTPRequestHandler):
+    """Sirve el ZIP con un ETag y responde 304 si el cliente ya lo tiene"""
+    body = make_zip()
+    etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+    downloads = 0
+    revalidations = 0
+
+    def do_GET(self):
+        if self.path != '/ffmpeg.zip':
+            self.send_error(404)
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            type(self).revalidations += 1
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        type(self).downloads += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/zip')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BuildCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), ZipHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/ffmpeg.zip"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        ZipHandler.downloads = ZipHandler.revalidations = 0
+        self._dir = tempfile.TemporaryDirectory()
+        self.root = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def objects(self):
+        """Sumas de los objetos guardados en la caché"""
+        return {name for _, _, files in os.walk(os.path.join(self.root, OBJECTS_DIR)) for name in files}
+
+    def test_first_fetch_stores_object(self):
+        path = BuildCache(self.root).fetch(self.url)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), ZipHandler.body)
+        digest = hashlib.sha256(ZipHandler.body).hexdigest()
+        self.assertEqual(os.path.basename(path), digest)
+        self.assertEqual(self.objects(), {digest})
+        self.assertEqual(ZipHandler.downloads, 1)
+
+        # Otra instancia con el índice en disco no vuelve a conectarse mientras está vigente
+        self.assertEqual(BuildCache(self.root).fetch(self.url), path)
+        self.assertEqual((ZipHandler.downloads, ZipHandler.revalidations), (1, 0))
+
+    def test_not_modified_does_not_download_again(self):
+        first = BuildCache(self.root, max_age=0).fetch(self.url)
+        second = BuildCache(self.root, max_age=0).fetch(self.url)
+        self.assertEqual(first, second)
+        self.assertEqual((ZipHandler.downloads, ZipHandler.revalidations), (1, 1))
+
+    def test_extract_member_writes_only_that_member(self):
+        cache = BuildCache(self.root)
+        path = cache.extract_member(self.url, 'ffmpeg.exe')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), MEMBERS['ffmpeg-x/bin/ffmpeg.exe'])
+        expected = {hashlib.sha256(data).hexdigest()
+                    for data in (ZipHandler.body, MEMBERS['ffmpeg-x/bin/ffmpeg.exe'])}
+        self.assertEqual(self.objects(), expected)
+        self.assertEqual(sorted(os.listdir(self.root)), sorted([OBJECTS_DIR, 'indice.json']))
+
+        # Ya extraído, se sirve desde el índice sin volver a abrir el ZIP
+        self.assertEqual(BuildCache(self.root).extract_member(self.url, 'ffmpeg.exe'), path)
+        with self.assertRaises(BuildCacheError):
+            cache.extract_member(self.url, 'ffplay.exe')
+
+    def test_sha256_mismatch_raises(self):
+        cache = BuildCache(self.root)
+        with self.assertRaises(BuildCacheError):
+            cache.fetch(self.url, sha256='0' * 64)
+        self.assertEqual(self.objects(), set())
+        self.assertNotIn(self.url, BuildCache(self.root).index['urls'])
+
+        # Con la suma correcta se guarda, y después ya no se pregunta al servidor
+        digest = hashlib.sha256(ZipHandler.body).hexdigest()
+        cache.fetch(self.url, sha256=digest)
+        cache.fetch(self.url, sha256=digest)
+        self.assertEqual(ZipHandler.downloads, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
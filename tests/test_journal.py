@@ -0,0 +1,75 @@
+"""Diario de trabajos: los lotes terminados no se acumulan de una ejecución a otra"""
+import sqlite3
+import tempfile
+import unittest
+
+from descarga.journal import JobJournal, journal_path
+from descarga.scheduler import CANCELADO, COMPLETADO, ERROR, Job
+
+
+def make_jobs(count, prefix):
+    return [Job(i, ['yt-dlp', f"http://127.0.0.1/{prefix}{i}"], f"http://127.0.0.1/{prefix}{i}")
+            for i in range(count)]
+
+
+def finish(journal, job, state):
+    job.state = state
+    journal.on_job_finished(job)
+
+
+class JobJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.output_dir = self._dir.name
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def rows(self):
+        with sqlite3.connect(journal_path(self.output_dir)) as conn:
+            return conn.execute('SELECT lote, estado FROM trabajos').fetchall()
+
+    def run_batch(self, batch, states):
+        journal = JobJournal(self.output_dir)
+        jobs = make_jobs(len(states), batch)
+        journal.add_jobs(jobs, batch=batch)
+        for job, state in zip(jobs, states):
+            if state is not None:
+                finish(journal, job, state)
+        journal.close()
+
+    def test_finished_batches_do_not_accumulate(self):
+        for number in range(5):
+            self.run_batch(f"lote{number}", [COMPLETADO, COMPLETADO, ERROR])
+            # Al abrirlo para el siguiente lote, los anteriores ya se han borrado
+            JobJournal(self.output_dir).close()
+            self.assertEqual(self.rows(), [])
+
+    def test_batch_with_work_left_is_kept(self):
+        self.run_batch('cortado', [COMPLETADO, CANCELADO, None])
+        self.run_batch('terminado', [COMPLETADO, COMPLETADO])
+        journal = JobJournal(self.output_dir)
+        try:
+            self.assertEqual({lote for lote, _ in self.rows()}, {'cortado'})
+            self.assertEqual(len(journal.unfinished()), 2)
+
+            # Reanudado y terminado, el lote también se borra al volver a abrir
+            for job in journal.resume_jobs():
+                finish(journal, job, COMPLETADO)
+        finally:
+            journal.close()
+        JobJournal(self.output_dir).close()
+        self.assertEqual(self.rows(), [])
+
+    def test_discarded_batch_is_removed(self):
+        self.run_batch('descartado', [COMPLETADO, None])
+        journal = JobJournal(self.output_dir)
+        journal.discard_unfinished()
+        journal.close()
+        JobJournal(self.output_dir).close()
+        self.assertEqual(self.rows(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+"""Cola compartida con varios procesos reales sobre una base SQLite temporal"""
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from descarga.commands import DownloadOptions
+from descarga.scheduler import COMPLETADO, ERROR, PENDIENTE
+from descarga.sharedqueue import MAX_CLAIMS, RESERVADO, SharedQueue
+
+ROWS = 200
+WORKERS = 4
+# Reserva corta para que caduque durante la prueba
+SHORT_LEASE = 0.5
+
+
+def drain(path):
+    """Trabajador: reserva filas hasta vaciar la cola y las da por completadas; devuelve sus ids"""
+    queue = SharedQueue(path)
+    name = f"trabajador-{os.getpid()}"
+    queue.register(name)
+    claimed = []
+    try:
+        while True:
+            rows, _ = queue.claim(name, 3)
+            if not rows:
+                return claimed
+            for row in rows:
+                claimed.append(row['id'])
+                assert queue.finish(name, row['id'], COMPLETADO)
+    finally:
+        queue.close()
+
+
+def claim_and_die(path, count):
+    """Trabajador que reserva filas y se cae sin terminarlas ni volver a latir"""
+    queue = SharedQueue(path, lease=SHORT_LEASE)
+    queue.register('caido')
+    queue.claim('caido', count)
+    os._exit(0)
+
+
+class SharedQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'cola.sqlite')
+        self.queue = SharedQueue(self.path)
+        self.context = multiprocessing.get_context('spawn')
+
+    def tearDown(self):
+        self.queue.close()
+        self._dir.cleanup()
+
+    def add(self, count):
+        lines = [f"http://127.0.0.1/video/{number}" for number in range(count)]
+        self.assertEqual(self.queue.add(lines, DownloadOptions())['queued'], count)
+
+    def rows(self):
+        with sqlite3.connect(self.path) as conn:
+            return {row[0]: row[1:] for row in conn.execute('SELECT id, estado, reservas FROM cola')}
+
+    def run_workers(self):
+        with self.context.Pool(WORKERS) as pool:
+            return pool.map(drain, [self.path] * WORKERS)
+
+    def test_each_row_is_claimed_once(self):
+        self.add(ROWS)
+        claimed = [row_id for ids in self.run_workers() for row_id in ids]
+        self.assertEqual(sorted(claimed), sorted(self.rows()))
+        self.assertEqual(self.queue.counts(), {COMPLETADO: ROWS})
+        self.assertEqual({reservas for _, reservas in self.rows().values()}, {1})
+
+    def test_expired_lease_is_recovered(self):
+        self.add(10)
+        dead = self.context.Process(target=claim_and_die, args=(self.path, 4))
+        dead.start()
+        dead.join()
+        lost = [row_id for row_id, (estado, _) in self.rows().items() if estado == RESERVADO]
+        self.assertEqual(len(lost), 4)
+
+        # Mientras la reserva sigue vigente nadie más se lleva esas filas
+        rows, recovered = self.queue.claim('otro', 10)
+        self.assertEqual(recovered, 0)
+        self.assertFalse({row['id'] for row in rows} & set(lost))
+        for row in rows:
+            self.queue.finish('otro', row['id'], COMPLETADO)
+
+        time.sleep(SHORT_LEASE * 2)
+        claimed = [row_id for ids in self.run_workers() for row_id in ids]
+        self.assertEqual(sorted(claimed), sorted(lost))
+        self.assertEqual(self.queue.counts(), {COMPLETADO: 10})
+        self.assertEqual({self.rows()[row_id][1] for row_id in lost}, {2})
+
+    def test_heartbeat_keeps_lease(self):
+        self.add(1)
+        holder = SharedQueue(self.path, lease=SHORT_LEASE)
+        try:
+            [row], _ = holder.claim('vivo', 1)
+            deadline = time.monotonic() + SHORT_LEASE * 4
+            while time.monotonic() < deadline:
+                self.assertEqual(holder.heartbeat('vivo', [row['id']]), [])
+                self.assertEqual(self.queue.claim('otro', 1), ([], 0))
+                time.sleep(SHORT_LEASE / 4)
+        finally:
+            holder.close()
+
+    def test_release_does_not_count_as_lost_claim(self):
+        self.add(1)
+        for _ in range(MAX_CLAIMS + 1):
+            [row], _ = self.queue.claim('parado', 1)
+            self.assertTrue(self.queue.release('parado', row['id']))
+        self.assertEqual(list(self.rows().values()), [(PENDIENTE, 0)])
+
+        # Las que caducan sí cuentan: tras MAX_CLAIMS la fila se da por fallida
+        short = SharedQueue(self.path, lease=0)
+        try:
+            for _ in range(MAX_CLAIMS):
+                short.claim('caido', 1)
+                time.sleep(0.01)
+            self.assertEqual(short.claim('otro', 1), ([], 0))
+        finally:
+            short.close()
+        self.assertEqual(self.queue.counts(), {ERROR: 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
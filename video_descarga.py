@@ -1,204 +1,366 @@
 # video_descarga.py
 import sys
-import subprocess
-import shutil
 import os
-import re
+import json
+import queue
+import time
+from dataclasses import asdict
+
+# Referencia para medir el tiempo hasta que la ventana es visible
+STARTUP_T0 = time.perf_counter()
+
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QPushButton,
-    QTextEdit, QComboBox, QProgressBar, QMessageBox, QCheckBox, QSpinBox, QGroupBox, QGridLayout
+    QTextEdit, QComboBox, QProgressBar, QMessageBox, QCheckBox, QSpinBox, QDoubleSpinBox, QGroupBox, QGridLayout,
+    QFileDialog, QTableWidget, QTableWidgetItem, QAbstractItemView, QHeaderView
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-
-def get_ytdlp_path():
-    """Obtiene la ruta correcta de yt-dlp, ya sea empaquetado o instalado"""
-    # Si estamos en un ejecutable empaquetado, buscar en el directorio del ejecutable
-    if getattr(sys, 'frozen', False):
-        # Ejecutable empaquetado
-        app_dir = os.path.dirname(sys.executable)
-        bundled_ytdlp = os.path.join(app_dir, 'yt-dlp.exe')
-        if os.path.exists(bundled_ytdlp):
-            return bundled_ytdlp
-    
-    # Buscar en el entorno virtual local
-    venv_ytdlp = os.path.join(os.getcwd(), ".venv", "Scripts", "yt-dlp.exe")
-    if os.path.exists(venv_ytdlp):
-        return venv_ytdlp
-    
-    # Buscar en el PATH del sistema
-    try:
-        result = subprocess.run(['where', 'yt-dlp'], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            return result.stdout.strip().split('\n')[0]
-    except:
-        pass
-    
-    # Como último recurso, usar 'yt-dlp' (debe estar en PATH)
-    return 'yt-dlp'
-
-def get_ffmpeg_path():
-    """Obtiene la ruta correcta de ffmpeg, ya sea empaquetado o instalado"""
-    # Si estamos en un ejecutable empaquetado, buscar en el directorio del ejecutable
-    if getattr(sys, 'frozen', False):
-        # Ejecutable empaquetado
-        app_dir = os.path.dirname(sys.executable)
-        bundled_ffmpeg = os.path.join(app_dir, 'ffmpeg.exe')
-        if os.path.exists(bundled_ffmpeg):
-            return bundled_ffmpeg
-    
-    # Buscar en el PATH del sistema
-    try:
-        result = subprocess.run(['where', 'ffmpeg'], capture_output=True, text=True, shell=True)
-        if result.returncode == 0:
-            return result.stdout.strip().split('\n')[0]
-    except:
-        pass
-    
-    # Como último recurso, usar 'ffmpeg' (debe estar en PATH)
-    return 'ffmpeg'
+from PyQt5.QtCore import QThread, QTimer, QItemSelectionModel, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+
+from descarga.engines import ENGINES, startup_summary
+from descarga.archive import DownloadArchive
+from descarga.client import DaemonClient, DaemonError
+from descarga.commands import CALIDADES, FORMATOS, DownloadOptions
+from descarga.daemon import service_args
+from descarga.ingest import UrlSource, iter_file_lines, iter_text_lines
+from descarga.fragments import FragmentTuner
+from descarga.journal import JobJournal
+from descarga.limits import format_rate
+from descarga.logbuffer import LogBuffer
+from descarga.metrics import METRICS_JSONL_NAME, METRICS_PROM_NAME, MetricsRecorder
+from descarga.metadata import MetadataCache
+from descarga.paths import cache_dir
+from descarga.progress import format_eta, progress_line
+from descarga.playlists import PlaylistExpander
+from descarga.priority import POLICIES, POLICY_LABELS
+from descarga.retry import DEFAULT_ATTEMPTS, RetryPolicy
+from descarga.scheduler import (JobScheduler, SchedulerListener, COMPLETADO, ESTADOS_FINALES, EXPANDIDO, OMITIDO,
+                                EJECUTANDO, PAUSADO, FASE_POSPROCESO)
+from descarga.tools import default_cache, lookup_tool, probe_tool
+
+# Líneas que conserva la terminal embebida y frecuencia con la que se vacía el log
+MAX_TERMINAL_LINES = 5000
+LOG_DRAIN_INTERVAL_MS = 150
+
+# Filas como máximo en la tabla de trabajos activos (el resto sigue en cola)
+JOB_TABLE_ROWS = 200
+
+# Segundos que espera cada consulta de eventos al servicio local y eventos
+# anteriores que se muestran al conectarse
+SERVICE_POLL_SECONDS = 1.0
+SERVICE_HISTORY_EVENTS = 200
+
+STARTUP_TIMES_NAME = 'arranque.json'
+CACHE_LABELS = {'fria': 'fría', 'caliente': 'caliente'}
+
+
+class WorkerListener(SchedulerListener):
+    """Traduce los eventos del planificador a señales Qt del worker"""
+
+    def __init__(self, worker):
+        self.worker = worker
+
+    def on_job_started(self, job):
+        self.worker.log_buffer.write(f"[{job.number}] Ejecutando: {' '.join(job.cmd)}\n")
+        self.worker.emit_status()
+
+    def on_job_info(self, job):
+        details = [job.title or job.url]
+        if job.size_estimate:
+            details.append(f"{job.size_estimate / 1e6:.1f} MB")
+        if job.duration:
+            details.append(format_eta(job.duration))
+        self.worker.log_buffer.write(f"📋 [{job.number}] {' · '.join(details)}")
+
+    def on_job_log(self, job, line):
+        self.worker.log_buffer.write(f"[{job.number}] {line}", key=job.number)
+
+    def on_job_progress(self, job):
+        # Línea de progreso legible; el búfer colapsa las sucesivas del mismo trabajo
+        self.worker.log_buffer.write(progress_line(job), key=job.number)
+
+    def on_job_retry(self, job):
+        self.worker.log_buffer.write(f"[{job.number}] {job.log[-1]}", key=job.number)
+        self.worker.emit_status()
+
+    def on_job_finished(self, job):
+        if job.state == COMPLETADO:
+            self.worker.log_buffer.write(f"✓ Video {job.number} descargado exitosamente\n", key=job.number)
+        elif job.state == EXPANDIDO:
+            self.worker.log_buffer.write(f"[{job.number}] {job.expansion.describe()}", key=job.number)
+        elif job.state == OMITIDO:
+            where = (job.archived or {}).get('ruta') or job.url
+            self.worker.log_buffer.write(f"⏭️ Video {job.number} ya descargado: {where}", key=job.number)
+        elif job.error and "yt-dlp no encontrado" in job.error:
+            self.worker.error.emit(job.error)
+            self.worker.stop()
+        else:
+            self.worker.error.emit(f"Error en descarga del video {job.number}: {job.error}")
+        self.worker.emit_status()
+
+    def on_stats(self, stats):
+        # Las estadísticas agregadas quedan en el log en disco, no en la terminal
+        self.worker.log_buffer.write_file(f"[estadísticas] {json.dumps(stats.as_dict())}")
 
 class YTDLPWorker(QThread):
-    progress = pyqtSignal(int)
-    log = pyqtSignal(str)
+    """Ejecuta el planificador en segundo plano.
+
+    El log no viaja por señales: se escribe en log_buffer y la ventana lo vacía
+    por lotes, igual que consulta el progreso global con un temporizador.
+    """
     error = pyqtSignal(str)
     finished = pyqtSignal()
     current_progress = pyqtSignal(str)
 
-    def __init__(self, commands):
+    def __init__(self, jobs, max_workers=3, max_per_host=2, engine=None, listeners=(), log_buffer=None,
+                 metadata_cache=None, archive=None, bandwidth_limit=None, adaptive=False, fragment_tuner=None,
+                 metrics=None, playlists=None, retry=None, policy=None, stream_merge=False):
         super().__init__()
-        self.commands = commands
-        self._is_running = True
+        # Tiempos por fase de cada trabajo, para el resumen final y la exportación
+        self.metrics = metrics or MetricsRecorder()
+        # Con una lista de URLs en flujo, el origen informa de lo leído y descartado
+        self.source = jobs if isinstance(jobs, UrlSource) else None
+        self.log_buffer = log_buffer or LogBuffer()
+        self.scheduler = JobScheduler(
+            jobs, max_workers=max_workers, max_per_host=max_per_host,
+            engine=engine, listener=WorkerListener(self), listeners=[*listeners, self.metrics],
+            metadata_cache=metadata_cache, archive=archive,
+            bandwidth_limit=bandwidth_limit, adaptive=adaptive, fragment_tuner=fragment_tuner,
+            playlists=playlists, retry=retry, policy=policy, stream_merge=stream_merge
+        )
 
     def run(self):
-        total = len(self.commands)
-        for idx, cmd in enumerate(self.commands):
-            if not self._is_running:
-                break
-            try:
-                self.current_progress.emit(f"Descargando video {idx + 1} de {total}...")
-                self.log.emit(f"Ejecutando: {' '.join(cmd)}\n")
-                
-                process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.STDOUT, 
-                    text=True,
-                    universal_newlines=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
-                )
-                
-                while True:
-                    output = process.stdout.readline()
-                    if output == '' and process.poll() is not None:
-                        break
-                    if output:
-                        self.log.emit(output.strip())
-                        # Extraer progreso de descarga de yt-dlp si está disponible
-                        if '[download]' in output and '%' in output:
-                            try:
-                                percent_match = re.search(r'(\d+\.?\d*)%', output)
-                                if percent_match:
-                                    video_progress = float(percent_match.group(1))
-                                    total_progress = ((idx * 100) + video_progress) / total
-                                    self.progress.emit(int(total_progress))
-                            except:
-                                pass
-                
-                process.wait()
-                if process.returncode != 0:
-                    self.error.emit(f"Error en descarga del video {idx + 1}: Código de salida {process.returncode}")
-                else:
-                    self.log.emit(f"✓ Video {idx + 1} descargado exitosamente\n")
-                    
-            except FileNotFoundError:
-                self.error.emit("yt-dlp no encontrado. Asegúrate de que esté instalado y en el PATH.")
-                break
-            except Exception as e:
-                self.error.emit(f"Error inesperado en video {idx + 1}: {str(e)}")
-            
-            # Actualizar progreso por video completado
-            self.progress.emit(int((idx + 1) / total * 100))
-            
+        self.scheduler.run()
+        summary = startup_summary(self.scheduler.jobs, self.scheduler.finished)
+        if summary:
+            self.log_buffer.write(f"⏱️ {summary} (motor {self.scheduler.engine.name})")
         self.finished.emit()
 
+    def emit_status(self):
+        """Resume cuántos trabajos hay en curso y cuántos han terminado"""
+        total = self.scheduler.total_jobs()
+        if self.source is not None and not self.source.exhausted:
+            total = f"{total}+"
+        running = [job.number for job in self.scheduler.running_jobs()]
+        postprocessing = [job.number for job in self.scheduler.postprocessing_jobs()]
+        counts = self.scheduler.counts()
+        done = sum(counts.get(state, 0) for state in ESTADOS_FINALES)
+        if running or postprocessing:
+            parts = []
+            if running:
+                parts.append(f"Descargando video(s) {', '.join(str(n) for n in running)}")
+            if postprocessing:
+                parts.append(f"procesando con FFmpeg {', '.join(str(n) for n in postprocessing)}")
+            self.current_progress.emit(f"{' · '.join(parts)} · {done} de {total} terminados...")
+        else:
+            self.current_progress.emit(f"{done} de {total} videos terminados")
+
+    def stop(self):
+        self.scheduler.stop()
+
+class ServiceWatcher(QThread):
+    """Conecta la ventana al servicio local: le envía las listas de URLs y trae sus eventos.
+
+    Como con el worker local, el log se escribe en log_buffer y la ventana
+    consulta self.status (la última respuesta de /estado) con su temporizador.
+    Detenerlo solo desconecta la ventana: las descargas siguen en el servicio.
+    """
+    error = pyqtSignal(str)
+
+    def __init__(self, client, log_buffer):
+        super().__init__()
+        self.client = client
+        self.log_buffer = log_buffer
+        self.status = None
+        self._submissions = queue.Queue()
+        self._is_running = True
+
+    def submit(self, lines, options):
+        """Encola un envío; las líneas se leen y se mandan por tandas desde este hilo"""
+        self._submissions.put((lines, options))
+
+    def run(self):
+        try:
+            cursor = max(0, self.client.status(jobs=0)['last_event'] - SERVICE_HISTORY_EVENTS)
+            while self._is_running:
+                while not self._submissions.empty():
+                    self.client.submit(*self._submissions.get())
+                reply = self.client.events(cursor, SERVICE_POLL_SECONDS)
+                cursor = reply['next']
+                if reply['dropped']:
+                    self.log_buffer.write(f"… {reply['dropped']} evento(s) del servicio omitidos")
+                for event in reply['events']:
+                    if 'line' in event:
+                        self.log_buffer.write(event['line'], key=event.get('job'))
+                self.status = self.client.status(JOB_TABLE_ROWS)
+        except DaemonError as e:
+            if self._is_running:
+                self.error.emit(str(e))
+
+    @staticmethod
+    def describe(status):
+        """Resume cuántos trabajos del servicio hay en curso y cuántos han terminado"""
+        done = sum(status['states'].get(state, 0) for state in ESTADOS_FINALES)
+        running = [str(job['number']) for job in status['jobs'] if job['state'] == EJECUTANDO]
+        text = f"🛰️ Servicio: {done} de {status['total']} terminados"
+        if running:
+            text += f" · descargando video(s) {', '.join(running)}"
+        return text
+
     def stop(self):
         self._is_running = False
 
+class ToolProbeWorker(QThread):
+    """Comprueba yt-dlp y FFmpeg en segundo plano (solo lanza procesos si la caché no sirve)"""
+    tool_checked = pyqtSignal(object)
+
+    def run(self):
+        for name in ('yt-dlp', 'ffmpeg'):
+            self.tool_checked.emit(probe_tool(name))
+
+class ServiceProbeWorker(QThread):
+    """Busca el servicio local en segundo plano: uno colgado tardaría hasta REQUEST_TIMEOUT en no responder"""
+    service_probed = pyqtSignal(object)
+
+    def run(self):
+        self.service_probed.emit(DaemonClient.connect())
+
 class MainWindow(QWidget):
-    def __init__(self):
+    def __init__(self, measure_startup=False):
         super().__init__()
         self.setWindowTitle("Descargador de videos con yt-dlp")
         self.setGeometry(100, 100, 900, 700)
         self.worker = None
-        self.check_ytdlp()
-        self.check_ffmpeg()
+        # Conexión con el servicio local (ServiceWatcher), si la ventana la usa
+        self.service = None
+        # Los motores se conservan entre lotes para reutilizar su estado en caliente
+        self.engines = {}
+        self.journal = None
+        self.archive = None
+        self.fragment_tuner = None
+        self.metadata_cache = None
+        self.log_buffer = LogBuffer()
+        self.log_timer = QTimer(self)
+        self.log_timer.setInterval(LOG_DRAIN_INTERVAL_MS)
+        self.log_timer.timeout.connect(self.drain_log)
+        # Clave del trabajo cuya línea de progreso es el último bloque de la terminal
+        self._last_progress_key = None
+        self.measure_startup = measure_startup
+        self.probe_worker = None
+        self.service_probe = None
+        # Solo datos en caché o rutas encontradas sin lanzar procesos; las
+        # versiones se comprueban en segundo plano cuando la ventana ya es visible
+        self.set_tool_info(lookup_tool('yt-dlp'))
+        self.set_tool_info(lookup_tool('ffmpeg'))
+        self.warm_start = self.ytdlp_available is not None and self.ffmpeg_available is not None
         self.init_ui()
+        QTimer.singleShot(0, self.on_window_shown)
 
-    def check_ytdlp(self):
-        """Verificar si yt-dlp está disponible"""
-        try:
-            ytdlp_path = get_ytdlp_path()
-            result = subprocess.run([ytdlp_path, '--version'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                self.ytdlp_available = True
-                self.ytdlp_version = result.stdout.strip()
-                self.ytdlp_path = ytdlp_path
-            else:
-                self.ytdlp_available = False
-                self.ytdlp_path = 'yt-dlp'
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            self.ytdlp_available = False
-            self.ytdlp_path = 'yt-dlp'
-
-    def check_ffmpeg(self):
-        """Verificar si ffmpeg está disponible"""
-        try:
-            ffmpeg_path = get_ffmpeg_path()
-            result = subprocess.run([ffmpeg_path, '-version'], capture_output=True, text=True, timeout=10)
-            if result.returncode == 0:
-                self.ffmpeg_available = True
-                self.ffmpeg_path = ffmpeg_path
-                # Extraer versión de ffmpeg
-                lines = result.stdout.split('\n')
-                if lines:
-                    version_line = lines[0]
-                    if 'ffmpeg version' in version_line:
-                        self.ffmpeg_version = version_line.split('ffmpeg version')[1].split()[0]
-                    else:
-                        self.ffmpeg_version = "Desconocida"
-                else:
-                    self.ffmpeg_version = "Desconocida"
-            else:
-                self.ffmpeg_available = False
-                self.ffmpeg_path = 'ffmpeg'
-                self.ffmpeg_version = None
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            self.ffmpeg_available = False
-            self.ffmpeg_path = 'ffmpeg'
-            self.ffmpeg_version = None
+    def set_tool_info(self, info):
+        """Guarda ruta, disponibilidad y versión de una herramienta (tools.ToolInfo)"""
+        if info.name == 'yt-dlp':
+            self.ytdlp_path = info.path
+            self.ytdlp_available = info.available
+            self.ytdlp_version = info.version
+        else:
+            self.ffmpeg_path = info.path
+            self.ffmpeg_available = info.available
+            self.ffmpeg_version = info.version
 
-    def init_ui(self):
-        layout = QVBoxLayout()
+    def on_tool_checked(self, info):
+        self.set_tool_info(info)
+        self.update_tool_labels()
 
+    def update_tool_labels(self):
+        """Refleja en la cabecera el estado de yt-dlp y FFmpeg"""
+        ok_style = "color: green; font-weight: bold; padding: 5px;"
+        pending_style = "color: gray; font-weight: bold; padding: 5px;"
         # Información de yt-dlp
-        if not self.ytdlp_available:
-            warning_label = QLabel("⚠️ yt-dlp no está disponible. Instálalo con: pip install yt-dlp")
-            warning_label.setStyleSheet("color: red; font-weight: bold; padding: 10px; background-color: #ffe6e6; border: 1px solid red;")
-            layout.addWidget(warning_label)
+        if self.ytdlp_available is None:
+            self.ytdlp_label.setText("⏳ Comprobando yt-dlp...")
+            self.ytdlp_label.setStyleSheet(pending_style)
+        elif not self.ytdlp_available:
+            self.ytdlp_label.setText("⚠️ yt-dlp no está disponible. Instálalo con: pip install yt-dlp")
+            self.ytdlp_label.setStyleSheet("color: red; font-weight: bold; padding: 10px; background-color: #ffe6e6; border: 1px solid red;")
         else:
-            info_label = QLabel(f"✓ yt-dlp disponible: {self.ytdlp_version}")
-            info_label.setStyleSheet("color: green; font-weight: bold; padding: 5px;")
-            layout.addWidget(info_label)
+            self.ytdlp_label.setText(f"✓ yt-dlp disponible: {self.ytdlp_version}")
+            self.ytdlp_label.setStyleSheet(ok_style)
 
         # Información de FFmpeg
-        if not self.ffmpeg_available:
-            ffmpeg_warning = QLabel("⚠️ FFmpeg no está disponible. Algunas funciones pueden no funcionar correctamente.")
-            ffmpeg_warning.setStyleSheet("color: orange; font-weight: bold; padding: 10px; background-color: #fff8e1; border: 1px solid orange;")
-            layout.addWidget(ffmpeg_warning)
+        if self.ffmpeg_available is None:
+            self.ffmpeg_label.setText("⏳ Comprobando FFmpeg...")
+            self.ffmpeg_label.setStyleSheet(pending_style)
+        elif not self.ffmpeg_available:
+            self.ffmpeg_label.setText("⚠️ FFmpeg no está disponible. Algunas funciones pueden no funcionar correctamente.")
+            self.ffmpeg_label.setStyleSheet("color: orange; font-weight: bold; padding: 10px; background-color: #fff8e1; border: 1px solid orange;")
         else:
-            ffmpeg_info = QLabel(f"✓ FFmpeg disponible: {self.ffmpeg_version}")
-            ffmpeg_info.setStyleSheet("color: green; font-weight: bold; padding: 5px;")
-            layout.addWidget(ffmpeg_info)
+            self.ffmpeg_label.setText(f"✓ FFmpeg disponible: {self.ffmpeg_version}")
+            self.ffmpeg_label.setStyleSheet(ok_style)
+
+    def on_window_shown(self):
+        """Primer ciclo del bucle de eventos: medir el arranque y lanzar lo diferido"""
+        elapsed_ms = (time.perf_counter() - STARTUP_T0) * 1000
+        kind = 'caliente' if self.warm_start else 'fria'
+        previous = self.record_startup_time(kind, elapsed_ms)
+        if self.measure_startup:
+            print(json.dumps({'ventana_ms': round(elapsed_ms, 1), 'cache': kind}), flush=True)
+            QApplication.instance().quit()
+            return
+        other = 'fria' if kind == 'caliente' else 'caliente'
+        message = f"⏱️ Ventana lista en {elapsed_ms:.0f} ms (caché de herramientas {CACHE_LABELS[kind]})"
+        if other in previous:
+            message += f"; último arranque con caché {CACHE_LABELS[other]}: {previous[other]:.0f} ms"
+        self.terminal.append(message)
+
+        if self.ytdlp_available is None or self.ffmpeg_available is None:
+            self.probe_worker = ToolProbeWorker()
+            self.probe_worker.tool_checked.connect(self.on_tool_checked)
+            self.probe_worker.start()
+        # Si el servicio local está en marcha, la ventana se vuelve a conectar a él (sin bloquearla)
+        self.service_probe = ServiceProbeWorker()
+        self.service_probe.service_probed.connect(self.on_service_probed)
+        self.service_probe.start()
+
+    def on_service_probed(self, client):
+        """Conecta la ventana al servicio encontrado al arrancar o, si no hay, ofrece reanudar"""
+        if self.service is not None or (self.worker is not None and self.worker.isRunning()):
+            # Mientras se buscaba, el usuario ya conectó el servicio o empezó un lote
+            return
+        if client is not None:
+            self.service_checkbox.blockSignals(True)
+            self.service_checkbox.setChecked(True)
+            self.service_checkbox.blockSignals(False)
+            self.attach_service(client)
+            return
+        # Ofrecer reanudar lo que quedó pendiente
+        self.offer_resume()
+
+    @staticmethod
+    def record_startup_time(kind, elapsed_ms):
+        """Guarda el último tiempo de arranque en frío/caliente y devuelve los registrados"""
+        path = os.path.join(cache_dir(), STARTUP_TIMES_NAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                times = json.load(f)
+        except (OSError, ValueError):
+            times = {}
+        times[kind] = round(elapsed_ms, 1)
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(times, f)
+        except OSError:
+            pass
+        return times
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        # Información de yt-dlp y FFmpeg (se actualiza al terminar la comprobación)
+        self.ytdlp_label = QLabel()
+        layout.addWidget(self.ytdlp_label)
+        self.ffmpeg_label = QLabel()
+        layout.addWidget(self.ffmpeg_label)
+        self.update_tool_labels()
 
         # Campo de URLs
         url_group = QGroupBox("URLs para descargar")
@@ -210,6 +372,20 @@ class MainWindow(QWidget):
         self.url_input.setPlaceholderText("https://ejemplo.com/video1, https://ejemplo.com/video2:https://referer.com")
         url_layout.addWidget(url_help)
         url_layout.addWidget(self.url_input)
+        # Lista de URLs en archivo: se lee poco a poco al descargar, sin cargarla en el campo
+        self.url_file = None
+        url_file_layout = QHBoxLayout()
+        self.url_file_btn = QPushButton("📂 Cargar lista de URLs...")
+        self.url_file_btn.setToolTip("Usa un archivo de texto con una URL por línea (o separadas por comas); sirve para listas de miles de URLs")
+        self.url_file_btn.clicked.connect(self.choose_url_file)
+        self.url_file_label = QLabel("")
+        self.url_file_clear_btn = QPushButton("Quitar lista")
+        self.url_file_clear_btn.clicked.connect(lambda: self.set_url_file(None))
+        self.url_file_clear_btn.setVisible(False)
+        url_file_layout.addWidget(self.url_file_btn)
+        url_file_layout.addWidget(self.url_file_label, 1)
+        url_file_layout.addWidget(self.url_file_clear_btn)
+        url_layout.addLayout(url_file_layout)
         url_group.setLayout(url_layout)
         layout.addWidget(url_group)
 
@@ -220,13 +396,13 @@ class MainWindow(QWidget):
         # Formato
         options_layout.addWidget(QLabel("Formato:"), 0, 0)
         self.format_combo = QComboBox()
-        self.format_combo.addItems(["mp4", "webm", "mkv", "avi", "best", "worst"])
+        self.format_combo.addItems(FORMATOS)
         options_layout.addWidget(self.format_combo, 0, 1)
 
         # Calidad
         options_layout.addWidget(QLabel("Calidad:"), 0, 2)
         self.quality_combo = QComboBox()
-        self.quality_combo.addItems(["best", "worst", "720p", "480p", "360p", "bestvideo+bestaudio"])
+        self.quality_combo.addItems(CALIDADES)
         options_layout.addWidget(self.quality_combo, 0, 3)
 
         # Subtítulos
@@ -240,7 +416,7 @@ class MainWindow(QWidget):
         # Playlist option
         self.no_playlist_checkbox = QCheckBox("Solo video individual (no playlist)")
         self.no_playlist_checkbox.setChecked(True)  # Marcado por defecto
-        self.no_playlist_checkbox.setToolTip("Si está marcado, solo descarga el video individual aunque sea parte de una playlist")
+        self.no_playlist_checkbox.setToolTip("Si está marcado, solo descarga el video individual aunque sea parte de una playlist. Si no, cada playlist se expande en una descarga por video")
         options_layout.addWidget(self.no_playlist_checkbox, 2, 0)
 
         # Carpeta de descarga
@@ -249,6 +425,112 @@ class MainWindow(QWidget):
         self.output_dir.setText("./downloads")
         options_layout.addWidget(self.output_dir, 2, 2, 1, 2)  # Span 2 columns
 
+        # Descargas simultáneas (total y por host)
+        options_layout.addWidget(QLabel("Descargas simultáneas:"), 3, 0)
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 16)
+        self.workers_spin.setValue(3)
+        self.workers_spin.setToolTip("Número máximo de videos que se descargan a la vez")
+        options_layout.addWidget(self.workers_spin, 3, 1)
+
+        options_layout.addWidget(QLabel("Máximo por host:"), 3, 2)
+        self.per_host_spin = QSpinBox()
+        self.per_host_spin.setRange(1, 16)
+        self.per_host_spin.setValue(2)
+        self.per_host_spin.setToolTip("Número máximo de descargas simultáneas contra un mismo sitio")
+        options_layout.addWidget(self.per_host_spin, 3, 3)
+
+        # Motor de descarga
+        options_layout.addWidget(QLabel("Motor:"), 4, 0)
+        self.engine_combo = QComboBox()
+        for name, engine_cls in ENGINES.items():
+            self.engine_combo.addItem(engine_cls.description, name)
+            if not engine_cls.available():
+                # Deshabilitar la opción si el módulo yt_dlp no se puede importar
+                self.engine_combo.model().item(self.engine_combo.count() - 1).setEnabled(False)
+        self.engine_combo.setToolTip("Subproceso: un proceso yt-dlp por URL. Integrado: usa la API de yt-dlp dentro de la aplicación, sin arrancar un proceso por URL")
+        options_layout.addWidget(self.engine_combo, 4, 1)
+
+        # Log completo en disco
+        self.log_file_checkbox = QCheckBox("Guardar log completo en archivo")
+        self.log_file_checkbox.setToolTip("Escribe todas las líneas de yt-dlp en un archivo .log dentro de la carpeta de descarga")
+        options_layout.addWidget(self.log_file_checkbox, 4, 2, 1, 2)
+
+        # Extracción anticipada de metadatos
+        self.prefetch_checkbox = QCheckBox("Extraer metadatos por adelantado")
+        self.prefetch_checkbox.setChecked(True)
+        self.prefetch_checkbox.setToolTip("Obtiene título y tamaño de los siguientes videos de la cola mientras se descargan los actuales, y los guarda en caché")
+        options_layout.addWidget(self.prefetch_checkbox, 5, 0, 1, 2)
+
+        # Archivo de descargas completadas
+        self.skip_archived_checkbox = QCheckBox("Omitir videos ya descargados")
+        self.skip_archived_checkbox.setChecked(True)
+        self.skip_archived_checkbox.setToolTip("Consulta el archivo de descargas de la carpeta de salida y salta, sin conectarse, los videos que ya se descargaron")
+        options_layout.addWidget(self.skip_archived_checkbox, 5, 2, 1, 2)
+
+        # Ancho de banda total y ajuste automático por host
+        options_layout.addWidget(QLabel("Ancho de banda (MB/s):"), 6, 0)
+        self.bandwidth_spin = QDoubleSpinBox()
+        self.bandwidth_spin.setRange(0, 1000)
+        self.bandwidth_spin.setDecimals(1)
+        self.bandwidth_spin.setSingleStep(0.5)
+        self.bandwidth_spin.setSpecialValueText("Sin límite")
+        self.bandwidth_spin.setToolTip("Límite total de descarga, repartido a partes iguales entre las descargas activas (0 = sin límite)")
+        options_layout.addWidget(self.bandwidth_spin, 6, 1)
+
+        self.adaptive_checkbox = QCheckBox("Frenar si el sitio limita (429/403)")
+        self.adaptive_checkbox.setToolTip("Reduce y pausa las conexiones a un sitio si responde HTTP 429/403 o si rinde menos con más conexiones, y las recupera poco a poco")
+        options_layout.addWidget(self.adaptive_checkbox, 6, 2, 1, 2)
+
+        # Fragmentos simultáneos en HLS/DASH (Vimeo embebido, etc.)
+        options_layout.addWidget(QLabel("Fragmentos simultáneos:"), 7, 0)
+        self.fragments_spin = QSpinBox()
+        self.fragments_spin.setRange(0, 16)
+        self.fragments_spin.setValue(0)
+        self.fragments_spin.setSpecialValueText("Automático")
+        self.fragments_spin.setToolTip("Fragmentos que se bajan a la vez en videos HLS/DASH. En automático se ajustan por sitio según la velocidad y los errores observados, y se recuerdan entre sesiones")
+        options_layout.addWidget(self.fragments_spin, 7, 1)
+
+        # Métricas por fase en disco
+        self.metrics_checkbox = QCheckBox("Exportar métricas (JSON lines y Prometheus)")
+        self.metrics_checkbox.setToolTip(f"Añade los tiempos y bytes por fase de cada video a {METRICS_JSONL_NAME} y mantiene {METRICS_PROM_NAME} (formato textfile de Prometheus) en la carpeta de descarga")
+        options_layout.addWidget(self.metrics_checkbox, 7, 2, 1, 2)
+
+        # Sincronización incremental de playlists y canales
+        self.sync_checkbox = QCheckBox("Sincronizar playlists (solo videos nuevos)")
+        self.sync_checkbox.setEnabled(False)
+        self.sync_checkbox.setToolTip("Revisa solo el principio de cada playlist o canal y encola los videos que no aparecían en la sincronización anterior (se recuerda en el archivo de descargas de la carpeta)")
+        self.no_playlist_checkbox.toggled.connect(lambda checked: self.sync_checkbox.setEnabled(not checked))
+        options_layout.addWidget(self.sync_checkbox, 8, 0, 1, 2)
+
+        # Reintentos ante errores temporales
+        options_layout.addWidget(QLabel("Intentos por video:"), 8, 2)
+        self.attempts_spin = QSpinBox()
+        self.attempts_spin.setRange(1, 10)
+        self.attempts_spin.setValue(DEFAULT_ATTEMPTS)
+        self.attempts_spin.setToolTip("Ante un error temporal (red, servidor) o un límite del sitio (429/403), el video vuelve al final de la cola y se reintenta tras una espera creciente. Los errores permanentes o de inicio de sesión no se reintentan")
+        options_layout.addWidget(self.attempts_spin, 8, 3)
+
+        # Servicio local: la cola sigue aunque se cierre la ventana
+        self.service_checkbox = QCheckBox("Descargar en el servicio en segundo plano (sigue al cerrar la ventana)")
+        self.service_checkbox.setToolTip("Las descargas se envían a un servicio local que conserva la cola, los motores y las cachés entre sesiones; la ventana solo se conecta a él y puede cerrarse. El servicio arranca con la carpeta y los ajustes de cola actuales y los mantiene hasta que se detiene")
+        self.service_checkbox.toggled.connect(self.toggle_service)
+        options_layout.addWidget(self.service_checkbox, 9, 0, 1, 4)
+
+        # Orden de la cola (se puede cambiar con el lote en marcha)
+        options_layout.addWidget(QLabel("Orden de la cola:"), 10, 0)
+        self.policy_combo = QComboBox()
+        for name, label in POLICY_LABELS.items():
+            self.policy_combo.addItem(label, name)
+        self.policy_combo.setToolTip("Orden de llegada: como se pegaron. Más cortos primero: según el tamaño o la duración extraídos por adelantado, para que un video muy largo no retenga a los cortos (los que llevan 30 min en cola pasan delante). Por turnos entre sitios: un sitio con muchas URLs no acapara las descargas. Los trabajos priorizados a mano van siempre delante")
+        self.policy_combo.currentIndexChanged.connect(self.change_policy)
+        options_layout.addWidget(self.policy_combo, 10, 1)
+
+        # Unir video y audio mientras se descargan (calidad best)
+        self.stream_merge_checkbox = QCheckBox("Unir video y audio mientras se descargan")
+        self.stream_merge_checkbox.setToolTip("Con calidad best, baja video y audio a la vez y FFmpeg los une según llegan: el archivo está listo al terminar la descarga, sin intermedios ni unión final. Solo para videos servidos por HTTP directo; los demás (HLS, DASH, con subtítulos o límite de ancho de banda) se bajan por separado y se unen al final. Necesita el motor de subproceso")
+        options_layout.addWidget(self.stream_merge_checkbox, 10, 2, 1, 2)
+
         options_group.setLayout(options_layout)
         layout.addWidget(options_group)
 
@@ -257,11 +539,46 @@ class MainWindow(QWidget):
         self.status_label.setStyleSheet("font-weight: bold; padding: 5px;")
         layout.addWidget(self.status_label)
 
+        # Trabajos activos con sus controles
+        jobs_group = QGroupBox("Trabajos activos")
+        jobs_layout = QVBoxLayout()
+        self.job_table = QTableWidget(0, 5)
+        self.job_table.setHorizontalHeaderLabels(["#", "Video", "Estado", "Progreso", "Velocidad"])
+        self.job_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.job_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.job_table.verticalHeader().setVisible(False)
+        self.job_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        self.job_table.setMaximumHeight(160)
+        jobs_layout.addWidget(self.job_table)
+        job_buttons = QHBoxLayout()
+        self.job_buttons = []
+        for text, tooltip, slot in (
+            ("⏸️ Pausar", "Pausa los trabajos seleccionados (el proceso queda suspendido)", self.pause_selected),
+            ("▶️ Reanudar", "Reanuda los trabajos seleccionados", self.resume_selected),
+            ("✖️ Cancelar", "Cancela los trabajos seleccionados", self.cancel_selected),
+            ("⏫ Priorizar", "Pasa los trabajos en cola seleccionados delante de todos", self.prioritize_selected),
+            ("⏬ Posponer", "Pasa los trabajos en cola seleccionados detrás de todos", self.postpone_selected),
+            ("⏸️ Pausar todo", "Pausa todo el lote", self.pause_all),
+            ("▶️ Reanudar todo", "Reanuda todo el lote", self.resume_all),
+        ):
+            button = QPushButton(text)
+            button.setToolTip(tooltip)
+            button.clicked.connect(slot)
+            button.setEnabled(False)
+            job_buttons.addWidget(button)
+            self.job_buttons.append(button)
+        jobs_layout.addLayout(job_buttons)
+        jobs_group.setLayout(jobs_layout)
+        layout.addWidget(jobs_group)
+        # Números de los trabajos de cada fila de la tabla
+        self._table_jobs = []
+
         # Terminal embebida
         terminal_group = QGroupBox("Progreso de descarga")
         terminal_layout = QVBoxLayout()
         self.terminal = QTextEdit()
         self.terminal.setReadOnly(True)
+        self.terminal.document().setMaximumBlockCount(MAX_TERMINAL_LINES)
         self.terminal.setStyleSheet("font-family: Consolas, monospace; background-color: #1e1e1e; color: #ffffff;")
         terminal_layout.addWidget(self.terminal)
         terminal_group.setLayout(terminal_layout)
@@ -272,6 +589,11 @@ class MainWindow(QWidget):
         self.progress_bar.setStyleSheet("QProgressBar::chunk { background-color: #4CAF50; }")
         layout.addWidget(self.progress_bar)
 
+        # Velocidad agregada y tiempo restante de todo el lote
+        self.stats_label = QLabel("")
+        self.stats_label.setStyleSheet("color: gray; padding: 2px;")
+        layout.addWidget(self.stats_label)
+
         # Botones
         button_layout = QHBoxLayout()
         self.download_btn = QPushButton("🔽 Iniciar Descarga")
@@ -294,13 +616,47 @@ class MainWindow(QWidget):
 
         self.setLayout(layout)
 
+    def get_engine(self):
+        """Devuelve la instancia del motor seleccionado, creándola la primera vez"""
+        name = self.engine_combo.currentData()
+        if name not in self.engines:
+            self.engines[name] = ENGINES[name]()
+        return self.engines[name]
+
+    def get_metadata_cache(self):
+        """Caché de info JSON compartida entre lotes (se abre la primera vez que se usa)"""
+        if self.metadata_cache is None:
+            self.metadata_cache = MetadataCache()
+        return self.metadata_cache
+
+    def get_fragment_tuner(self):
+        """Ajustes de fragmentos aprendidos por host (se abren la primera vez que se usan)"""
+        if self.fragment_tuner is None:
+            self.fragment_tuner = FragmentTuner()
+        return self.fragment_tuner
+
+    def choose_url_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Lista de URLs", "", "Texto (*.txt *.csv);;Todos los archivos (*)")
+        if path:
+            self.set_url_file(path)
+
+    def set_url_file(self, path):
+        """Usa un archivo como origen de URLs (None vuelve al campo de texto)"""
+        self.url_file = path
+        self.url_input.setEnabled(path is None)
+        self.url_file_clear_btn.setVisible(path is not None)
+        self.url_file_label.setText(f"Lista: {path}" if path else "")
+
     def start_download(self):
-        if not self.ytdlp_available:
+        engine_cls = ENGINES[self.engine_combo.currentData()]
+        # Una comprobación aún en curso (None) no bloquea la descarga
+        available = self.ytdlp_available if engine_cls.requires_executable else engine_cls.available()
+        if available is False:
             QMessageBox.critical(self, "Error", "yt-dlp no está disponible. Instálalo primero con: pip install yt-dlp")
             return
             
         urls_raw = self.url_input.toPlainText().strip()
-        if not urls_raw:
+        if not urls_raw and self.url_file is None:
             QMessageBox.warning(self, "Error", "Debes ingresar al menos una URL.")
             return
             
@@ -308,118 +664,355 @@ class MainWindow(QWidget):
         output_dir = self.output_dir.text().strip() or "./downloads"
         os.makedirs(output_dir, exist_ok=True)
         
-        urls = [u.strip() for u in urls_raw.replace('\n', ',').split(",") if u.strip()]
-        format_opt = self.format_combo.currentText()
-        quality_opt = self.quality_combo.currentText()
-        subs_opt = self.subs_checkbox.isChecked()
-        audio_only = self.audio_only_checkbox.isChecked()
-        no_playlist = self.no_playlist_checkbox.isChecked()
-        
-        commands = []
-        for url in urls:
-            referer = None
-            # Verificar si hay referer después de los dos puntos
-            # Solo dividir si hay ":http" que no sea parte del protocolo inicial
-            if url.count(':') > 2:  # Más de 2 dos puntos (protocolo + puerto/referer)
-                # Buscar el último ":" que no sea parte de "https://"
-                if ':http' in url[8:]:  # Buscar después de "https://"
-                    last_colon_pos = url.rfind(':http')
-                    if last_colon_pos > 8:  # Asegurar que no sea el protocolo inicial
-                        referer = url[last_colon_pos + 1:].strip()
-                        url = url[:last_colon_pos].strip()
-                        
-                        # CORRECCIÓN ESPECIAL PARA VIMEO EMBEDS
-                        if 'player.vimeo.com/video/' in url:
-                            # Para Vimeo embebido, usar la URL de Vimeo como principal
-                            # y la página del curso como referer
-                            self.terminal.append(f"🎬 Vimeo embed detectado: usando URL de Vimeo como principal")
-                            self.terminal.append(f"📺 URL de Vimeo: {url}")
-                            self.terminal.append(f"🌐 Referer (página del curso): {referer}")
-                            # url y referer ya están en la posición correcta
-                        elif 'vimeo.com' in url and 'vimeo.com' in referer:
-                            # Para otros casos de Vimeo, usar referer normalmente
-                            self.terminal.append(f"🎬 Vimeo URL con referer: {url}")
-                            self.terminal.append(f"🌐 Referer: {referer}")
-                            
-            elif ':' in url and not url.startswith(("http://", "https://")) and url.count(':') == 1:
-                # Caso simple sin protocolo
-                parts = url.split(":", 1)
-                url, referer = parts[0].strip(), parts[1].strip()
-            
-            cmd = [self.ytdlp_path, url]
-            
-            # Configurar FFmpeg si está disponible
-            if self.ffmpeg_available:
-                cmd += ["--ffmpeg-location", self.ffmpeg_path]
-            
-            # Formato y calidad
-            if audio_only:
-                cmd += ["-f", "bestaudio/best", "--extract-audio", "--audio-format", "mp3"]
-            else:
-                if quality_opt == "best":
-                    # Para YouTube y sitios que separan audio y video
-                    cmd += ["-f", "bestvideo+bestaudio", "--merge-output-format", format_opt]
-                else:
-                    cmd += ["-f", quality_opt]
-                    if format_opt != "best":
-                        cmd += ["--recode-video", format_opt]
-            
-            # Subtítulos
-            if subs_opt:
-                cmd += ["--write-subs", "--sub-lang", "all"]
-            
-            # Referer
-            if referer:
-                cmd += ["--referer", referer]
-            
-            # Directorio de salida
-            cmd += ["-o", f"{output_dir}/%(title)s.%(ext)s"]
-            
-            # Opciones adicionales para mejor compatibilidad
-            additional_options = [
-                "--no-warnings", 
-                "--no-check-certificates",
-                "--restrict-filenames",
-                "--windows-filenames",
-                "--fragment-retries", "5",
-                "--retries", "3",
-                "--file-access-retries", "5",
-                "--no-continue"
-            ]
-            
-            # Solo agregar --no-playlist si la opción está marcada
-            if no_playlist:
-                additional_options.append("--no-playlist")
-                
-            cmd += additional_options
-            
-            commands.append(cmd)
+        options = DownloadOptions(
+            ytdlp_path=self.ytdlp_path,
+            output_dir=output_dir,
+            format=self.format_combo.currentText(),
+            quality=self.quality_combo.currentText(),
+            subtitles=self.subs_checkbox.isChecked(),
+            audio_only=self.audio_only_checkbox.isChecked(),
+            no_playlist=self.no_playlist_checkbox.isChecked(),
+            ffmpeg_path=self.ffmpeg_path if self.ffmpeg_available else None,
+            concurrent_fragments=self.fragments_spin.value() or None,
+        )
+        # Los trabajos se generan a medida que hay hueco; duplicados y casos
+        # especiales (Vimeo) se cuentan en lugar de escribirse uno a uno
+        lines = iter_file_lines([self.url_file]) if self.url_file else iter_text_lines(urls_raw)
+        if self.service is not None:
+            self.service.submit(lines, asdict(options))
+            self.terminal.append("🛰️ Enviando las URLs al servicio local...")
+            if os.path.abspath(output_dir) != self.service.client.info['output_dir']:
+                self.terminal.append(f"⚠️ El servicio descarga en su carpeta: {self.service.client.info['output_dir']}")
+            return
+        source = UrlSource(lines, options)
         
         self.terminal.clear()
-        self.terminal.append(f"🚀 Iniciando descarga de {len(commands)} video(s)...\n")
+        self.run_jobs(source, output_dir)
+
+    def open_journal(self, output_dir):
+        """Abre el diario de trabajos de la carpeta de salida (reutilizándolo si ya está abierto)"""
+        path = os.path.abspath(output_dir)
+        if self.journal is None or os.path.dirname(self.journal.path) != path:
+            if self.journal is not None:
+                self.journal.close()
+            self.journal = JobJournal(path)
+        return self.journal
+
+    def open_archive(self, output_dir):
+        """Abre el archivo de descargas de la carpeta de salida (reutilizándolo si ya está abierto)"""
+        path = os.path.abspath(output_dir)
+        if self.archive is None or os.path.dirname(self.archive.path) != path:
+            if self.archive is not None:
+                self.archive.close()
+            self.archive = DownloadArchive(path)
+        return self.archive
+
+    def offer_resume(self):
+        """Si la carpeta de salida tiene trabajos sin terminar, ofrece reanudarlos"""
+        output_dir = self.output_dir.text().strip() or "./downloads"
+        if not JobJournal.exists(output_dir):
+            return
+        journal = self.open_journal(output_dir)
+        jobs = journal.resume_jobs(executable=self.ytdlp_path)
+        if not jobs:
+            return
+        partials = sum(len(job.partial_files) for job in jobs)
+        answer = QMessageBox.question(
+            self, "Descargas sin terminar",
+            f"Hay {len(jobs)} descarga(s) sin terminar en {output_dir} "
+            f"({partials} archivo(s) parcial(es)).\n\n¿Quieres reanudarlas ahora?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+        )
+        if answer != QMessageBox.Yes:
+            journal.discard_unfinished()
+            return
+        self.terminal.clear()
+        self.terminal.append(f"♻️ Reanudando {len(jobs)} descarga(s) desde el diario {journal.path}")
+        self.run_jobs(jobs, output_dir)
+
+    def run_jobs(self, jobs, output_dir):
+        """Lanza una lista de trabajos o un UrlSource en un worker nuevo.
+
+        Una lista (reanudación) se registra entera en el diario; los trabajos
+        de un UrlSource se registran a medida que se generan.
+        """
+        journal = self.open_journal(output_dir)
+        # El archivo siempre registra lo descargado; omitir depende de la casilla
+        archive = self.open_archive(output_dir)
+        max_workers = self.workers_spin.value()
+        max_per_host = self.per_host_spin.value()
+        bandwidth_limit = self.bandwidth_spin.value() * 1e6 or None
+        if isinstance(jobs, UrlSource):
+            what = "la lista de URLs"
+        else:
+            journal.add_jobs(jobs)
+            what = f"{len(jobs)} video(s)"
+        self.terminal.append(f"🚀 Iniciando descarga de {what} ({max_workers} simultáneas, {max_per_host} por host, "
+                             f"ancho de banda {format_rate(bandwidth_limit)})...\n")
         self.progress_bar.setValue(0)
-        self.status_label.setText(f"Descargando {len(commands)} video(s)...")
+        self.status_label.setText(f"Descargando {what}...")
+        self._last_progress_key = None
+        if self.log_file_checkbox.isChecked():
+            log_path = os.path.join(output_dir, time.strftime("video_descarga_%Y%m%d-%H%M%S.log"))
+            self.log_buffer.open_file(log_path)
+            self.terminal.append(f"📝 Log completo en: {log_path}")
         
-        self.worker = YTDLPWorker(commands)
-        self.worker.progress.connect(self.progress_bar.setValue)
-        self.worker.log.connect(self.append_terminal)
+        engine = self.get_engine()
+        sync = self.sync_checkbox.isEnabled() and self.sync_checkbox.isChecked()
+        self.worker = YTDLPWorker(
+            jobs, max_workers=max_workers, max_per_host=max_per_host,
+            engine=engine, log_buffer=self.log_buffer,
+            listeners=[self.journal] + ([] if self.skip_archived_checkbox.isChecked() else [archive]),
+            metadata_cache=self.get_metadata_cache() if self.prefetch_checkbox.isChecked() else None,
+            archive=archive if self.skip_archived_checkbox.isChecked() else None,
+            bandwidth_limit=bandwidth_limit, adaptive=self.adaptive_checkbox.isChecked(),
+            # Con un valor fijo el comando ya lleva --concurrent-fragments y no se ajusta
+            fragment_tuner=self.get_fragment_tuner(),
+            metrics=MetricsRecorder.in_directory(output_dir) if self.metrics_checkbox.isChecked() else None,
+            playlists=PlaylistExpander(engine, archive, sync=sync),
+            retry=RetryPolicy(self.attempts_spin.value()),
+            policy=POLICIES[self.policy_combo.currentData()](),
+            stream_merge=self.stream_merge_checkbox.isChecked()
+        )
         self.worker.error.connect(self.show_error)
         self.worker.finished.connect(self.download_finished)
         self.worker.current_progress.connect(self.status_label.setText)
         
         self.download_btn.setEnabled(False)
         self.stop_btn.setEnabled(True)
+        self.service_checkbox.setEnabled(False)
+        for button in self.job_buttons:
+            button.setEnabled(True)
+        self.log_timer.start()
         self.worker.start()
 
+    def toggle_service(self, checked):
+        """Conecta la ventana al servicio local (arrancándolo si hace falta) o la desconecta"""
+        if not checked:
+            self.detach_service()
+            return
+        args = service_args(
+            self.output_dir.text().strip() or "./downloads", self.workers_spin.value(), self.per_host_spin.value(),
+            self.engine_combo.currentData(), self.bandwidth_spin.value() * 1e6 or None,
+            self.adaptive_checkbox.isChecked(), self.attempts_spin.value(), self.prefetch_checkbox.isChecked(),
+            self.sync_checkbox.isEnabled() and self.sync_checkbox.isChecked(), self.policy_combo.currentData(),
+            self.stream_merge_checkbox.isChecked(),
+        )
+        try:
+            client = DaemonClient.ensure(args)
+        except DaemonError as e:
+            QMessageBox.warning(self, "Servicio en segundo plano", str(e))
+            self.service_checkbox.setChecked(False)
+            return
+        self.attach_service(client)
+
+    def attach_service(self, client):
+        self.service = ServiceWatcher(client, self.log_buffer)
+        self.service.error.connect(self.on_service_lost)
+        self.service.start()
+        self.terminal.append(f"🛰️ Conectado al servicio local {client.base_url} (carpeta {client.info['output_dir']})")
+        self.stop_btn.setEnabled(True)
+        for button in self.job_buttons:
+            button.setEnabled(True)
+        self.log_timer.start()
+
+    def detach_service(self, message="⏏️ Desconectado del servicio; sus descargas siguen en segundo plano"):
+        if self.service is None:
+            return
+        self.service.stop()
+        self.service.wait()
+        self.service = None
+        self.terminal.append(message)
+        self.log_timer.stop()
+        self.drain_log()
+        self.stop_btn.setEnabled(False)
+        for button in self.job_buttons:
+            button.setEnabled(False)
+        self.status_label.setText("Listo para descargar")
+
+    def on_service_lost(self, message):
+        self.detach_service(f"❌ Se perdió la conexión con el servicio local: {message}")
+        self.service_checkbox.blockSignals(True)
+        self.service_checkbox.setChecked(False)
+        self.service_checkbox.blockSignals(False)
+
+    def ask_keep_partial(self, message):
+        """Pregunta si conservar los archivos parciales al cancelar; None si el usuario se arrepiente"""
+        answer = QMessageBox.question(
+            self, "Cancelar descargas",
+            f"{message}\n\n¿Conservar los archivos parciales para reanudar más tarde?\n"
+            "(Sí: se conservan y se ofrecerán al volver a abrir la carpeta · No: se borran)",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes
+        )
+        if answer == QMessageBox.Cancel:
+            return None
+        return answer == QMessageBox.Yes
+
     def stop_download(self):
-        if self.worker and self.worker.isRunning():
-            self.worker.stop()
-            self.worker.terminate()
-            self.terminal.append("\n⏹️ Descarga detenida por el usuario\n")
-            self.download_finished()
+        if self.service is None and not (self.worker and self.worker.isRunning()):
+            return
+        keep_partial = self.ask_keep_partial("Se cancelarán todas las descargas en curso y en cola.")
+        if keep_partial is None:
+            return
+        # Termina los procesos de yt-dlp y FFmpeg; el worker acaba por su cuenta
+        self.control_jobs('cancel', None, keep_partial)
+        if self.service is None:
+            self.stop_btn.setEnabled(False)
+        self.terminal.append("\n⏹️ Descarga detenida por el usuario\n")
+
+    def job_control(self):
+        """Quién controla los trabajos de la tabla: el cliente del servicio o el planificador local"""
+        if self.service is not None:
+            return self.service.client
+        return self.worker.scheduler if self.worker is not None else None
+
+    def control_jobs(self, action, numbers=None, *args):
+        """Pausa, reanuda o cancela (action) los trabajos con esos números, o todo el lote sin números"""
+        control = self.job_control()
+        if control is None:
+            return
+        try:
+            if numbers is None:
+                getattr(control, f"{action}_all")(*args)
+            for number in numbers or ():
+                if self.service is not None:
+                    getattr(control, action)(number, *args)
+                else:
+                    job = control.find(number)
+                    if job is not None:
+                        getattr(control, action)(job, *args)
+        except DaemonError as e:
+            self.terminal.append(f"❌ Servicio local: {e}")
+
+    def selected_jobs(self):
+        rows = sorted({index.row() for index in self.job_table.selectionModel().selectedRows()})
+        return [self._table_jobs[row] for row in rows if row < len(self._table_jobs)]
+
+    def pause_selected(self):
+        self.control_jobs('pause', self.selected_jobs())
+
+    def resume_selected(self):
+        self.control_jobs('resume', self.selected_jobs())
+
+    def cancel_selected(self):
+        numbers = self.selected_jobs()
+        if self.job_control() is None or not numbers:
+            return
+        keep_partial = self.ask_keep_partial(f"Se cancelarán {len(numbers)} trabajo(s).")
+        if keep_partial is None:
+            return
+        self.control_jobs('cancel', numbers, keep_partial)
+
+    def prioritize_selected(self):
+        # En orden inverso: el primero seleccionado queda el primero de la cola
+        self.control_jobs('prioritize', self.selected_jobs()[::-1])
+
+    def postpone_selected(self):
+        self.control_jobs('postpone', self.selected_jobs())
 
-    def append_terminal(self, text):
-        self.terminal.append(text)
+    def change_policy(self):
+        """Aplica el orden de la cola elegido al lote en marcha o al servicio"""
+        name = self.policy_combo.currentData()
+        try:
+            if self.service is not None:
+                # El servicio lo anuncia en sus eventos
+                self.service.client.set_policy(name)
+            elif self.worker is not None and self.worker.isRunning():
+                self.worker.scheduler.set_policy(POLICIES[name]())
+                self.terminal.append(f"🔀 Orden de la cola: {POLICY_LABELS[name]}")
+        except DaemonError as e:
+            self.terminal.append(f"❌ Servicio local: {e}")
+
+    def pause_all(self):
+        self.control_jobs('pause')
+
+    def resume_all(self):
+        self.control_jobs('resume')
+
+    def job_snapshots(self):
+        """Trabajos activos para la tabla (Job.as_dict()), del servicio o del planificador local"""
+        if self.service is not None:
+            return (self.service.status or {}).get('jobs', [])
+        if self.worker is not None:
+            return [job.as_dict() for job in self.worker.scheduler.active_jobs()[:JOB_TABLE_ROWS]]
+        return []
+
+    @staticmethod
+    def job_state_text(job):
+        if job['state'] == PAUSADO:
+            return "En pausa"
+        if job['cancelling']:
+            return "Cancelando..."
+        if job['retry_in'] is not None:
+            return f"Reintento en {job['retry_in']:.0f} s"
+        if job['state'] != EJECUTANDO:
+            return f"En cola (prioridad {job['priority']})" if job.get('priority') else "En cola"
+        return "Procesando (FFmpeg)" if job['phase'] == FASE_POSPROCESO else "Descargando"
+
+    def refresh_job_table(self):
+        """Rellena la tabla con los trabajos activos, conservando la selección"""
+        selected = set(self.selected_jobs())
+        jobs = self.job_snapshots()
+        self._table_jobs = [str(job['number']) for job in jobs]
+        self.job_table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            speed = job['speed']
+            cells = (str(job['number']), job['title'] or job['url'], self.job_state_text(job),
+                     f"{job['progress']:.1f}%", f"{speed / 1e6:.2f} MB/s" if speed else "")
+            for column, text in enumerate(cells):
+                item = self.job_table.item(row, column)
+                if item is None:
+                    self.job_table.setItem(row, column, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+        selection = self.job_table.selectionModel()
+        selection.clearSelection()
+        for row, number in enumerate(self._table_jobs):
+            if number in selected:
+                selection.select(self.job_table.model().index(row, 0),
+                                 QItemSelectionModel.Select | QItemSelectionModel.Rows)
+
+    def drain_log(self):
+        """Vuelca en la terminal, de una vez, las líneas acumuladas por los workers"""
+        self.refresh_job_table()
+        if self.service is not None:
+            status = self.service.status
+            if status is not None:
+                self.progress_bar.setValue(int(status['stats']['percent']))
+                text = f"⬇️ {status['summary']}"
+                if status['host_limits']:
+                    text += f"\n🐢 Hosts frenados: {status['host_limits']}"
+                self.stats_label.setText(text)
+                self.status_label.setText(ServiceWatcher.describe(status))
+        elif self.worker is not None:
+            stats = self.worker.scheduler.stats()
+            self.progress_bar.setValue(int(stats.percent))
+            text = f"⬇️ {stats.describe()}"
+            if self.worker.source is not None:
+                text += f"\n{self.worker.source.describe()}"
+            limits = self.worker.scheduler.host_limits()
+            if limits:
+                text += f"\n🐢 Hosts frenados: {limits}"
+            self.stats_label.setText(text)
+        entries, dropped = self.log_buffer.drain()
+        if not entries and not dropped:
+            return
+        lines = []
+        if dropped:
+            lines.append(f"… {dropped} línea(s) omitidas en la terminal")
+            self._last_progress_key = None
+        if entries:
+            key, line, is_progress = entries[0]
+            if is_progress and key == self._last_progress_key:
+                # Sobrescribir la última línea de progreso del mismo trabajo
+                cursor = self.terminal.textCursor()
+                cursor.movePosition(QTextCursor.End)
+                cursor.select(QTextCursor.BlockUnderCursor)
+                cursor.removeSelectedText()
+            last_key, _, last_is_progress = entries[-1]
+            self._last_progress_key = last_key if last_is_progress else None
+        lines.extend(line for _, line, _ in entries)
+        self.terminal.append("\n".join(lines))
         # Auto-scroll al final
         scrollbar = self.terminal.verticalScrollBar()
         scrollbar.setValue(scrollbar.maximum())
@@ -432,14 +1025,45 @@ class MainWindow(QWidget):
             QMessageBox.warning(self, "Error de descarga", msg)
 
     def download_finished(self):
+        self.log_timer.stop()
+        self.drain_log()
+        self.log_buffer.close_file()
+        self._last_progress_key = None
         self.download_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        self.service_checkbox.setEnabled(True)
+        for button in self.job_buttons:
+            button.setEnabled(False)
+        self.refresh_job_table()
         self.status_label.setText("Descarga completada")
+        if self.worker is not None and self.worker.source is not None:
+            self.terminal.append(self.worker.source.describe())
+        if self.worker is not None:
+            self.worker.metrics.close()
+            for line in self.worker.metrics.summary_lines() + self.worker.scheduler.failures.lines():
+                self.terminal.append(line)
+            if self.worker.metrics.jsonl_path:
+                self.terminal.append(f"📈 Métricas en: {self.worker.metrics.jsonl_path} y {self.worker.metrics.prom_path}")
         self.terminal.append("\n✅ Todas las descargas han finalizado.\n")
         QMessageBox.information(self, "Descarga finalizada", "Todas las descargas han terminado.")
 
+    def closeEvent(self, event):
+        # Cerrar la ventana solo la desconecta: las descargas siguen en el servicio
+        if self.service is not None:
+            self.service.stop()
+            self.service.wait()
+        super().closeEvent(event)
+
 if __name__ == "__main__":
+    # --servicio: el ejecutable empaquetado arranca el servicio local en lugar de la ventana
+    if "--servicio" in sys.argv:
+        from descarga.daemon import main as service_main
+        sys.exit(service_main(sys.argv[sys.argv.index("--servicio") + 1:]))
+    # --medir-arranque: imprime el tiempo hasta la ventana visible y sale
+    # --sin-cache: olvida la caché de herramientas para medir un arranque en frío
+    if "--sin-cache" in sys.argv:
+        default_cache().clear()
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(measure_startup="--medir-arranque" in sys.argv)
     window.show()
     sys.exit(app.exec_())